@@ -1,6 +1,12 @@
 from django.contrib import admin
 
-from plugins.doaj_transporter.models import DOAJDeposit
+from plugins.doaj_transporter.models import (
+    DOAJDeposit,
+    DOAJSynchState,
+    PushJob,
+    PushJobArticle,
+    QueuedPush,
+)
 
 
 class DOAJDepositAdmin(admin.ModelAdmin):
@@ -11,8 +17,42 @@ class DOAJDepositAdmin(admin.ModelAdmin):
     ordering = ('-date_time',)
 
 
+class DOAJSynchStateAdmin(admin.ModelAdmin):
+    """Displays objects in the Django admin interface."""
+    list_display = ('id', 'journal', 'last_updated', 'date_time')
+    list_filter = ('journal',)
+
+
+class PushJobAdmin(admin.ModelAdmin):
+    """Displays objects in the Django admin interface."""
+    list_display = ('id', 'issue', 'total', 'requested_by', 'date_created')
+    list_filter = ('issue__journal',)
+    raw_id_fields = ('issue', 'requested_by')
+
+
+class PushJobArticleAdmin(admin.ModelAdmin):
+    """Displays objects in the Django admin interface."""
+    list_display = ('id', 'job', 'article', 'status')
+    list_filter = ('status', 'article__journal')
+    raw_id_fields = ('job', 'article')
+
+
+class QueuedPushAdmin(admin.ModelAdmin):
+    """Displays objects in the Django admin interface."""
+    list_display = (
+        'id', 'article', 'date_queued', 'attempts', 'next_attempt', 'failed',
+        'last_error',
+    )
+    list_filter = ('article__journal', 'failed')
+    raw_id_fields = ('article',)
+
+
 admin_list = [
     (DOAJDeposit, DOAJDepositAdmin),
+    (DOAJSynchState, DOAJSynchStateAdmin),
+    (PushJob, PushJobAdmin),
+    (PushJobArticle, PushJobArticleAdmin),
+    (QueuedPush, QueuedPushAdmin),
 ]
 
 [admin.site.register(*t) for t in admin_list]
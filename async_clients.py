@@ -0,0 +1,335 @@
+"""
+Asynchronous variants of the DOAJ clients
+
+The clients in this module share one pooled HTTP connection per event loop
+(see transport()) so thousands of requests can be in flight on a single
+thread. Concurrency is bounded by DOAJ_ASYNC_CONCURRENCY and requests are
+paced by the same per-token rate limiter used by the synchronous clients.
+
+Database bookkeeping (identifiers and deposits) is delegated to a thread via
+asgiref's sync_to_async. Requires httpx to be installed:
+    pip install httpx
+
+Usage:
+    async def push(articles):
+        doaj_articles = [
+            await AsyncDOAJArticle.afrom_article_model(a) for a in articles]
+        async with transport():
+            await asyncio.gather(*(a.upsert() for a in doaj_articles))
+"""
+import asyncio
+import threading
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.http import urlencode
+from identifiers.models import Identifier
+import requests
+from utils.logger import get_logger
+
+from plugins.doaj_transporter import clients, exceptions, models, throttling
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = get_logger(__name__)
+
+ASYNC_CONCURRENCY = 20
+ASYNC_MAX_CONNECTIONS = 20
+
+_transports = weakref.WeakKeyDictionary()
+_transports_lock = threading.Lock()
+
+
+def transport():
+    """ Lazily loads and returns the AsyncTransport for the running loop"""
+    loop = asyncio.get_running_loop()
+    try:
+        return _transports[loop]
+    except KeyError:
+        with _transports_lock:
+            if loop not in _transports:
+                _transports[loop] = AsyncTransport()
+            return _transports[loop]
+
+
+class AsyncTransport(object):
+    """ A pooled async HTTP connection with bounded concurrency"""
+    RATE_LIMIT_ATTEMPTS = clients.BaseDOAJClient.RATE_LIMIT_ATTEMPTS
+
+    def __init__(self, concurrency=None, max_connections=None, transport=None):
+        """
+        :param concurrency: Maximum number of requests in flight
+        :param max_connections: Size of the connection pool
+        :param transport: An httpx transport to send the requests through,
+            defaults to the network
+        """
+        if httpx is None:
+            raise ImproperlyConfigured(
+                "The DOAJ async clients require httpx to be installed")
+        if concurrency is None:
+            concurrency = getattr(
+                settings, "DOAJ_ASYNC_CONCURRENCY", ASYNC_CONCURRENCY)
+        if max_connections is None:
+            max_connections = getattr(
+                settings, "DOAJ_ASYNC_MAX_CONNECTIONS", ASYNC_MAX_CONNECTIONS)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            transport=transport,
+        )
+
+    async def request(self, method, url, api_token, timeout, **kwargs):
+        """ Makes a request, paced by the rate limiter of the api_token
+        :param timeout: A (connect, read) tuple of seconds
+        :return: A Response
+        """
+        connect_timeout, read_timeout = timeout
+        limiter = throttling.get_limiter(api_token)
+        async with self._semaphore:
+            for attempt in range(self.RATE_LIMIT_ATTEMPTS):
+                delay = limiter.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                logger.info("Fetching %s", url)
+                response = await self._client.request(
+                    method, url,
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                    **kwargs
+                )
+                if response.status_code != 429:
+                    break
+                retry_after = throttling.parse_retry_after(response)
+                logger.warning(
+                    "DOAJ rate limit reached, backing off for %ss",
+                    retry_after,
+                )
+                limiter.pause(retry_after)
+        return Response(response)
+
+    async def aclose(self):
+        await self._client.aclose()
+        loop = asyncio.get_running_loop()
+        if _transports.get(loop) is self:
+            del _transports[loop]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+class Response(object):
+    """ Exposes an httpx response with the interface of a requests response
+
+    So that the response handling of the synchronous clients can be reused
+    """
+    def __init__(self, response):
+        self._response = response
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __bool__(self):
+        return self.ok
+
+    @property
+    def ok(self):
+        return self._response.is_success
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(
+                "%s Error for url: %s" % (self.status_code, self.request.url),
+                response=self,
+            )
+
+
+class AsyncClientMixin(object):
+    """ Replaces the blocking verbs of BaseDOAJClient with awaitable ones"""
+
+    async def _get(self, querystring=None, **path_vars):
+        if "GET" in self.VERBS:
+            url = self._build_url(querystring, **path_vars)
+            return await self._fetch(url, "GET")
+        else:
+            raise NotImplementedError("%s does not support GET requests")
+
+    async def _put(self, querystring=None, headers=None, body=None, **path_vars):
+        if "PUT" in self.VERBS:
+            url = self._build_url(querystring, **path_vars)
+            if body is None:
+                body = self.encode()
+            return await self._fetch(
+                url, "PUT", body=body,
+                headers=self._build_headers(headers), decode=False,
+            )
+        else:
+            raise NotImplementedError("%s does not support PUT requests")
+
+    async def _post(
+        self, querystring=None, headers=None, body=None, decode=True,
+        **path_vars
+    ):
+        if "POST" in self.VERBS:
+            url = self._build_url(querystring, **path_vars)
+            if body is None:
+                body = self.encode()
+            return await self._fetch(
+                url, "POST", body=body,
+                headers=self._build_headers(headers), decode=decode,
+            )
+        else:
+            raise NotImplementedError("%s does not support POST requests")
+
+    async def _delete(
+        self, querystring=None, headers=None, body=None, **path_vars
+    ):
+        if "DELETE" in self.VERBS:
+            url = self._build_url(querystring, **path_vars)
+            if body is None:
+                body = self.encode()
+            return await self._fetch(
+                url, "DELETE", body=body,
+                headers=self._build_headers(headers), decode=False,
+            )
+        else:
+            raise NotImplementedError("%s does not support DELETE requests")
+
+    async def _fetch(self, url, method, body=None, headers=None, decode=True):
+        try:
+            response = await transport().request(
+                method, url, self.api_token,
+                timeout=self.TIMEOUT_SECS,
+                content=body,
+                headers=headers,
+            )
+        except httpx.TimeoutException:
+            raise exceptions.RequestFailed("DOAJ request timed out")
+        except httpx.HTTPError:
+            raise exceptions.RequestFailed("DOAJ unreachable at: %s" % url)
+
+        # Error handlers may update the local records
+        validate_response = sync_to_async(self._validate_response)
+        try:
+            data = clients.parse_json(response)
+        except ValueError:
+            logger.warning("Received non-JSON response from DOAJ:")
+            logger.warning(clients.loggable_body(response))
+            # Error pages from proxies (e.g: 502) are not JSON
+            await validate_response(response)
+        else:
+            if await validate_response(response) and decode:
+                self._load_data(data)
+        return response
+
+
+class AsyncDOAJArticle(AsyncClientMixin, clients.DOAJArticle):
+    """ A DOAJArticle with awaitable load, upsert and delete"""
+
+    @classmethod
+    async def afrom_article_model(cls, article):
+        return await sync_to_async(cls.from_article_model)(article)
+
+    @classmethod
+    async def from_doaj_id(cls, doaj_id, token):
+        doaj_article = cls(token)
+        doaj_article.id = doaj_id
+        await doaj_article.load()
+        return doaj_article
+
+    async def load(self):
+        querystring = urlencode({"api_key": self.api_token})
+        response = await self._get(querystring, article_id=self.id)
+        await sync_to_async(self.log_response)(response)
+
+    async def upsert(self, force_delete=True):
+        try:
+            querystring = urlencode({"api_key": self.api_token})
+            payload_hash = self.payload_hash()
+            if self.id:
+                response = await self._put(querystring, article_id=self.id)
+            else:
+                response = await self._post(querystring, article_id='')
+            doaj_id = None
+            if self.id:
+                doaj_id = await sync_to_async(self._save_doaj_id)()
+            if response:
+                await sync_to_async(self.log_response)(
+                    response, doaj_id, payload_hash)
+        except exceptions.ImmutableFieldChanged:
+            if not force_delete:
+                raise
+            await self.delete()
+            await self.upsert(force_delete=False)
+
+    async def delete(self):
+        if not self.id:
+            raise ValueError(
+                "Record has no DOAJ id, it can't be deleted: %s" % self)
+        querystring = urlencode({"api_key": self.api_token})
+        await self._delete(querystring, article_id=self.id)
+        await sync_to_async(self._log_deletion)()
+        self.id = None
+
+    def _save_doaj_id(self):
+        doaj_id, _ = Identifier.objects.get_or_create(
+            article=self.janeway_article,
+            id_type="doaj",
+            identifier=self.id,
+        )
+        return doaj_id
+
+    def _log_deletion(self):
+        models.DOAJDeposit.objects.create(
+            article=self.janeway_article,
+            identifier=self.id,
+            success=True,
+            result_text="DOAJ Record deleted",
+        )
+        Identifier.objects.filter(
+            article=self.janeway_article,
+            id_type="doaj",
+            identifier=self.id,
+        ).delete()
+
+
+class AsyncArticleSearchClient(AsyncClientMixin, clients.ArticleSearchClient):
+    """ An ArticleSearchClient with an awaitable search
+
+    search (and search_by_*) return the client once the first page has been
+    loaded, further pages are fetched while iterating with `async for`
+    """
+
+    async def search(self, search_term, prefix=None):
+        querystring, search_query = self._build_search(search_term, prefix)
+        self.next = None
+        await self._get(
+            querystring=querystring,
+            search_query=search_query,
+            search_type=self.SEARCH_TYPE,
+        )
+        return self
+
+    def __iter__(self):
+        raise TypeError(
+            "%s pages are fetched asynchronously, iterate over it with "
+            "`async for`" % self.__class__.__name__
+        )
+
+    async def __aiter__(self):
+        while True:
+            for result in self.results:
+                yield result
+            if not self.next:
+                break
+            url, self.next = self.next, None
+            await self._fetch(url, "GET")
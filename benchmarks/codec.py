@@ -0,0 +1,132 @@
+"""
+Compares the marshmallow schemas with the compiled codecs of serializers.py
+
+Decodes pages of synthetic DOAJ search results and encodes their records
+back, checking that both paths give the same results. Doesn't need django
+to be set up, run it from the Janeway src directory with:
+    python -m plugins.doaj_transporter.benchmarks.codec [--results 100]
+"""
+import argparse
+import json
+import timeit
+
+from plugins.doaj_transporter import schemas, serializers
+from plugins.doaj_transporter.data_structs import LazyArticleSearchResult
+
+
+def make_record(i):
+    return {
+        "id": "%032x" % i,
+        "created_date": "2020-01-01T10:00:00Z",
+        "last_updated": "2021-06-01T10:00:00Z",
+        "admin": {"in_doaj": True, "seal": False},
+        "bibjson": {
+            "title": "Article number %d" % i,
+            "abstract": "An abstract " * 40,
+            "year": "2020",
+            "month": "6",
+            "start_page": "1",
+            "end_page": "20",
+            "author": [
+                {
+                    "name": "Author %d" % n,
+                    "affiliation": "Birkbeck, University of London",
+                    "orcid_id": "https://orcid.org/0000-0002-1825-00%02d" % n,
+                }
+                for n in range(4)
+            ],
+            "identifier": [
+                {"type": "doi", "id": "10.1234/article.%d" % i},
+                {"type": "eissn", "id": "1234-5678"},
+            ],
+            "journal": {
+                "title": "A journal",
+                "publisher": "A publisher",
+                "country": "GB",
+                "language": ["EN"],
+                "issns": ["1234-5678"],
+                "volume": "1",
+                "number": "2",
+                "license": [{
+                    "open_access": True,
+                    "title": "CC BY",
+                    "type": "CC BY",
+                    "url": "https://creativecommons.org/licenses/by/4.0/",
+                    "version": "4.0",
+                }],
+            },
+            "keywords": ["keyword %d" % n for n in range(6)],
+            "link": [{
+                "type": "fulltext",
+                "content_type": "html",
+                "url": "https://example.org/article/%d" % i,
+            }],
+            "subject": [{"code": "H", "scheme": "LCC", "term": "Social"}],
+        },
+    }
+
+
+def make_page(results):
+    return json.dumps({
+        "total": results * 10,
+        "page": 1,
+        "pageSize": results,
+        "timestamp": "2021-06-01T10:00:00Z",
+        "query": "issn:1234-5678",
+        "next": "https://doaj.org/api/v4/search/articles/x?page=2",
+        "last": "https://doaj.org/api/v4/search/articles/x?page=10",
+        "results": [make_record(i) for i in range(results)],
+    })
+
+
+def bench(label, func, number):
+    elapsed = min(timeit.repeat(func, number=number, repeat=3))
+    print("%-40s %8.2f ms" % (label, elapsed * 1000 / number))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--results", type=int, default=100)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    page = make_page(args.results)
+    schema = schemas.ArticleSearchSchema()
+    codec = serializers.Codec(schemas.ArticleSearchSchema)
+    assert codec.loads(page) == schema.loads(page)
+
+    records = codec.loads(page)["results"]
+    article_schema = schemas.ArticleSchema()
+    article_codec = serializers.Codec(schemas.ArticleSchema)
+    for record in records:
+        assert article_codec.dumps(record) == article_schema.dumps(record)
+
+    print("Page of %d results" % args.results)
+    slow = bench("decode (marshmallow)", lambda: schema.loads(page), args.number)
+    fast = bench("decode (codec)", lambda: codec.loads(page), args.number)
+    print("%-40s %8.1fx" % ("speedup", slow / fast))
+
+    lazy_codec = serializers.Codec(schemas.LazyArticleSearchSchema)
+    result_codec = serializers.Codec(schemas.ArticleSearchResultSchema)
+
+    def lazy_ids():
+        return [
+            (result.id, result.doi)
+            for result in (
+                LazyArticleSearchResult(raw, result_codec)
+                for raw in lazy_codec.loads(page)["results"]
+            )
+        ]
+    assert lazy_ids() == [(r.id, r.doi) for r in records]
+    bench("decode ids and DOIs (lazy)", lazy_ids, args.number)
+
+    def encode(encoder):
+        return lambda: [encoder.dumps(record) for record in records]
+    slow = bench("encode (marshmallow)", encode(article_schema), args.number)
+    fast = bench("encode (codec)", encode(article_codec), args.number)
+    print("%-40s %8.1fx" % ("speedup", slow / fast))
+
+
+if __name__ == "__main__":
+    main()
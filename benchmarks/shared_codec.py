@@ -0,0 +1,59 @@
+"""
+Measures the cost of building a codec per client against sharing one
+
+Clients used to build their own schema, so every article encoded paid for
+the nested ArticleSchema tree. Run it from the Janeway src directory with:
+    python -m plugins.doaj_transporter.benchmarks.shared_codec [--encodes N]
+"""
+import argparse
+import json
+import time
+
+from plugins.doaj_transporter import schemas, serializers
+from plugins.doaj_transporter.benchmarks.codec import make_page
+
+
+def bench(label, encode, records):
+    start = time.perf_counter()
+    for record in records:
+        encode(record)
+    elapsed = time.perf_counter() - start
+    print("%-40s %8.1f ms" % (label, elapsed * 1000))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--encodes", type=int, default=10000)
+    args = parser.parse_args()
+
+    page = json.loads(make_page(100))
+    codec = serializers.get_codec(schemas.ArticleSearchSchema)
+    results = codec.load(page)["results"]
+    records = [results[i % len(results)] for i in range(args.encodes)]
+
+    print("%d article encodes" % args.encodes)
+    bench(
+        "new ArticleSchema per encode",
+        lambda record: schemas.ArticleSchema().dumps(record),
+        records,
+    )
+    bench(
+        "new Codec per encode",
+        lambda record: serializers.Codec(schemas.ArticleSchema).dumps(record),
+        records,
+    )
+    bench(
+        "shared marshmallow schema",
+        serializers.get_codec(schemas.ArticleSchema, fast=False).dumps,
+        records,
+    )
+    bench(
+        "shared codec",
+        serializers.get_codec(schemas.ArticleSchema).dumps,
+        records,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Measures building, comparing and hashing the structs of data_structs.py
+
+Compares the compiled structs against the previous BaseStruct, which set
+the slots and compared them in loops. Doesn't need django to be set up, run
+it from the Janeway src directory with:
+    python -m plugins.doaj_transporter.benchmarks.structs [--structs N]
+"""
+import argparse
+import time
+
+from plugins.doaj_transporter.data_structs import (
+    AuthorStruct,
+    IdentifierStruct,
+)
+
+
+class LegacyStruct():
+    __slots__ = []
+
+    def __init__(self, *args, **kwargs):
+        if args:
+            for value, slot in zip(args, self.__slots__):
+                setattr(self, slot, value)
+        if kwargs:
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+
+    def __eq__(self, other):
+        return all(
+            getattr(self, field, None) == getattr(other, field, None)
+            for field in self.__slots__
+        )
+
+    def to_tuple(self):
+        return tuple(getattr(self, slot, None) for slot in self.__slots__)
+
+
+class LegacyAuthorStruct(LegacyStruct):
+    __slots__ = AuthorStruct.__slots__
+
+
+class LegacyIdentifierStruct(LegacyStruct):
+    __slots__ = IdentifierStruct.__slots__
+
+
+def bench(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    print("%-40s %8.1f ms" % (label, elapsed * 1000))
+    return result, elapsed
+
+
+def make_values(n):
+    """ Returns the keyword arguments of n/2 authors and n/2 identifiers"""
+    values = []
+    for i in range(n // 2):
+        values.append(("author", dict(
+            name="Author %d" % (i % 1000),
+            affiliation="Birkbeck, University of London",
+            orcid_id="https://orcid.org/0000-0002-1825-%04d" % (i % 1000),
+        )))
+        values.append(("identifier", dict(
+            type="doi", id="10.1234/%d" % (i % 1000))))
+    return values
+
+
+def build(author_cls, identifier_cls, values):
+    classes = {"author": author_cls, "identifier": identifier_cls}
+    return [classes[kind](**kwargs) for kind, kwargs in values]
+
+
+def compare(structs):
+    return sum(1 for a, b in zip(structs, structs[2:]) if a == b)
+
+
+def dedup_by_tuple(structs):
+    return len({struct.to_tuple() for struct in structs})
+
+
+def dedup(structs):
+    return len(set(structs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--structs", type=int, default=1000000)
+    args = parser.parse_args()
+
+    values = make_values(args.structs)
+    print("%d AuthorStruct and IdentifierStruct" % args.structs)
+    legacy, legacy_build = bench(
+        "build (legacy)",
+        build, LegacyAuthorStruct, LegacyIdentifierStruct, values,
+    )
+    structs, fast_build = bench(
+        "build (compiled)", build, AuthorStruct, IdentifierStruct, values)
+    print("%-40s %8.1fx" % ("speedup", legacy_build / fast_build))
+
+    legacy_equal, legacy_compare = bench("compare (legacy)", compare, legacy)
+    equal, fast_compare = bench("compare (compiled)", compare, structs)
+    assert equal == legacy_equal
+    print("%-40s %8.1fx" % ("speedup", legacy_compare / fast_compare))
+
+    legacy_unique, legacy_dedup = bench(
+        "dedup by to_tuple (legacy)", dedup_by_tuple, legacy)
+    unique, fast_dedup = bench(
+        "dedup by hash (compiled)", dedup, structs)
+    assert unique == legacy_unique
+    print("%-40s %8.1fx" % ("speedup", legacy_dedup / fast_dedup))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
-from json import JSONDecodeError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+from functools import partial
+import hashlib
+from itertools import islice
+import json
 import threading
-import time
 import traceback as tb
+from urllib.parse import quote
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
@@ -12,7 +18,6 @@ import requests
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 from utils.logger import get_logger
-from utils.setting_handler import get_setting
 
 from plugins.doaj_transporter.data_structs import (
     AdminStruct,
@@ -20,21 +25,76 @@ from plugins.doaj_transporter.data_structs import (
     BibjsonStruct,
     IdentifierStruct,
     JournalStruct,
+    LazyArticleSearchResult,
     LicenseStruct,
     LinkStruct,
 )
 from plugins.doaj_transporter import exceptions
 from plugins.doaj_transporter import schemas
+from plugins.doaj_transporter import serializers
 from plugins.doaj_transporter import models
+from plugins.doaj_transporter import settings_cache
+from plugins.doaj_transporter import throttling
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 logger = get_logger(__name__)
 _local = threading.local()
 
 RETRY_ATTEMPTS = 5
 RETRY_BACKOFF_FACTOR = 0.2
-RETRY_ON_STATUS = [502, 503, 504, 429],
+# 429 is not retried here, it is handled by the rate limiter shared by all
+# the threads using the same API token (see BaseDOAJClient._fetch)
+RETRY_ON_STATUS = (502, 503, 504)
 RETRY_METHODS = {'DELETE', 'GET', 'HEAD', 'PUT', 'POST'}
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 10
+LOG_BODY_MAX_LENGTH = 1000
+
+_adapter = None
+_adapter_lock = threading.Lock()
+
+
+def http_adapter():
+    """ Lazily loads and returns the HTTPAdapter shared by all threads
+
+    The connection pools of the adapter are thread-safe, so sharing it across
+    the sessions of every thread keeps TLS connections warm between workers.
+    Pooling and retries can be tuned with the following django settings:
+        DOAJ_POOL_CONNECTIONS, DOAJ_POOL_MAXSIZE, DOAJ_RETRY_ATTEMPTS and
+        DOAJ_RETRY_BACKOFF_FACTOR
+    """
+    global _adapter
+    if _adapter is None:
+        with _adapter_lock:
+            if _adapter is None:
+                _adapter = HTTPAdapter(
+                    pool_connections=getattr(
+                        settings, "DOAJ_POOL_CONNECTIONS", POOL_CONNECTIONS),
+                    pool_maxsize=getattr(
+                        settings, "DOAJ_POOL_MAXSIZE", POOL_MAXSIZE),
+                    max_retries=_build_retry(),
+                )
+    return _adapter
+
+
+def _build_retry():
+    retry_kwargs = dict(
+        total=getattr(settings, "DOAJ_RETRY_ATTEMPTS", RETRY_ATTEMPTS),
+        backoff_factor=getattr(
+            settings, "DOAJ_RETRY_BACKOFF_FACTOR", RETRY_BACKOFF_FACTOR),
+        status_forcelist=RETRY_ON_STATUS,
+        # Let error_handler deal with the last response
+        raise_on_status=False,
+    )
+    try:
+        return Retry(allowed_methods=RETRY_METHODS, **retry_kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=RETRY_METHODS, **retry_kwargs)
 
 
 def session():
@@ -43,17 +103,74 @@ def session():
         return _local.session
     except AttributeError:
         _session = requests.session()
-        retry = Retry(
-            total=RETRY_ATTEMPTS,
-            backoff_factor=RETRY_BACKOFF_FACTOR,
-            status_forcelist=RETRY_ON_STATUS,
-            method_whitelist=RETRY_METHODS,
-        )
-        _session.mount('http://', HTTPAdapter(max_retries=retry))
+        adapter = http_adapter()
+        _session.mount('https://', adapter)
+        _session.mount('http://', adapter)
         _local.session = _session
         return session()
 
 
+def reset_sessions():
+    """ Drops the sessions and connections inherited from a parent process"""
+    global _adapter, _adapter_lock, _local
+    _adapter = None
+    _adapter_lock = threading.Lock()
+    _local = threading.local()
+
+
+def stream_responses():
+    """ Returns True if large response bodies can be parsed as they stream
+    Requires ijson to be installed, and can be disabled with the
+    DOAJ_STREAM_RESPONSES django setting
+    """
+    return ijson is not None and getattr(
+        settings, "DOAJ_STREAM_RESPONSES", True)
+
+
+def parse_json(response):
+    """ Returns the decoded JSON body of a response
+    The body is parsed only once, following calls return the same objects.
+    Successful streamed responses are parsed from the socket by ijson, so
+    the body is never held in memory as bytes or text
+    :param response: A requests.Response
+    :raise ValueError: If the body is not valid JSON
+    """
+    try:
+        return response.__dict__["_doaj_json"]
+    except KeyError:
+        pass
+    if getattr(response, "_content", None) is False and response.ok:
+        # Streamed and not read yet
+        response.raw.decode_content = True
+        # The body can't be read again once parsed
+        response._content_consumed = True
+        try:
+            data, = ijson.items(response.raw, "", use_float=True)
+        except ijson.JSONError as e:
+            response.close()
+            raise ValueError("Invalid JSON body: %s" % e)
+    else:
+        data = response.json()
+    response._doaj_json = data
+    return data
+
+
+def loggable_body(response, max_length=None):
+    """ Returns the body of a response for logging, truncated to max_length
+    :param max_length: Defaults to the DOAJ_LOG_BODY_MAX_LENGTH setting
+    """
+    if max_length is None:
+        max_length = getattr(
+            settings, "DOAJ_LOG_BODY_MAX_LENGTH", LOG_BODY_MAX_LENGTH)
+    try:
+        text = response.text
+    except RuntimeError:
+        return "<streamed body>"
+    if len(text) > max_length:
+        return "%s... (%d characters)" % (text[:max_length], len(text))
+    return text or '""'
+
+
 JOURNAL_SLOTS = (
         # Admin
         "application_status", "contact", "current_journal", "owner",
@@ -77,12 +194,29 @@ class BaseDOAJClient(object):
     VERBS = set()
     TIMEOUT_SECS = (5, 10)
     TIMEOUT_ATTEMPTS = 3
+    RATE_LIMIT_ATTEMPTS = 3
+    # Parse the response bodies as they are received (see stream_responses)
+    STREAM_RESPONSES = False
 
     def __init__(self, api_token, codec=None, *args, **kwargs):
         self.api_token = api_token
-        self._codec = codec or self.SCHEMA()
+        self._codec = codec or self.get_codec()
         super().__init__(*args, **kwargs)
 
+    @classmethod
+    def get_codec(cls, schema=None):
+        """ Returns the codec encoding and decoding the records of the client
+        Codecs are shared by all the clients of the same schema and API
+        version. The compiled codecs of serializers.py are used unless the
+        DOAJ_FAST_CODEC setting is False
+        :param schema: The schema to get a codec for, defaults to SCHEMA
+        """
+        return serializers.get_codec(
+            schema or cls.SCHEMA,
+            cls.API_VERSION,
+            fast=getattr(settings, "DOAJ_FAST_CODEC", True),
+        )
+
     def __iter__(self):
         for field in self.__slots__:
             yield getattr(self, field, None)
@@ -110,61 +244,92 @@ class BaseDOAJClient(object):
         else:
             raise NotImplementedError("%s does not support GET requests")
 
-    def _put(self, querystring=None, headers=None, **path_vars):
+    def _put(self, querystring=None, headers=None, body=None, **path_vars):
         if "PUT" in self.VERBS:
             url = self._build_url(querystring, **path_vars)
-            if headers is None:
-                headers = {}
-            headers = {'Content-type': 'application/json'}.update(headers)
+            if body is None:
+                body = self.encode()
             return self._fetch(url, session().put,
-                body=self.encode(), headers=headers, decode=False)
+                body=body, headers=self._build_headers(headers),
+                decode=False,
+            )
         else:
             raise NotImplementedError("%s does not support PUT requests")
 
 
-    def _post(self, querystring=None, headers=None, **path_vars):
+    def _post(
+        self, querystring=None, headers=None, body=None, decode=True,
+        **path_vars
+    ):
         if "POST" in self.VERBS:
             url = self._build_url(querystring, **path_vars)
-            if headers is None:
-                headers = {}
-            headers = {'Content-type': 'application/json'}.update(headers)
+            if body is None:
+                body = self.encode()
             return self._fetch(
-                url, session().post, body=self.encode(), headers=headers)
+                url, session().post, body=body,
+                headers=self._build_headers(headers), decode=decode,
+            )
         else:
             raise NotImplementedError("%s does not support POST requests")
 
-    def _delete(self, querystring=None, headers=None, **path_vars):
+    def _delete(self, querystring=None, headers=None, body=None, **path_vars):
         if "DELETE" in self.VERBS:
             url = self._build_url(querystring, **path_vars)
-            if headers is None:
-                headers = {}
-            headers = {'Content-type': 'application/json'}.update(headers)
+            if body is None:
+                body = self.encode()
             return self._fetch(
-                url, session().delete, body=self.encode(),
-                headers=headers, decode=False,
+                url, session().delete, body=body,
+                headers=self._build_headers(headers), decode=False,
             )
         else:
             raise NotImplementedError("%s does not support DELETE requests")
 
+    @staticmethod
+    def _build_headers(headers=None):
+        built = {'Content-type': 'application/json'}
+        if headers:
+            built.update(headers)
+        return built
+
     def _fetch(self, url, method, body=None, headers=None, decode=True):
+        # Bodies are only logged when DOAJ_LOG_RESPONSE_BODIES is set
+        log_bodies = getattr(settings, "DOAJ_LOG_RESPONSE_BODIES", False)
+        stream = (
+            self.STREAM_RESPONSES and stream_responses() and not log_bodies)
         try:
-            logger.info("Fetching %s", url)
-            response = method(
-                url, data=body, headers=headers,
-                timeout=self.TIMEOUT_SECS,
-            )
+            limiter = throttling.get_limiter(self.api_token)
+            for attempt in range(self.RATE_LIMIT_ATTEMPTS):
+                limiter.acquire()
+                logger.info("Fetching %s", url)
+                response = method(
+                    url, data=body, headers=headers,
+                    timeout=self.TIMEOUT_SECS, stream=stream,
+                )
+                if response.status_code != 429:
+                    break
+                retry_after = throttling.parse_retry_after(response)
+                logger.warning(
+                    "DOAJ rate limit reached, backing off for %ss",
+                    retry_after,
+                )
+                response.close()
+                limiter.pause(retry_after)
 
+            if log_bodies:
+                logger.debug(loggable_body(response))
             try:
-                logger.debug(response.json())
-            except JSONDecodeError:
+                data = parse_json(response)
+            except ValueError:
                 logger.warning("Received non-JSON response from DOAJ:")
-                logger.warning(response.text or '""')
+                logger.warning(loggable_body(response))
+                # Error pages from proxies (e.g: 502) are not JSON
+                self._validate_response(response)
             else:
                 if self._validate_response(response) and decode:
-                    self._decode(response.text)
+                    self._load_data(data)
         except requests.exceptions.Timeout:
             raise exceptions.RequestFailed(
-                "DOAJ request timed out" % attempts)
+                "DOAJ request timed out: %s" % url)
         except requests.exceptions.ConnectionError as e:
             raise exceptions.RequestFailed(
                 "DOAJ unreachable at: %s" % url)
@@ -191,8 +356,12 @@ class BaseDOAJClient(object):
         return self._codec.dumps(self)
 
     def _decode(self, encoded):
+        self._load_data(json.loads(encoded))
+
+    def _load_data(self, data):
+        """ Loads the decoded JSON body of a response into the client"""
         try:
-            decoded = self._codec.loads(encoded)
+            decoded = self._codec.load(data)
         except Exception:
             if settings.DEBUG:
                 logger.debug("Failed to decode JSON")
@@ -230,8 +399,7 @@ class BaseDOAJClient(object):
 
     @staticmethod
     def get_token_from_settings(journal=None):
-        return get_setting(
-            "plugin", "doaj_api_token", journal=journal).value
+        return settings_cache.get_api_token(journal)
 
 
 class BaseDOAJArticle(BaseDOAJClient):
@@ -252,6 +420,8 @@ class BaseDOAJArticle(BaseDOAJClient):
         # Record Metadata
         "created_date", "id", "last_updated"
     ]
+    # Database writes held back while requests run on a worker thread
+    _deferred_writes = None
 
     @property
     def admin(self):
@@ -274,19 +444,22 @@ class BaseDOAJArticle(BaseDOAJClient):
             setattr(self, field, getattr(bibjson_struct, field, None))
 
     @classmethod
-    def from_article_model(cls, article):
+    def from_article_model(cls, article, token=None):
         """Loads a DOAJ Article from a Janeway Article
         :param article: An Instance of submission.models.Article
+        :param token: The DOAJ API token, read from the settings of the
+            article's journal when not provided
         :return: An instance of this class
         """
-        token = cls.get_token_from_settings(article.journal)
+        if token is None:
+            token = cls.get_token_from_settings(article.journal)
         doaj_article = cls(token)
         doaj_article.abstract = strip_tags(article.abstract)
         doaj_article.title = strip_tags(article.title)
         doaj_article.year = int(article.date_published.year)
         doaj_article.month = int(article.date_published.month)
         doaj_article.author = [
-            cls.transform_author(a) for a in article.frozen_authors()
+            cls.transform_author(a) for a in cls._get_frozen_authors(article)
         ]
         doaj_article.journal = cls.transform_journal(article)
         doaj_article.keywords = [
@@ -295,12 +468,74 @@ class BaseDOAJArticle(BaseDOAJClient):
         ]
         doaj_article.link = cls.transform_urls(article)
         doaj_article.identifier = cls.transform_identifiers(article)
-        doaj_article.id = article.get_identifier("doaj")
+        doaj_article.id = cls._get_identifier(article, "doaj")
         doaj_article.janeway_article = article
 
 
         return doaj_article
 
+    @classmethod
+    def from_article_queryset(cls, articles, errors=None):
+        """Loads DOAJ Articles from a queryset of Janeway Articles
+        The related objects of all the articles are loaded in bulk and the
+        API token is read once per journal.
+        :param articles: A queryset of submission.models.Article
+        :param errors: An optional dict in which to collect the errors raised
+            while loading each article (keyed by pk) instead of raising them
+        :return: A generator of instances of this class
+        """
+        tokens = {}
+        for article in cls.prefetch_related_objects(articles):
+            try:
+                if article.journal_id not in tokens:
+                    tokens[article.journal_id] = cls.get_token_from_settings(
+                        article.journal)
+                yield cls.from_article_model(
+                    article, token=tokens[article.journal_id])
+            except Exception as e:
+                if errors is None:
+                    raise
+                logger.error("Error loading article %s: %s", article.pk, e)
+                errors[article.pk] = e
+
+    @staticmethod
+    def prefetch_related_objects(articles):
+        """ Adds the related objects read by from_article_model to a queryset
+        :param articles: A queryset of submission.models.Article
+        :return: A queryset of submission.models.Article
+        """
+        return articles.select_related(
+            "journal",
+            "license",
+            "primary_issue",
+        ).prefetch_related(
+            "frozenauthor_set",
+            "identifier_set",
+            "keywords",
+        )
+
+    @staticmethod
+    def _get_frozen_authors(article):
+        if "frozenauthor_set" in getattr(
+            article, "_prefetched_objects_cache", {},
+        ):
+            return article.frozenauthor_set.all()
+        return article.frozen_authors()
+
+    @staticmethod
+    def _get_identifier(article, id_type):
+        """ Reads an identifier of the article, from the prefetched ones if
+        the article was loaded via prefetch_related_objects
+        """
+        if "identifier_set" in getattr(
+            article, "_prefetched_objects_cache", {},
+        ):
+            for identifier in article.identifier_set.all():
+                if identifier.id_type == id_type:
+                    return identifier.identifier
+            return None
+        return article.get_identifier(id_type)
+
     @classmethod
     def from_doaj_id(cls, doaj_id, token):
         """Loads a remote DOAJ Article from the given  doaj_id
@@ -317,32 +552,68 @@ class BaseDOAJArticle(BaseDOAJClient):
         response = self._get(querystring, article_id=self.id)
         self.log_response(response)
 
+    def defer_writes(self):
+        """ Holds back the database writes of the following requests
+        So that requests can run on a worker thread (see PushExecutor) while
+        the calling thread applies their writes with apply_writes
+        """
+        self._deferred_writes = []
+
+    def apply_writes(self):
+        """ Applies the database writes held back since defer_writes"""
+        writes, self._deferred_writes = self._deferred_writes or [], None
+        for write in writes:
+            write()
+
+    def _write(self, func, **kwargs):
+        """ Runs a database write, unless writes are deferred
+        The arguments are evaluated when the write is requested, so later
+        changes to the record (e.g: its id) don't affect deferred writes
+        """
+        if self._deferred_writes is None:
+            return func(**kwargs)
+        self._deferred_writes.append(partial(func, **kwargs))
+
+    def payload_hash(self, encoded=None):
+        """ Returns a stable hash of the encoded record
+        Used to detect whether a record has changed since it was last pushed
+        :param encoded: The JSON encoded record, encoded when not provided
+        """
+        if encoded is None:
+            encoded = self.encode()
+        canonical = json.dumps(
+            json.loads(encoded), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def encode_payload(self):
+        """ Encodes the record once for both pushing and hashing it
+        :return: A tuple of the JSON encoded record and its payload hash
+        """
+        encoded = self.encode()
+        return encoded, self.payload_hash(encoded)
+
     def upsert(self, force_delete=True):
         try:
             querystring = urlencode({"api_key": self.api_token})
-            doaj_id = None
+            payload_hash = self.payload_hash()
             if self.id:
                 response = self._put(querystring, article_id=self.id)
-                doaj_id, _ = Identifier.objects.get_or_create(
+            else:
+                response = self._post(querystring, article_id='')
+            if self.id:
+                self._write(
+                    Identifier.objects.get_or_create,
                     article=self.janeway_article,
                     id_type="doaj",
                     identifier=self.id,
                 )
-            else:
-                response = self._post(querystring, article_id='')
-                if self.id:
-                    doaj_id, _ = Identifier.objects.get_or_create(
-                        article=self.janeway_article,
-                        id_type="doaj",
-                        identifier=self.id,
-                    )
             if response:
-                self.log_response(response, doaj_id)
+                self.log_response(response, payload_hash=payload_hash)
         except exceptions.ImmutableFieldChanged:
-            if force_delete:
-                self.delete()
-                self.upsert()
-            raise
+            if not force_delete:
+                raise
+            self.delete()
+            self.upsert(force_delete=False)
 
     def delete(self):
         if not self.id:
@@ -350,25 +621,30 @@ class BaseDOAJArticle(BaseDOAJClient):
                 "Record has no DOAJ id, it can't be deleted: %s" % self)
         querystring = urlencode({"api_key": self.api_token})
         self._delete(querystring, article_id=self.id)
-        models.DOAJDeposit.objects.create(
+        self._write(
+            models.DOAJDeposit.objects.create,
             article=self.janeway_article,
             identifier=self.id,
             success=True,
             result_text="DOAJ Record deleted",
         )
-        doaj_id, _ = Identifier.objects.filter(
-            article=self.janeway_article,
-            id_type="doaj",
-            identifier=self.id,
-        ).delete()
+        self._write(
+            Identifier.objects.filter(
+                article=self.janeway_article,
+                id_type="doaj",
+                identifier=self.id,
+            ).delete,
+        )
         self.id = None
 
-    def log_response(self, response, doaj_id=None):
-        models.DOAJDeposit.objects.create(
+    def log_response(self, response, doaj_id=None, payload_hash=None):
+        self._write(
+            models.DOAJDeposit.objects.create,
             article=self.janeway_article,
             identifier=self.id,
             success=response.ok,
             result_text=response.text,
+            payload_hash=payload_hash if response.ok else None,
         )
 
     def error_handler(self, response):
@@ -380,11 +656,14 @@ class BaseDOAJArticle(BaseDOAJClient):
 
     def _handle_404(self, response):
         # Article no longer exists on DOAJ
-        doaj_id, _ = Identifier.objects.filter(
-            article=self.janeway_article,
-            id_type="doaj",
-        ).delete()
-        models.DOAJDeposit.objects.create(
+        self._write(
+            Identifier.objects.filter(
+                article=self.janeway_article,
+                id_type="doaj",
+            ).delete,
+        )
+        self._write(
+            models.DOAJDeposit.objects.create,
             article=self.janeway_article,
             identifier=self.id,
             success=False,
@@ -462,7 +741,7 @@ class BaseDOAJArticle(BaseDOAJClient):
             identifiers.append(
                 IdentifierStruct(
                     type="doi",
-                    id=article.get_doi(),
+                    id=BaseDOAJArticle._get_identifier(article, "doi"),
                 )
             )
         return identifiers
@@ -481,50 +760,147 @@ DOAJArticle = DOAJArticle_v4
 
 
 class BaseSearchClient(BaseDOAJClient):
+    """ Searches DOAJ records, iterating over results page by page
+
+    Pages are followed via the `next` link returned by DOAJ. Only the current
+    page is kept in memory. With prefetch enabled, the next page is fetched
+    in a background thread while the results of the current one are consumed.
+    With a concurrency above 1, the URLs of the remaining pages are computed
+    from the total of the first page and up to `concurrency` pages are
+    fetched at once, within the rate limit. Results are still yielded in
+    order.
+    """
     API_VERSION = "v4"
     OP_PATH = "/search/{search_type}/{search_query}"
     SEARCH_TYPE = ""
     SEARCH_QUERY_PREFIX = ""
     SCHEMA = schemas.SearchSchema
     VERBS= {"GET"}
-    THROTTLE_SECS = 0.250
     PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 100
+    PREFETCH = False
+    STREAM_RESPONSES = True
+    CONCURRENCY = 1
 
     __slots__ = ["results", "next", "previous", "last"]
 
+    def __init__(
+        self, api_token, codec=None, prefetch=None, page_size=None,
+        concurrency=None, *args, **kwargs
+    ):
+        super().__init__(api_token, codec, *args, **kwargs)
+        self.prefetch = self.PREFETCH if prefetch is None else prefetch
+        self.page_size = min(page_size or self.PAGE_SIZE, self.MAX_PAGE_SIZE)
+        self.concurrency = concurrency or self.CONCURRENCY
+        self.results = []
+        self.next = None
+
     def search(self, search_term, prefix=None):
+        querystring, search_query = self._build_search(search_term, prefix)
+        self._search_query = search_query
+        self._get(
+            querystring=querystring,
+            search_query=search_query,
+            search_type=self.SEARCH_TYPE,
+        )
+        return iter(self)
+
+    def _build_search(self, search_term, prefix=None):
+        """ Builds the querystring and search query for the given term
+        :return: A tuple of (querystring, search_query)
+        """
         if prefix:
             search_query = "%s:%s" % (prefix, search_term)
         elif self.SEARCH_QUERY_PREFIX:
             search_query = "%s:%s" % (self.SEARCH_QUERY_PREFIX, search_term)
         else:
             search_query = search_term
+        # The query is a segment of the URL path (e.g: DOIs hold slashes)
+        search_query = quote(search_query, safe=":")
         querystring = urlencode(
-            {"api_key": self.api_token, "pageSize":self.PAGE_SIZE})
-        self._get(
-            querystring=querystring,
-            search_query=search_query,
+            {"api_key": self.api_token, "pageSize": self.page_size})
+        return querystring, search_query
+
+    def _build_page_url(self, page):
+        querystring = urlencode({
+            "api_key": self.api_token,
+            "page": page,
+            "pageSize": self.page_size,
+        })
+        return self._build_url(
+            querystring,
+            search_query=self._search_query,
             search_type=self.SEARCH_TYPE,
         )
-        return iter(self)
+
+    def _load_data(self, data):
+        # The last page has no link to a next page
+        self.next = None
+        super()._load_data(data)
+
+    def _load_page(self, url):
+        """ Fetches and decodes a page without loading it into the client"""
+        response = self._fetch(url, session().get, decode=False)
+        return self._codec.load(parse_json(response))
+
+    def _set_page(self, page):
+        self.next = None
+        for key, value in page.items():
+            setattr(self, key, value)
 
     def _turn_page(self):
-        if hasattr(self, "next") and self.total / self.page >= self.pageSize:
-            logger.info("Thread sleeping for %ss" % self.THROTTLE_SECS)
-            time.sleep(self.THROTTLE_SECS)
+        if self.next:
             self._fetch(self.next, session().get)
             return True
         else:
             return False
 
     def __iter__(self):
-        for result in self.results:
-            yield result
-        # Chain results from next pages
-        turned = self._turn_page()
-        if turned:
-            for result in self:
-                yield result
+        if self.concurrency > 1 and self.next and hasattr(self, "total"):
+            return self._iter_parallel()
+        if self.prefetch:
+            return self._iter_prefetching()
+        return self._iter_pages()
+
+    def _iter_pages(self):
+        while True:
+            yield from self.results
+            if not self._turn_page():
+                break
+
+    def _iter_prefetching(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            while True:
+                next_page = None
+                if self.next:
+                    next_page = executor.submit(self._load_page, self.next)
+                yield from self.results
+                if next_page is None:
+                    break
+                self._set_page(next_page.result())
+        finally:
+            executor.shutdown(wait=False)
+
+    def _iter_parallel(self):
+        last_page = -(-self.total // self.pageSize)
+        pages = iter(range(self.page + 1, last_page + 1))
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            window = deque(
+                executor.submit(self._load_page, self._build_page_url(page))
+                for page in islice(pages, self.concurrency)
+            )
+            while True:
+                yield from self.results
+                if not window:
+                    break
+                self._set_page(window.popleft().result())
+                for page in islice(pages, 1):
+                    window.append(executor.submit(
+                        self._load_page, self._build_page_url(page)))
+        finally:
+            executor.shutdown(wait=False)
 
     def __repr__(self):
         try:
@@ -543,9 +919,39 @@ class ApplicationSearchClient(BaseSearchClient):
 
 
 class ArticleSearchClient(BaseSearchClient):
-    """ Can search articles by DOI"""
+    """ Can search articles by DOI
+
+    In lazy mode, results are LazyArticleSearchResult objects which decode
+    the records only when attributes other than id, doi and last_updated
+    are read.
+    """
     SEARCH_TYPE = "articles"
     SCHEMA = schemas.ArticleSearchSchema
+    LAZY_SCHEMA = schemas.LazyArticleSearchSchema
+    RESULT_SCHEMA = schemas.ArticleSearchResultSchema
+    LAZY = False
+
+    def __init__(self, *args, lazy=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy = self.LAZY if lazy is None else lazy
+        if self.lazy:
+            self._codec = self.get_codec(self.LAZY_SCHEMA)
+            self._result_codec = self.get_codec(self.RESULT_SCHEMA)
+
+    def _load_data(self, data):
+        super()._load_data(data)
+        self._wrap_results()
+
+    def _set_page(self, page):
+        super()._set_page(page)
+        self._wrap_results()
+
+    def _wrap_results(self):
+        if self.lazy:
+            self.results = [
+                LazyArticleSearchResult(result, self._result_codec)
+                for result in self.results
+            ]
 
     def one(self):
         if len(self.results) > 1:
@@ -574,8 +980,18 @@ class ArticleSearchClient(BaseSearchClient):
             prefix="publisher"
         return self.search(publisher, prefix=prefix)
 
-    def search_by_eissn(self, issn):
+    def search_by_eissn(self, issn, updated_since=None):
+        """ Searches the articles of a journal
+        :param issn: The ISSN of the journal
+        :param updated_since: Only return records updated after this datetime
+        """
         prefix="issn"
+        if updated_since:
+            issn = "%s AND last_updated:[%s TO *]" % (
+                issn,
+                updated_since.astimezone(
+                    datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            )
         return self.search(issn, prefix=prefix)
 
 
@@ -586,11 +1002,280 @@ class ApplicationClient(BaseDOAJClient):
     __slots__ = JOURNAL_SLOTS
 
 
-class ArticleBulkClient(BaseDOAJClient):
+class BaseArticleBulkClient(BaseDOAJClient):
+    """ Creates, updates or deletes many articles at once via the DOAJ bulk API
+
+    DOAJ matches each posted article against its existing records (by DOI
+    or fulltext URL) so the same request serves inserts and updates. The
+    articles are sent in chunks bounded by MAX_BATCH_SIZE records and
+    MAX_BODY_BYTES of encoded JSON. When DOAJ rejects a chunk, it is split
+    in halves until the offending articles are isolated.
+    """
     OP_PATH = "/bulk/articles"
+    SCHEMA = schemas.ArticleSchema
+    VERBS = {"POST", "DELETE"}
+    TIMEOUT_SECS = (5, 60)
+    MAX_BATCH_SIZE = 100
+    MAX_BODY_BYTES = 2 * 1024 * 1024
+    MAX_DELETE_BATCH_SIZE = 500
+    SUCCESS_STATUSES = {"created", "updated"}
+    STREAM_RESPONSES = True
 
-    def delete(self):
-        pass
+    __slots__ = ["articles", "payloads", "created", "errors"]
 
-    def update(self):
-        pass
+    def __init__(self, api_token, articles=None, payloads=None, *args, **kwargs):
+        """
+        :param articles: The DOAJ articles to push
+        :param payloads: The (encoded, payload hash) of each article, as
+            returned by encode_payload, when already encoded by the caller
+        """
+        super().__init__(api_token, *args, **kwargs)
+        self.articles = list(articles or [])
+        self.payloads = list(payloads) if payloads is not None else None
+        # Janeway article pk -> DOAJ id
+        self.created = {}
+        # Janeway article pk -> Exception
+        self.errors = {}
+
+    def encode(self):
+        return self._join(article.encode() for article in self.articles)
+
+    def update(self, workers=None):
+        """ Pushes all the articles of this client to DOAJ
+        Chunks are sent concurrently, paced by the rate limiter of the token.
+        Only the requests run on the workers, the results are saved from the
+        calling thread so that they are part of its transaction
+        :param workers: Number of concurrent requests (see PushExecutor)
+        :return: A tuple of dicts keyed by Janeway article pk holding the
+            DOAJ ids of the successful records and the errors of the failed
+            ones
+        """
+        querystring = urlencode({"api_key": self.api_token})
+        executor = throttling.PushExecutor(workers)
+        for chunk, replies, error in executor.map(
+            lambda chunk: self._push_chunk(querystring, chunk),
+            self._chunks(),
+        ):
+            if error:
+                self._log_failures(chunk, error)
+                continue
+            for sent, response, error in replies:
+                if error:
+                    self._log_failures(sent, error)
+                else:
+                    self._log_results(sent, response)
+        return self.created, self.errors
+
+    def _push_chunk(self, querystring, chunk):
+        """ Posts a chunk of articles, split in halves on bad requests
+        Doesn't touch the database, as it runs on the worker threads
+        :return: A list of (chunk, response, error) tuples, one per request
+        """
+        body = self._join(encoded for _, encoded, _ in chunk)
+        try:
+            response = self._post(querystring, body=body, decode=False)
+        except exceptions.BadRequest as e:
+            if len(chunk) > 1:
+                middle = len(chunk) // 2
+                return (
+                    self._push_chunk(querystring, chunk[:middle])
+                    + self._push_chunk(querystring, chunk[middle:])
+                )
+            return [(chunk, None, e)]
+        except (exceptions.RequestFailed, requests.HTTPError) as e:
+            return [(chunk, None, e)]
+        try:
+            # Reads the body, releasing the connection
+            parse_json(response)
+        except ValueError:
+            pass
+        return [(chunk, response, None)]
+
+    def _chunks(self):
+        """ Splits the articles in chunks of (article, encoded, hash) tuples
+        Articles are only encoded here when no payloads were given
+        """
+        payloads = self.payloads
+        if payloads is None:
+            payloads = (article.encode_payload() for article in self.articles)
+        chunk = []
+        chunk_size = 2  # Enclosing brackets
+        for article, (encoded, payload_hash) in zip(self.articles, payloads):
+            encoded_size = len(encoded.encode("utf-8")) + 1
+            if chunk and (
+                len(chunk) >= self.MAX_BATCH_SIZE
+                or chunk_size + encoded_size > self.MAX_BODY_BYTES
+            ):
+                yield chunk
+                chunk = []
+                chunk_size = 2
+            chunk.append((article, encoded, payload_hash))
+            chunk_size += encoded_size
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _join(encoded_items):
+        return "[%s]" % ",".join(encoded_items)
+
+    def _log_results(self, chunk, response):
+        try:
+            results = parse_json(response)
+        except ValueError:
+            results = []
+        if len(results) != len(chunk):
+            logger.warning(
+                "DOAJ returned %d results for %d articles",
+                len(results), len(chunk),
+            )
+
+        deposits = []
+        matched = {}
+        for i, (article, encoded, payload_hash) in enumerate(chunk):
+            janeway_article = getattr(article, "janeway_article", None)
+            result = results[i] if i < len(results) else {}
+            if (
+                result.get("status") in self.SUCCESS_STATUSES
+                and result.get("id")
+            ):
+                article.id = result["id"]
+                if janeway_article:
+                    matched[janeway_article.pk] = janeway_article
+                    self.created[janeway_article.pk] = article.id
+                success = True
+            else:
+                if janeway_article:
+                    if result.get("status"):
+                        error = exceptions.BadRequest(
+                            result.get("error") or result["status"])
+                    else:
+                        error = exceptions.MissingResult(
+                            "No result returned by DOAJ")
+                    self.errors[janeway_article.pk] = error
+                success = False
+                payload_hash = None
+            deposits.append(models.DOAJDeposit(
+                article=janeway_article,
+                identifier=article.id,
+                success=success,
+                result_text=json.dumps(result),
+                payload_hash=payload_hash,
+            ))
+        self._save_identifiers(matched)
+        models.DOAJDeposit.objects.bulk_create(deposits)
+
+    def _save_identifiers(self, janeway_articles):
+        """ Records the DOAJ ids returned for the given articles
+
+        DOAJ ids that no longer match the id of the record are replaced
+        :param janeway_articles: dict of submission.models.Article by pk
+        """
+        if not janeway_articles:
+            return
+        existing = dict(Identifier.objects.filter(
+            id_type="doaj",
+            article__in=janeway_articles.keys(),
+        ).values_list("article_id", "identifier"))
+        stale = [
+            pk for pk, doaj_id in existing.items()
+            if doaj_id != self.created[pk]
+        ]
+        if stale:
+            Identifier.objects.filter(
+                id_type="doaj",
+                article__in=stale,
+            ).delete()
+        Identifier.objects.bulk_create(
+            Identifier(
+                article=article,
+                id_type="doaj",
+                identifier=self.created[pk],
+            )
+            for pk, article in janeway_articles.items()
+            if existing.get(pk) != self.created[pk]
+        )
+
+    def _log_failures(self, chunk, error):
+        logger.error(
+            "DOAJ bulk push failed for %d articles: %s", len(chunk), error)
+        deposits = []
+        for article, _, _ in chunk:
+            janeway_article = getattr(article, "janeway_article", None)
+            if janeway_article:
+                self.errors[janeway_article.pk] = error
+            deposits.append(models.DOAJDeposit(
+                article=janeway_article,
+                identifier=article.id,
+                success=False,
+                result_text=str(error),
+            ))
+        models.DOAJDeposit.objects.bulk_create(deposits)
+
+    def delete(self, doaj_ids=None):
+        """ Deletes records from DOAJ in batches of MAX_DELETE_BATCH_SIZE ids
+
+        The local DOAJ identifiers of the deleted records are removed and the
+        deletion is logged as a DOAJDeposit for each affected article.
+        :param doaj_ids: An iterable of DOAJ ids, defaults to the ids of the
+            articles of this client
+        :return: A tuple with a list of the deleted DOAJ ids and a dict of
+            errors keyed by DOAJ id
+        """
+        if doaj_ids is None:
+            doaj_ids = (article.id for article in self.articles)
+        doaj_ids = [doaj_id for doaj_id in doaj_ids if doaj_id]
+        querystring = urlencode({"api_key": self.api_token})
+        deleted, errors = [], {}
+        for i in range(0, len(doaj_ids), self.MAX_DELETE_BATCH_SIZE):
+            self._delete_chunk(
+                querystring,
+                doaj_ids[i:i + self.MAX_DELETE_BATCH_SIZE],
+                deleted, errors,
+            )
+        return deleted, errors
+
+    def _delete_chunk(self, querystring, doaj_ids, deleted, errors):
+        try:
+            self._delete(querystring, body=json.dumps(doaj_ids))
+        except exceptions.BadRequest as e:
+            if len(doaj_ids) > 1:
+                middle = len(doaj_ids) // 2
+                self._delete_chunk(
+                    querystring, doaj_ids[:middle], deleted, errors)
+                self._delete_chunk(
+                    querystring, doaj_ids[middle:], deleted, errors)
+            else:
+                errors.update(dict.fromkeys(doaj_ids, e))
+        except (exceptions.RequestFailed, requests.HTTPError) as e:
+            logger.error(
+                "DOAJ bulk delete failed for %d records: %s",
+                len(doaj_ids), e,
+            )
+            errors.update(dict.fromkeys(doaj_ids, e))
+        else:
+            self._log_deletions(doaj_ids)
+            deleted.extend(doaj_ids)
+
+    @staticmethod
+    def _log_deletions(doaj_ids):
+        identifiers = Identifier.objects.filter(
+            id_type="doaj",
+            identifier__in=doaj_ids,
+        )
+        models.DOAJDeposit.objects.bulk_create(
+            models.DOAJDeposit(
+                article_id=article_id,
+                identifier=doaj_id,
+                success=True,
+                result_text="DOAJ Record deleted",
+            )
+            for doaj_id, article_id in identifiers.values_list(
+                "identifier", "article_id")
+        )
+        identifiers.delete()
+
+
+class ArticleBulkClient_v4(BaseArticleBulkClient):
+    API_VERSION = "v4"
+
+ArticleBulkClient = ArticleBulkClient_v4
@@ -1,14 +1,35 @@
+from datetime import datetime
+
+_UNSET = object()
+
+
 class BaseStruct():
+    """ A record of the DOAJ API held in slots
+
+    Subclasses get an __init__ and a to_tuple method compiled for their
+    slots. Arguments left out of the constructor leave their slots unset,
+    so that the codecs omit them when encoding. Unset slots read as None
+    when comparing and hashing structs, or converting them to tuples.
+    Structs are hashable by value, with the lists they hold hashed as
+    tuples. They should not be changed while they are held in a set or as a
+    dict key.
+    """
     __slots__ = []
-    def __init__(self, *args, **kwargs):
-        if args:
-            for value, slot in zip(args, self.__slots__):
-                setattr(self, slot, value)
-        if kwargs:
-            for key, value in kwargs.items():
-                setattr(self, key, value)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _compile_struct(cls)
+
+    @classmethod
+    def from_tuple(cls, values):
+        """ Builds a struct from values in slot order, as given by to_tuple
+        Every slot is set, those unset when converted to a tuple as None
+        """
+        return cls(*values)
 
     def __eq__(self, other):
+        if type(other) is type(self):
+            return self.to_tuple() == other.to_tuple()
         try:
             return all(
                 getattr(self, field, None) == getattr(other, field, None)
@@ -20,6 +41,14 @@ class BaseStruct():
                 "".format(self.__class__.__name__, other.__class__.__name__)
             )
 
+    def __hash__(self):
+        values = self.to_tuple()
+        try:
+            return hash(values)
+        except TypeError:
+            # Holds lists
+            return hash(_freeze(values))
+
     def __repr__(self):
         kwargs = []
         for slot in self.__slots__:
@@ -34,6 +63,54 @@ class BaseStruct():
         return repr(self)
 
 
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted(
+            (key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+def _compile_struct(cls):
+    """ Compiles __init__ and to_tuple for the slots of a struct class
+    The generated code handles each slot with its own statement, like:
+        def __init__(self, type=_UNSET, id=_UNSET):
+            if type is not _UNSET:
+                self.type = type
+            if id is not _UNSET:
+                self.id = id
+    """
+    slots = tuple(cls.__slots__)
+    init = "def __init__(self, %s):\n%s" % (
+        ", ".join("%s=_UNSET" % slot for slot in slots),
+        "".join(
+            "    if {0} is not _UNSET:\n        self.{0} = {0}\n".format(slot)
+            for slot in slots
+        ),
+    )
+    to_tuple = (
+        "def to_tuple(self):\n"
+        "    try:\n"
+        "        return (%s)\n"
+        "    except AttributeError:\n"
+        "        return (%s)\n"
+    ) % (
+        "".join("self.%s, " % slot for slot in slots),
+        "".join("getattr(self, %r, None), " % slot for slot in slots),
+    )
+    namespace = {"_UNSET": _UNSET}
+    exec(init + to_tuple, namespace)
+    for name in ("__init__", "to_tuple"):
+        if name in cls.__dict__:
+            # Defined by the subclass itself
+            continue
+        function = namespace[name]
+        function.__qualname__ = "%s.%s" % (cls.__qualname__, name)
+        function.__module__ = cls.__module__
+        setattr(cls, name, function)
+
+
 class AuthorStruct(BaseStruct):
     __slots__ = ["name", "affiliation", "orcid_id"]
 
@@ -56,7 +133,7 @@ class LinkStruct(BaseStruct):
 
 
 class LicenseStruct(BaseStruct):
-    __slots__ = ["open_access", "title", "url", "type"]
+    __slots__ = ["open_access", "title", "url", "type", "version"]
 
 
 class AdminStruct(BaseStruct):
@@ -94,3 +171,55 @@ class ArticleSearchResultStruct(BaseStruct):
 
 class SearchResultStruct(BaseStruct):
     __slots__ = ["id", "last_updated", "created_date"]
+
+
+class LazyArticleSearchResult(object):
+    """ An article search result decoded on access
+
+    The id, DOI and last_updated date are read straight from the raw record.
+    Reading any other attribute decodes the whole record into an
+    ArticleSearchResultStruct first.
+    """
+    __slots__ = ["_raw", "_codec", "_struct"]
+
+    def __init__(self, raw, codec):
+        """
+        :param raw: The search result as decoded from JSON
+        :param codec: The codec of schemas.ArticleSearchResultSchema
+        """
+        self._raw = raw
+        self._codec = codec
+        self._struct = None
+
+    @property
+    def id(self):
+        return self._raw.get("id")
+
+    @property
+    def doi(self):
+        bibjson = self._raw.get("bibjson") or {}
+        for identifier in bibjson.get("identifier") or ():
+            if identifier.get("type") == "doi":
+                return identifier.get("id")
+        return None
+
+    @property
+    def last_updated(self):
+        last_updated = self._raw.get("last_updated")
+        if last_updated is None:
+            return None
+        try:
+            return datetime.fromisoformat(last_updated.replace("Z", "+00:00"))
+        except (AttributeError, ValueError):
+            return self._decode().last_updated
+
+    def _decode(self):
+        if self._struct is None:
+            self._struct = self._codec.load(self._raw)
+        return self._struct
+
+    def __getattr__(self, name):
+        return getattr(self._decode(), name)
+
+    def __repr__(self):
+        return "{}(id={})".format(self.__class__.__name__, self.id)
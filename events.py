@@ -5,30 +5,24 @@ import traceback as tb
 
 from events import logic as events_logic
 from utils.logger import get_logger
-from utils.setting_handler import get_setting
 
-from plugins.doaj_transporter import logic
+from plugins.doaj_transporter import push_queue, settings_cache
 
 logger = get_logger(__name__)
 
 
 def push_on_publication(article, *args, **kwargs):
     journal = article.journal
-    setting = get_setting("plugin", "doaj_api_token", journal=journal)
-    if not setting or not setting.value:
-        # Check press default
-        setting = get_setting("plugin", "doaj_api_token", journal=None)
-
-    if not setting or not setting.value:
+    if not settings_cache.get_api_token(journal):
         logger.info("Journal has no DOAJ Token, ignoring...")
         return
 
-    enabled = get_setting("plugin", "doaj_publish_push", journal=journal).value
-    if enabled:
+    if settings_cache.is_push_enabled(journal):
+        # The push itself happens outside of the request (see push_queue)
         try:
-            logic.push_article_to_doaj(article)
+            push_queue.queue_push(article)
         except Exception as e:
-            logger.error("Failed to push article to DOAJ:")
+            logger.error("Failed to queue article push to DOAJ:")
             tb.print_exc()
     else:
         logger.info("DOAJ push disabled for journal, ignoring...")
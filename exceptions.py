@@ -10,6 +10,10 @@ class ResultNotFound(Exception):
 class RequestFailed(Exception):
     pass
 
+class MissingResult(Exception):
+    """ DOAJ did not return a result for a record sent in a bulk request"""
+    pass
+
 class ImmutableFieldChanged(Exception):
     """ A parameter has changed and DOAJ rejects write requests for the object
 
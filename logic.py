@@ -1,13 +1,15 @@
-import time
+from collections import defaultdict
 import traceback as tb
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import OuterRef, QuerySet, Subquery
 from django.utils import timezone
+from journal import models as journal_models
 from submission import models as sm_models
 from utils.logger import get_logger
 
-from plugins.doaj_transporter import clients, models
+from plugins.doaj_transporter import clients, exceptions, models, throttling
 
 logger = get_logger(__name__)
 
@@ -20,11 +22,13 @@ def check_debug_settings():
     return True
 
 
-def push_article_to_doaj(article, force_delete=False):
+def push_article_to_doaj(article, force_delete=False, force=False):
     """ Updates or creates a record in DOAJ for the given article
     :param article: submission.models.Article
     :param force_delete: Requests to delete existing record when URLs differ
     :type force_delete: bool
+    :param force: Push the article even if unchanged since its last push
+    :type force: bool
     """
     doi = article.get_identifier("doi")
     if not doi:
@@ -32,6 +36,14 @@ def push_article_to_doaj(article, force_delete=False):
 
     if check_debug_settings():
         article_client = clients.DOAJArticle.from_article_model(article)
+        if not force and article_client.id:
+            pushed_hash = get_pushed_hashes([article.pk]).get(article.pk)
+            if pushed_hash == article_client.payload_hash():
+                logger.info(
+                    "[DOAJ] Article %s unchanged since last push, skipping",
+                    article.pk,
+                )
+                return article_client.id
         article_client.upsert()
         return article_client.id
     encoded = encode_article_to_doaj_json(article)
@@ -47,28 +59,197 @@ def push_issue_to_doaj(issue, raise_on_error=True, force_delete=False):
     :type raise_on_error: bool
     :param force_delete: Requests to delete existing records when URLs differ
     :type force_delete: bool
+    :return: A dict of errors keyed by article pk
     """
-    errors = {}
-    for article in issue.articles.filter(
+    articles = issue.articles.filter(
         stage=sm_models.STAGE_PUBLISHED,
+        date_published__isnull=False,
+    )
+    return push_articles_to_doaj(
+        articles, raise_on_error=raise_on_error, force_delete=force_delete)
+
+
+def get_pushed_hashes(article_ids):
+    """ Returns the payload hash of the last push of the given articles
+    Only articles with a DOAJ id whose latest deposit is a successful push
+    are returned, so that deleted or failed records are always pushed again
+    :param article_ids: An iterable of submission.models.Article pks
+    :return: A dict of payload hashes keyed by article pk
+    """
+    # Deposits saved by the same bulk push can share their date_time
+    latest = models.DOAJDeposit.objects.filter(
+        article=OuterRef("pk"),
+    ).order_by("-date_time", "-pk")
+    return dict(
+        sm_models.Article.objects.filter(
+            pk__in=article_ids,
+            identifier__id_type="doaj",
+        ).annotate(
+            latest_hash=Subquery(latest.values("payload_hash")[:1]),
+            latest_success=Subquery(latest.values("success")[:1]),
+        ).filter(
+            latest_success=True,
+            latest_hash__isnull=False,
+        ).values_list("pk", "latest_hash")
+    )
+
+
+def push_articles_to_doaj(
+    articles, raise_on_error=True, workers=None, force=False,
+    force_delete=False,
+):
+    """ Updates or creates DOAJ records for many articles via the bulk API
+    Articles are grouped by the DOAJ token of their journal, and each group
+    is sent in as few requests as the bulk API limits allow.
+    :param articles: An iterable of submission.models.Article. Querysets
+        are loaded in bulk (see DOAJArticle.from_article_queryset)
+    :param raise_on_error: Raise the first error after all articles have been
+        processed
+    :type raise_on_error: bool
+    :param workers: Number of concurrent bulk requests (see PushExecutor)
+    :param force: Push the articles even if unchanged since their last push
+    :type force: bool
+    :param force_delete: Push the articles rejected by the bulk API one by
+        one, deleting their existing records when URLs differ. The bulk API
+        doesn't tell changes to immutable fields apart from other errors
+    :type force_delete: bool
+    :return: A dict of errors keyed by article pk
+    """
+    errors = {}
+    by_token = defaultdict(list)
+    if isinstance(articles, QuerySet):
+        doaj_articles = clients.DOAJArticle.from_article_queryset(
+            articles, errors=None if raise_on_error else errors)
+    else:
+        doaj_articles = _from_article_models(articles, raise_on_error, errors)
+    # Each article is encoded once, for hashing and pushing it
+    for doaj_article in doaj_articles:
+        by_token[doaj_article.api_token].append(
+            (doaj_article, doaj_article.encode_payload()))
+
+    if not force:
+        by_token = _exclude_unchanged(by_token)
+
+    for token, encoded_articles in by_token.items():
+        if not check_debug_settings():
+            logger.debug("Ignoring DOAJ bulk upsert on DEBUG mode")
+            for _, (encoded, _) in encoded_articles:
+                logger.debug(encoded)
+            continue
+        doaj_articles, payloads = zip(*encoded_articles)
+        bulk_client = clients.ArticleBulkClient(
+            token, doaj_articles, payloads=payloads)
+        created, bulk_errors = bulk_client.update(workers=workers)
+        logger.info(
+            "[DOAJ] Bulk pushed %d articles, %d failed",
+            len(created), len(bulk_errors),
+        )
+        errors.update(bulk_errors)
+
+    rejected = [
+        article_id for article_id, error in errors.items()
+        if isinstance(error, exceptions.BadRequest)
+    ]
+    if force_delete and rejected:
+        logger.info(
+            "[DOAJ] Pushing %d rejected articles one by one", len(rejected))
+        for article_id in rejected:
+            del errors[article_id]
+        errors.update(upsert_articles_one_by_one(
+            sm_models.Article.objects.filter(pk__in=rejected),
+            force_delete=True,
+            force=True,
+            workers=workers,
+        ))
+
+    if errors and raise_on_error:
+        raise next(iter(errors.values()))
+    return errors
+
+
+def upsert_articles_one_by_one(
+    articles, force_delete=False, force=False, workers=None,
+):
+    """ Updates or creates DOAJ records with a request per article
+    Unlike the bulk API, records rejected for changing an immutable field
+    can be deleted and pushed again. The requests run concurrently, their
+    results are saved from the calling thread as they complete
+    :param articles: An iterable of submission.models.Article
+    :param force_delete: Requests to delete existing record when URLs differ
+    :type force_delete: bool
+    :param force: Push the articles even if unchanged since their last push
+    :type force: bool
+    :param workers: Number of concurrent requests (see PushExecutor)
+    :return: A dict of errors keyed by article pk
+    """
+    errors = {}
+    doaj_articles = list(_from_article_models(articles, False, errors))
+    if not force:
+        encoded_articles = {None: [
+            (doaj_article, doaj_article.encode_payload())
+            for doaj_article in doaj_articles
+        ]}
+        doaj_articles = [
+            doaj_article for doaj_article, _
+            in _exclude_unchanged(encoded_articles)[None]
+        ]
+    if not check_debug_settings():
+        logger.debug("Ignoring DOAJ upsert on DEBUG mode")
+        return errors
+    for doaj_article in doaj_articles:
+        doaj_article.defer_writes()
+
+    executor = throttling.PushExecutor(workers)
+    for doaj_article, _, error in executor.map(
+        lambda doaj_article: doaj_article.upsert(force_delete=force_delete),
+        doaj_articles,
     ):
-        if article.date_published:
-            try:
-                push_article_to_doaj(article, force_delete=force_delete)
-                logger.info("Sleeping thread for 200ms")
-                time.sleep(0.2)
-            except Exception as e:
-                if raise_on_error:
-                    raise
-                errors[article.pk] = e
-                logger.error(
-                    "[DOAJ] Error pushing article %s of issue %s",
-                    article.pk, issue
-                )
-                tb.print_exc()
+        doaj_article.apply_writes()
+        if error:
+            errors[doaj_article.janeway_article.pk] = error
     return errors
 
 
+def _from_article_models(articles, raise_on_error, errors):
+    for article in articles:
+        try:
+            yield clients.DOAJArticle.from_article_model(article)
+        except Exception as e:
+            if raise_on_error:
+                raise
+            errors[article.pk] = e
+            logger.error("[DOAJ] Error encoding article %s", article.pk)
+            tb.print_exc()
+
+
+def _exclude_unchanged(by_token):
+    """ Drops the DOAJ articles that have not changed since their last push
+    :param by_token: A dict keyed by API token of lists of (DOAJArticle,
+        payload) pairs, the payload as returned by encode_payload
+    :return: A dict of the same lists without the unchanged articles
+    """
+    pushed_hashes = get_pushed_hashes([
+        doaj_article.janeway_article.pk
+        for encoded_articles in by_token.values()
+        for doaj_article, _ in encoded_articles
+        if doaj_article.id
+    ])
+    changed = defaultdict(list)
+    skipped = 0
+    for token, encoded_articles in by_token.items():
+        for doaj_article, (encoded, payload_hash) in encoded_articles:
+            pushed_hash = pushed_hashes.get(doaj_article.janeway_article.pk)
+            if pushed_hash and pushed_hash == payload_hash:
+                skipped += 1
+            else:
+                changed[token].append(
+                    (doaj_article, (encoded, payload_hash)))
+    if skipped:
+        logger.info(
+            "[DOAJ] Skipping %d articles unchanged since last push", skipped)
+    return changed
+
+
 def encode_article_to_doaj_json(article):
     article_client = clients.DOAJArticle.from_article_model(article)
     return article_client.encode()
@@ -85,3 +266,68 @@ def delete_article_from_doaj(doaj_id):
         doaj_id.delete()
     else:
         logger.debug("Ignoring DOAJ delete on DEBUG mode")
+
+
+def delete_articles_one_by_one(articles, workers=None):
+    """ Deletes articles from DOAJ with a request per article
+    The requests run concurrently, the deposits are saved and the local
+    identifiers deleted from the calling thread as the requests complete
+    :param articles: An iterable of submission.models.Article
+    :param workers: Number of concurrent requests (see PushExecutor)
+    :return: A dict of errors keyed by article pk
+    """
+    if not check_debug_settings():
+        logger.debug("Ignoring DOAJ delete on DEBUG mode")
+        return {}
+    errors = {}
+    doaj_articles = [
+        doaj_article
+        for doaj_article in _from_article_models(articles, False, errors)
+        if doaj_article.id
+    ]
+    for doaj_article in doaj_articles:
+        doaj_article.defer_writes()
+
+    executor = throttling.PushExecutor(workers)
+    for doaj_article, _, error in executor.map(
+        lambda doaj_article: doaj_article.delete(), doaj_articles,
+    ):
+        doaj_article.apply_writes()
+        if error:
+            errors[doaj_article.janeway_article.pk] = error
+    return errors
+
+
+def delete_articles_from_doaj(identifiers):
+    """ Deletes articles from DOAJ in bulk, as well as their local identifiers
+    DOAJ ids are read straight from the identifiers, no article payloads are
+    built. They are grouped by the DOAJ token of the article's journal.
+    :param identifiers: A queryset of identifiers.models.Identifier
+    :return: A dict of errors keyed by DOAJ id
+    """
+    by_journal = defaultdict(list)
+    for doaj_id, journal_id in identifiers.filter(
+        id_type="doaj",
+    ).values_list("identifier", "article__journal_id"):
+        by_journal[journal_id].append(doaj_id)
+
+    if not check_debug_settings():
+        logger.debug("Ignoring DOAJ bulk delete on DEBUG mode")
+        return {}
+
+    errors = {}
+    journals = journal_models.Journal.objects.in_bulk(by_journal.keys())
+    by_token = defaultdict(list)
+    for journal_id, doaj_ids in by_journal.items():
+        token = clients.ArticleBulkClient.get_token_from_settings(
+            journals.get(journal_id))
+        by_token[token].extend(doaj_ids)
+    for token, doaj_ids in by_token.items():
+        bulk_client = clients.ArticleBulkClient(token)
+        deleted, bulk_errors = bulk_client.delete(doaj_ids)
+        logger.info(
+            "[DOAJ] Bulk deleted %d articles, %d failed",
+            len(deleted), len(bulk_errors),
+        )
+        errors.update(bulk_errors)
+    return errors
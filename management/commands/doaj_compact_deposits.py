@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from plugins.doaj_transporter import retention
+
+
+class Command(BaseCommand):
+    """ Compacts the log of requests made to DOAJ"""
+
+    help = "Summarises old DOAJ deposits and truncates their response bodies"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep', type=int, default=None,
+            help="Number of latest deposits always kept per article",
+        )
+        parser.add_argument(
+            '--max_age_days', type=int, default=None,
+            help="Deposits younger than this are all kept",
+        )
+        parser.add_argument(
+            '--max_text', type=int, default=None,
+            help="Maximum length of the response bodies of older deposits",
+        )
+        parser.add_argument('--dry_run', action="store_true", default=False)
+
+    def handle(self, *args, **options):
+        summarised, truncated = retention.compact_deposits(
+            keep=options["keep"],
+            max_age_days=options["max_age_days"],
+            max_text_length=options["max_text"],
+            dry_run=options["dry_run"],
+        )
+        print("%s %d deposits, truncated %d response bodies" % (
+            "Would summarise" if options["dry_run"] else "Summarised",
+            summarised, truncated,
+        ))
@@ -1,8 +1,6 @@
 
-import time
-import traceback as tb
-
 from django.core.management.base import BaseCommand
+from identifiers.models import Identifier
 from submission.models import Article
 
 from plugins.doaj_transporter import clients, logic, synch
@@ -18,6 +16,14 @@ class Command(BaseCommand):
         parser.add_argument('--journal_code', '-j')
         parser.add_argument('--article_ids', '-a,', nargs="+", type=int)
         parser.add_argument('--dry-run', action="store_true", default=False)
+        parser.add_argument(
+            '--no_bulk', action="store_true", default=False,
+            help="Delete articles one by one instead of via the bulk API",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help="Number of concurrent requests to DOAJ",
+        )
 
     def handle(self, *args, **options):
         articles = Article.objects.none()
@@ -26,23 +32,36 @@ class Command(BaseCommand):
         if options.get("article_ids"):
             articles |= Article.objects.filter(id__in=options["article_ids"])
         if options.get("issue_id"):
-            articles |= Article.objects.filter(issues__id=options["article_ids"])
+            articles |= Article.objects.filter(issues__id=options["issue_id"])
 
         if articles.count() < 1:
             self.stderr.write("No articles found with given parameters")
 
-        for article in articles.filter(identifier__id_type="doaj"):
-            print("[%s] Handling article %s" % (article.pk, article))
-            doaj_id = article.get_identifier("doaj", object=True)
-            if doaj_id:
-                if options["dry_run"]:
-                    print("DELETE article #%s ID %s" % (article.pk, doaj_id))
-                else:
-                    try:
-                        logic.delete_article_from_doaj(doaj_id)
-                        print("Sleeping thread for 200ms")
-                        time.sleep(0.2)
-                    except Exception as e:
-                        self.stderr.write("[%s] Failed to delete:" % article.pk)
-                        err = e
-                        tb.print_exc()
+        if not options["no_bulk"]:
+            identifiers = Identifier.objects.filter(
+                id_type="doaj",
+                article__in=articles,
+            )
+            if options["dry_run"]:
+                for article_id, doaj_id in identifiers.values_list(
+                    "article_id", "identifier",
+                ):
+                    print("DELETE article #%s ID %s" % (article_id, doaj_id))
+                return
+            errors = logic.delete_articles_from_doaj(identifiers)
+            for doaj_id, error in errors.items():
+                self.stderr.write(
+                    "[%s] Failed to delete: %s" % (doaj_id, error))
+            return
+
+        articles = articles.filter(identifier__id_type="doaj").distinct()
+        if options["dry_run"]:
+            for article in articles:
+                print("DELETE article #%s ID %s" % (
+                    article.pk, article.get_identifier("doaj")))
+            return
+        errors = logic.delete_articles_one_by_one(
+            articles, workers=options["workers"])
+        for article_id, error in errors.items():
+            self.stderr.write(
+                "[%s] Failed to delete: %s" % (article_id, error))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from plugins.doaj_transporter import push_queue
+
+
+class Command(BaseCommand):
+    """ Pushes the articles queued for DOAJ"""
+
+    help = "Pushes the articles queued for DOAJ (e.g: on publication)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch_size', type=int, default=None)
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help="Number of concurrent requests to DOAJ",
+        )
+        parser.add_argument(
+            '--loop', type=int, default=None, metavar="SECONDS",
+            help="Keep draining the queue, polling every SECONDS",
+        )
+        parser.add_argument(
+            '--requeue_failed', action="store_true", default=False,
+            help="First queue the articles whose latest DOAJ deposit failed",
+        )
+
+    def handle(self, *args, **options):
+        if options["requeue_failed"]:
+            queued = push_queue.queue_failed_deposits()
+            print("Queued %d failed deposits" % queued)
+        while True:
+            pushed, failed = push_queue.process_queue(
+                batch_size=options["batch_size"],
+                workers=options["workers"],
+            )
+            print("Pushed %d articles, %d failed" % (pushed, failed))
+            if not options["loop"]:
+                break
+            time.sleep(options["loop"])
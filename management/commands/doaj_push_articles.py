@@ -1,10 +1,12 @@
-import time
-import traceback as tb
-
 from django.core.management.base import BaseCommand
 from submission.models import Article, STAGE_PUBLISHED
 
-from plugins.doaj_transporter import clients, logic, synch
+from plugins.doaj_transporter import (
+    clients,
+    logic,
+    push_queue,
+    synch,
+)
 
 
 class Command(BaseCommand):
@@ -17,6 +19,18 @@ class Command(BaseCommand):
         parser.add_argument('--article_ids', '-a,', nargs="+", type=int)
         parser.add_argument('--force_delete', action="store_true", default=False)
         parser.add_argument('--dry_run', action="store_true", default=False)
+        parser.add_argument(
+            '--no_bulk', action="store_true", default=False,
+            help="Push articles one by one instead of via the bulk API",
+        )
+        parser.add_argument(
+            '--force', action="store_true", default=False,
+            help="Push articles even if unchanged since their last push",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help="Number of concurrent requests to DOAJ",
+        )
 
     def handle(self, *args, **options):
         force_delete = options["force_delete"]
@@ -26,27 +40,45 @@ class Command(BaseCommand):
         if options.get("article_ids"):
             articles |= Article.objects.filter(id__in=options["article_ids"])
         if options.get("issue_id"):
-            articles |= Article.objects.filter(issues__id=options["article_ids"])
+            articles |= Article.objects.filter(issues__id=options["issue_id"])
 
         if articles.count() < 1:
             self.stderr.write("No articles found with given parameters")
 
-        for article in articles.filter(
+        if not options["dry_run"] and not options["no_bulk"]:
+            # DOAJ matches bulk records by DOI, so there is no need to synch
+            # the DOAJ IDs before pushing
+            errors = logic.push_articles_to_doaj(
+                articles.filter(
+                    stage=STAGE_PUBLISHED,
+                    date_published__isnull=False,
+                ).distinct(),
+                raise_on_error=False,
+                workers=options["workers"],
+                force=options["force"],
+                force_delete=force_delete,
+            )
+            for article_id, error in errors.items():
+                self.stderr.write(
+                    "[%s] Failed to push: %s" % (article_id, error))
+            if errors:
+                retries = push_queue.schedule_retries(errors)
+                self.stderr.write("Scheduled %d retries" % retries)
+            return
 
-        ):
-            print("[%s] Handling article %s" % (article.pk, article))
-            doi = article.get_doi()
-            if doi:
-                # If we have a DOI check if article has been synched first
-                synch.synch_article_from_janeway(article)
-            if options["dry_run"]:
+        if options["dry_run"]:
+            for article in articles:
+                print("[%s] Handling article %s" % (article.pk, article))
                 print(logic.encode_article_to_doaj_json(article))
-            else:
-                try:
-                    logic.push_article_to_doaj(article, force_delete=force_delete)
-                    print("Sleeping thread for 200ms")
-                    time.sleep(0.2)
-                except Exception as e:
-                    self.stderr.write("[%s] Failed to push:" % article.pk)
-                    err = e
-                    tb.print_exc()
+            return
+
+        # Articles with a DOI may be on DOAJ already, synch their ids first
+        synch.synch_articles_from_janeway(articles, workers=options["workers"])
+        errors = logic.upsert_articles_one_by_one(
+            articles,
+            force_delete=force_delete,
+            force=options["force"],
+            workers=options["workers"],
+        )
+        for article_id, error in errors.items():
+            self.stderr.write("[%s] Failed to push: %s" % (article_id, error))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from journal.models import Journal
+
+from plugins.doaj_transporter import sharding
+
+
+class Command(BaseCommand):
+    """ Runs a DOAJ operation over many journals on worker processes"""
+
+    help = "Pushes or synchs the articles of every journal in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'operation', choices=sorted(sharding.OPERATIONS))
+        parser.add_argument(
+            '--journal_codes', '-j', nargs="+",
+            help="Only run for these journals, defaults to all",
+        )
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help="Number of worker processes, defaults to the CPU count",
+        )
+        parser.add_argument(
+            '--shard_size', type=int, default=None,
+            help="Maximum number of articles handled by a worker at once",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help="Number of concurrent requests to DOAJ per process",
+        )
+        parser.add_argument(
+            '--force', action="store_true", default=False,
+            help="Push articles even if unchanged since their last push",
+        )
+        parser.add_argument(
+            '--full', action="store_true", default=False,
+            help="Synch all records instead of those updated since last run",
+        )
+
+    def handle(self, *args, **options):
+        journals = None
+        if options["journal_codes"]:
+            journals = Journal.objects.filter(
+                code__in=options["journal_codes"])
+
+        failed = 0
+        for result in sharding.run_sharded(
+            options["operation"],
+            journals=journals,
+            processes=options["processes"],
+            shard_size=options["shard_size"],
+            workers=options["workers"],
+            force=options["force"],
+            incremental=not options["full"],
+        ):
+            shard = result.shard
+            label = "[journal %s] articles %s-%s" % (
+                shard.journal_id, shard.min_pk or "", shard.max_pk or "")
+            if result.error:
+                failed += 1
+                self.stderr.write("%s failed:\n%s" % (label, result.error))
+            elif isinstance(result.result, dict):
+                for article_id, error in result.result.items():
+                    self.stderr.write(
+                        "[%s] Failed to push: %s" % (article_id, error))
+                print("%s done, %d failed" % (label, len(result.result)))
+            else:
+                print("%s done: %s" % (label, result.result))
+        if failed:
+            self.stderr.write("%d shards failed" % failed)
@@ -1,10 +1,13 @@
-import time
-
 from django.core.management.base import BaseCommand
 from journal.models import Journal
 from submission.models import Article
 
-from plugins.doaj_transporter import clients, logic, synch
+from plugins.doaj_transporter import (
+    clients,
+    logic,
+    models,
+    synch,
+)
 
 
 class Command(BaseCommand):
@@ -15,6 +18,18 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('journal_code')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help="Number of concurrent requests to DOAJ",
+        )
+        parser.add_argument(
+            '--page_size', type=int, default=None,
+            help="Number of DOAJ search results fetched per request",
+        )
+        parser.add_argument(
+            '--full', action="store_true", default=False,
+            help="Synch all records instead of those updated since last run",
+        )
 
     def handle(self, *args, **options):
         journal = Journal.objects.get(code=options["journal_code"])
@@ -23,14 +38,33 @@ class Command(BaseCommand):
         if articles.count() < 1:
             self.stderr.write("No articles found with given parameters")
 
-        print("Searching Janeway articles in DOAJ by DOI...")
+        incremental = (
+            not options["full"]
+            and models.DOAJSynchState.objects.filter(
+                journal=journal, last_updated__isnull=False,
+            ).exists()
+        )
+        print("Pulling DOAJ records of the journal...")
+        synch.synch_all_from_doaj(
+            journal,
+            incremental=incremental,
+            page_size=options["page_size"],
+            concurrency=options["workers"],
+        )
+
+        # Records last updated before the watermark, or of articles whose
+        # DOI changed in Janeway, are only found by searching each article
+        print("Searching unmatched Janeway articles in DOAJ by DOI...")
+        articles = [
+            article for article in articles.exclude(
+                identifier__id_type="doaj",
+            ) if article.get_doi()
+        ]
+        synched = set(synch.synch_articles_from_janeway(
+            articles,
+            index=synch.ArticleIndex(journal),
+            workers=options["workers"],
+        ))
         for article in articles:
-            doi = article.get_doi()
-            if doi:
-                print("[%s:%s] Handling article %s" % (
-                    article.journal.code, article.pk, article)
-            )
-                synch.synch_article_from_janeway(article)
-
-        print("Searching Janeway articles in DOAJ by DOI...")
-        synch.synch_all_from_doaj(journal)
+            if article.pk not in synched:
+                self.stderr.write("[%s] Failed to synch:" % article.pk)
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journal', '0001_initial'),
+        ('doaj_transporter', '0002_article'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DOAJSynchState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_updated', models.DateTimeField(blank=True, null=True)),
+                ('date_time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('journal', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='journal.Journal')),
+            ],
+        ),
+    ]
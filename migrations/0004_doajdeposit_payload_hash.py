@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doaj_transporter', '0003_doajsynchstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doajdeposit',
+            name='payload_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
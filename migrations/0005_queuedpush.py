@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submission', '0051_auto_20210222_1452'),
+        ('doaj_transporter', '0004_doajdeposit_payload_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedPush',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_queued', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('claim', models.CharField(blank=True, max_length=32, null=True)),
+                ('claimed_until', models.DateTimeField(blank=True, null=True)),
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='submission.Article')),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doaj_transporter', '0005_queuedpush'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedpush',
+            name='next_attempt',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='queuedpush',
+            name='failed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doaj_transporter', '0007_pushjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doajdeposit',
+            name='summary_of',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='doajdeposit',
+            index=models.Index(fields=['article', 'date_time'], name='doajdeposit_article_date_idx'),
+        ),
+    ]
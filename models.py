@@ -1,5 +1,5 @@
-from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
+from django.db.models import Count, OuterRef, Prefetch, Q, Subquery
 from django.utils import timezone
 from submission import models as sm_models
 
@@ -13,14 +13,148 @@ class DOAJDeposit(models.Model):
     success = models.BooleanField(default=False)
     result_text = models.TextField(blank=True, null=True)
     date_time = models.DateTimeField(default=timezone.now)
+    # Hash of the payload pushed, used to skip pushing unchanged records
+    payload_hash = models.CharField(max_length=64, blank=True, null=True)
+    # Number of older deposits this one summarises (see retention)
+    summary_of = models.PositiveIntegerField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["article", "date_time"],
+                name="doajdeposit_article_date_idx",
+            ),
+        ]
+
+
+class PushJob(models.Model):
+    """ A push of many articles requested from the manager (see push_queue)
+
+    The articles are pushed by the push queue, which records the outcome of
+    each article of the job in a PushJobArticle.
+    """
+    issue = models.ForeignKey(
+        "journal.Issue", on_delete=models.SET_NULL,
+        blank=True, null=True,
+    )
+    requested_by = models.ForeignKey(
+        "core.Account", on_delete=models.SET_NULL,
+        blank=True, null=True,
+    )
+    total = models.PositiveIntegerField(default=0)
+    date_created = models.DateTimeField(default=timezone.now)
+
+    def progress(self):
+        """ Returns the number of articles done, failed and remaining
+        Pushes waiting for a retry count as remaining
+        """
+        counts = self.pushjobarticle_set.aggregate(
+            done=Count("pk", filter=Q(status=PushJobArticle.DONE)),
+            failed=Count("pk", filter=Q(status=PushJobArticle.FAILED)),
+            remaining=Count("pk", filter=Q(status=PushJobArticle.PENDING)),
+        )
+        return {
+            "total": self.total,
+            "done": counts["done"],
+            "failed": counts["failed"],
+            "remaining": counts["remaining"],
+        }
+
+    def __str__(self):
+        return "Push of %s articles from %s" % (self.total, self.issue)
+
+
+class PushJobArticle(models.Model):
+    """ The outcome of pushing an article as part of a PushJob
+
+    Entries are marked as done or failed by the push queue, so that the
+    progress of a job is not affected by later jobs pushing the same article
+    """
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+    job = models.ForeignKey(PushJob, on_delete=models.CASCADE)
+    article = models.ForeignKey(
+        "submission.Article", on_delete=models.CASCADE,
+    )
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING,
+    )
+
+    class Meta:
+        unique_together = ("job", "article")
+
+    def __str__(self):
+        return "Article %s of %s: %s" % (
+            self.article_id, self.job, self.status)
+
+
+class QueuedPush(models.Model):
+    """ An article waiting to be pushed to DOAJ (see push_queue)
+
+    There is a single row per article, so queueing an article several times
+    before it is pushed results in a single push.
+    """
+    article = models.OneToOneField(
+        "submission.Article", on_delete=models.CASCADE,
+    )
+    date_queued = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    # Failed pushes are retried with an exponential backoff
+    next_attempt = models.DateTimeField(default=timezone.now)
+    # Set when the push failed with an error that retrying won't fix
+    failed = models.BooleanField(default=False)
+    # Set by the worker processing the push
+    claim = models.CharField(max_length=32, blank=True, null=True)
+    claimed_until = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return "Push of article %s queued on %s" % (
+            self.article_id, self.date_queued)
+
+
+class DOAJSynchState(models.Model):
+    """ Tracks the synchronisation of a journal's records from DOAJ
+
+    last_updated is the high-water mark of the DOAJ records synched, so
+    that following synchs only need to fetch the records changed since
+    """
+    journal = models.OneToOneField(
+        "journal.Journal", on_delete=models.CASCADE,
+    )
+    last_updated = models.DateTimeField(blank=True, null=True)
+    date_time = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return "%s synched up to %s" % (self.journal, self.last_updated)
 
 
 class ArticleManager(sm_models.Article.objects.__class__):
     def get_queryset(self):
         queryset = super().get_queryset()
-        return queryset.prefetch_related("identifier_set").prefetch_related(
-            "doajdeposit_set"
-        )
+        return queryset.prefetch_related("identifier_set")
+
+    def with_latest_deposit(self):
+        """ Prefetches the latest DOAJ deposit of each article
+        So that listing articles with Article.latest_deposit doesn't cost a
+        query per article. Only the latest deposit row of each article is
+        loaded, picked by its pk
+        """
+        latest = DOAJDeposit.objects.filter(
+            article=OuterRef("article"),
+        ).order_by("-date_time", "-pk")
+        return self.get_queryset().prefetch_related(Prefetch(
+            "doajdeposit_set",
+            queryset=DOAJDeposit.objects.filter(
+                pk=Subquery(latest.values("pk")[:1])),
+            to_attr="latest_deposits",
+        ))
 
 
 class Article(sm_models.Article):
@@ -29,13 +163,19 @@ class Article(sm_models.Article):
     class Meta:
         proxy = True
 
+    def get_identifier(self, identifier_type, object=False):
+        # Avoid a query per call when the identifiers are prefetched
+        if "identifier_set" not in getattr(
+            self, "_prefetched_objects_cache", {},
+        ):
+            return super().get_identifier(identifier_type, object=object)
+        for identifier in self.identifier_set.all():
+            if identifier.id_type == identifier_type:
+                return identifier if object else identifier.identifier
+        return None
+
     def get_doaj_id(self):
-        try:
-            return self.identifier_set.get(
-                id_type="doaj",
-            )
-        except ObjectDoesNotExist:
-            return None
+        return self.get_identifier("doaj", object=True)
 
     def can_push(self):
         return (
@@ -45,11 +185,6 @@ class Article(sm_models.Article):
         )
 
     def latest_deposit(self):
-        try:
-            return self.doajdeposit_set.all(
-            ).order_by(
-                "-date_time",
-            ).first()
-        except ObjectDoesNotExist:
-            return None
-
+        if hasattr(self, "latest_deposits"):
+            return self.latest_deposits[0] if self.latest_deposits else None
+        return self.doajdeposit_set.order_by("-date_time", "-pk").first()
@@ -0,0 +1,325 @@
+"""
+A database backed queue of the articles waiting to be pushed to DOAJ
+
+Queueing an article (e.g: on publication) only records its id, so the
+request publishing it does not depend on DOAJ. Queued articles are pushed
+in batches via the bulk API by the doaj_process_queue command or, unless
+disabled with DOAJ_PUSH_QUEUE_THREAD = False, by a background thread
+started when an article is queued.
+
+The queue also holds the retries of failed pushes. Transient errors (DOAJ
+unreachable, 5xx or 429 responses) are retried with an exponential backoff
+and jitter, while permanent ones (invalid token or payload) flag the push as
+failed until the article is queued again.
+"""
+from datetime import timedelta
+import random
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+import requests
+from submission import models as sm_models
+from utils.logger import get_logger
+
+from plugins.doaj_transporter import exceptions, logic, models, retention
+
+logger = get_logger(__name__)
+
+BATCH_SIZE = 100
+CLAIM_LEASE = timedelta(minutes=10)
+MAX_ATTEMPTS = 10
+RETRY_BASE_DELAY = timedelta(minutes=1)
+RETRY_MAX_DELAY = timedelta(hours=6)
+PERMANENT_ERRORS = (
+    exceptions.BadRequest,
+    exceptions.InvalidDOAJToken,
+    exceptions.ImmutableFieldChanged,
+    ValueError,
+)
+
+_worker = None
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def queue_push(article):
+    """ Queues an article to be pushed to DOAJ
+    If the article is already queued, the pending push is reused
+    :param article: submission.models.Article
+    """
+    queue_pushes([article.pk])
+
+
+def queue_pushes(article_ids, job=None):
+    """ Queues many articles to be pushed to DOAJ
+    :param article_ids: An iterable of submission.models.Article pks
+    :param job: An optional models.PushJob tracking the pushes
+    """
+    article_ids = set(article_ids)
+    now = timezone.now()
+    fields = {
+        "date_queued": now,
+        "next_attempt": now,
+        "attempts": 0,
+        "failed": False,
+    }
+    if job is not None:
+        models.PushJobArticle.objects.bulk_create(
+            (
+                models.PushJobArticle(job=job, article_id=article_id)
+                for article_id in article_ids
+            ),
+            ignore_conflicts=True,
+        )
+    queued = models.QueuedPush.objects.filter(article_id__in=article_ids)
+    queued.update(**fields)
+    article_ids.difference_update(queued.values_list("article_id", flat=True))
+    models.QueuedPush.objects.bulk_create(
+        (
+            models.QueuedPush(article_id=article_id, **fields)
+            for article_id in article_ids
+        ),
+        # Queued by someone else in the meantime
+        ignore_conflicts=True,
+    )
+    if getattr(settings, "DOAJ_PUSH_QUEUE_THREAD", True):
+        transaction.on_commit(start_worker_thread)
+
+
+def queue_issue_push(issue, requested_by=None):
+    """ Queues the published articles of an issue to be pushed to DOAJ
+    :param issue: journal.models.Issue
+    :param requested_by: The core.models.Account requesting the push
+    :return: A models.PushJob to follow the progress of the pushes
+    """
+    article_ids = list(issue.articles.filter(
+        stage=sm_models.STAGE_PUBLISHED,
+        date_published__isnull=False,
+    ).values_list("pk", flat=True))
+    with transaction.atomic():
+        job = models.PushJob.objects.create(
+            issue=issue,
+            requested_by=requested_by,
+            total=len(article_ids),
+        )
+        queue_pushes(article_ids, job=job)
+    return job
+
+
+def schedule_retries(errors):
+    """ Queues the retry of pushes that failed with a transient error
+    :param errors: A dict of exceptions keyed by article pk, as returned by
+        logic.push_articles_to_doaj
+    :return: The number of retries scheduled
+    """
+    scheduled = 0
+    for article_id, error in errors.items():
+        if not is_transient(error):
+            continue
+        queued_push, _ = models.QueuedPush.objects.get_or_create(
+            article_id=article_id)
+        if not queued_push.claim:
+            _record_failure(queued_push, error)
+            scheduled += 1
+    return scheduled
+
+
+def queue_failed_deposits(journal=None):
+    """ Queues the articles whose latest DOAJ deposit failed
+    :param journal: Only queue the articles of this journal
+    :return: The number of articles queued
+    """
+    latest = models.DOAJDeposit.objects.filter(
+        article=OuterRef("pk"),
+    ).order_by("-date_time")
+    articles = sm_models.Article.objects.filter(
+        stage=sm_models.STAGE_PUBLISHED,
+        date_published__isnull=False,
+        queuedpush__isnull=True,
+    ).annotate(
+        latest_success=Subquery(latest.values("success")[:1]),
+    ).filter(
+        latest_success=False,
+    )
+    if journal:
+        articles = articles.filter(journal=journal)
+    queued = models.QueuedPush.objects.bulk_create(
+        models.QueuedPush(article_id=article_id)
+        for article_id in articles.values_list("pk", flat=True)
+    )
+    return len(queued)
+
+
+def is_transient(error):
+    """ Returns True if retrying a push that failed with error may succeed"""
+    if isinstance(error, requests.HTTPError):
+        status_code = getattr(error.response, "status_code", None)
+        return status_code is None or status_code == 429 or status_code >= 500
+    return not isinstance(error, PERMANENT_ERRORS)
+
+
+def retry_delay(attempts):
+    """ Returns the delay before the next attempt of a failed push
+    The delay doubles with every attempt, up to RETRY_MAX_DELAY, and half of
+    it is randomised so that retries after an outage are spread over time
+    """
+    # Capped exponent, timedelta overflows long before 2 ** attempts does
+    delay = min(
+        RETRY_BASE_DELAY * 2 ** min(max(attempts - 1, 0), 32),
+        RETRY_MAX_DELAY,
+    )
+    return delay / 2 + delay / 2 * random.random()
+
+
+def process_queue(batch_size=None, workers=None):
+    """ Pushes the queued articles that are due, in batches
+    Each article is attempted at most once per call
+    :param batch_size: Number of articles pushed at once
+    :param workers: Number of concurrent requests (see PushExecutor)
+    :return: A tuple with the number of articles pushed and failed
+    """
+    if not logic.check_debug_settings():
+        # Nothing would be pushed, keep the queue for when pushes are enabled
+        logger.debug("[DOAJ] Ignoring the push queue on DEBUG mode")
+        return 0, 0
+    pushed = failed = 0
+    attempted = set()
+    while True:
+        claim, claimed_at, queued = _claim_batch(
+            batch_size or BATCH_SIZE, exclude=attempted)
+        if not queued:
+            break
+        attempted.update(queued_push.article_id for queued_push in queued)
+        batch_pushed, batch_failed = _push_batch(
+            claim, claimed_at, queued, workers)
+        pushed += batch_pushed
+        failed += batch_failed
+    if pushed or failed:
+        logger.info(
+            "[DOAJ] Push queue processed: %d pushed, %d failed",
+            pushed, failed,
+        )
+        retention.maybe_compact_deposits()
+    return pushed, failed
+
+
+def _claim_batch(batch_size, exclude=()):
+    """ Claims a batch of queued pushes for this worker
+    Claims expire after CLAIM_LEASE, so pushes claimed by a worker that
+    died are eventually picked up by another one
+    :return: A tuple of (claim, claimed_at, list of QueuedPush)
+    """
+    now = timezone.now()
+    claim = uuid.uuid4().hex
+    claimable = models.QueuedPush.objects.filter(
+        Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+        failed=False,
+        next_attempt__lte=now,
+    ).exclude(
+        article_id__in=exclude,
+    )
+    pks = list(claimable.order_by("date_queued").values_list(
+        "pk", flat=True)[:batch_size])
+    claimable.filter(pk__in=pks).update(
+        claim=claim, claimed_until=now + CLAIM_LEASE)
+    return claim, now, list(models.QueuedPush.objects.filter(claim=claim))
+
+
+def _push_batch(claim, claimed_at, queued, workers=None):
+    articles = sm_models.Article.objects.filter(
+        pk__in=[queued_push.article_id for queued_push in queued],
+        stage=sm_models.STAGE_PUBLISHED,
+        date_published__isnull=False,
+    )
+    errors = logic.push_articles_to_doaj(
+        articles, raise_on_error=False, workers=workers)
+
+    for queued_push in queued:
+        error = errors.get(queued_push.article_id)
+        if error is not None:
+            _record_failure(queued_push, error)
+    # Jobs created while this batch was processed wait for the next push
+    models.PushJobArticle.objects.filter(
+        article_id__in=[
+            queued_push.article_id for queued_push in queued
+            if queued_push.article_id not in errors
+        ],
+        job__date_created__lte=claimed_at,
+        status=models.PushJobArticle.PENDING,
+    ).update(status=models.PushJobArticle.DONE)
+    # Pushes queued again while this batch was processed are kept
+    models.QueuedPush.objects.filter(
+        claim=claim,
+        date_queued__lte=claimed_at,
+    ).exclude(
+        article_id__in=errors.keys(),
+    ).delete()
+    models.QueuedPush.objects.filter(claim=claim).update(
+        claim=None, claimed_until=None)
+    return len(queued) - len(errors), len(errors)
+
+
+def _record_failure(queued_push, error):
+    """ Schedules the next attempt of a failed push, if worth retrying"""
+    attempts = queued_push.attempts + 1
+    transient = is_transient(error)
+    if transient and attempts < MAX_ATTEMPTS:
+        next_attempt = timezone.now() + retry_delay(attempts)
+        logger.warning(
+            "[DOAJ] Push of article %s failed, retrying after %s: %s",
+            queued_push.article_id, next_attempt, error,
+        )
+    else:
+        next_attempt = queued_push.next_attempt
+        logger.error(
+            "[DOAJ] Giving up pushing article %s after %d attempts: %s",
+            queued_push.article_id, attempts, error,
+        )
+    failed = not (transient and attempts < MAX_ATTEMPTS)
+    models.QueuedPush.objects.filter(pk=queued_push.pk).update(
+        attempts=F("attempts") + 1,
+        last_error="%s: %s" % (error.__class__.__name__, error),
+        next_attempt=next_attempt,
+        failed=failed,
+        claim=None,
+        claimed_until=None,
+    )
+    if failed:
+        # Jobs queueing the article again after this push get their own push
+        models.PushJobArticle.objects.filter(
+            article_id=queued_push.article_id,
+            job__date_created__lte=queued_push.date_queued,
+            status=models.PushJobArticle.PENDING,
+        ).update(status=models.PushJobArticle.FAILED)
+
+
+def start_worker_thread():
+    """ Starts a thread draining the queue, unless one is already running"""
+    global _worker
+    with _worker_lock:
+        _wakeup.set()
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=_run_worker, name="doaj-push-queue", daemon=True)
+            _worker.start()
+
+
+def _run_worker():
+    global _worker
+    try:
+        while True:
+            with _worker_lock:
+                if not _wakeup.is_set():
+                    _worker = None
+                    return
+                _wakeup.clear()
+            try:
+                process_queue()
+            except Exception:
+                logger.exception("[DOAJ] Failed to process the push queue")
+    finally:
+        connections.close_all()
@@ -0,0 +1,151 @@
+"""
+Retention policy of the DOAJDeposit log
+
+A deposit is logged for every request made to DOAJ, with the full response
+body. compact_deposits keeps the latest deposits of each article and those
+inside an age window, and replaces the older ones by a single summary
+deposit per article. Response bodies outside the window are truncated.
+
+The policy can be tuned with the following django settings:
+    - DOAJ_DEPOSIT_KEEP: Latest deposits always kept per article
+    - DOAJ_DEPOSIT_MAX_AGE_DAYS: Deposits younger than this are all kept
+    - DOAJ_DEPOSIT_MAX_TEXT: Maximum length of the response bodies kept
+    - DOAJ_DEPOSIT_AUTO_COMPACT: Compact the log daily from the push queue
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min
+from django.db.models.functions import Length
+from django.utils import timezone
+from utils.logger import get_logger
+
+from plugins.doaj_transporter import models, settings_cache
+
+logger = get_logger(__name__)
+
+KEEP_DEPOSITS = 10
+MAX_AGE_DAYS = 90
+MAX_TEXT_LENGTH = 1000
+COMPACT_INTERVAL = timedelta(days=1)
+TRUNCATED_MARKER = " [...]"
+BATCH_SIZE = 500
+
+
+def compact_deposits(
+    keep=None, max_age_days=None, max_text_length=None, dry_run=False,
+):
+    """ Compacts the deposits logged before the age window
+    :param keep: Number of latest deposits always kept per article
+    :param max_age_days: Deposits younger than this are all kept
+    :param max_text_length: Maximum length of the older response bodies
+    :param dry_run: Only count the deposits that would be compacted
+    :return: A tuple with the number of deposits summarised and truncated
+    """
+    if keep is None:
+        keep = getattr(settings, "DOAJ_DEPOSIT_KEEP", KEEP_DEPOSITS)
+    if max_age_days is None:
+        max_age_days = getattr(
+            settings, "DOAJ_DEPOSIT_MAX_AGE_DAYS", MAX_AGE_DAYS)
+    if max_text_length is None:
+        max_text_length = getattr(
+            settings, "DOAJ_DEPOSIT_MAX_TEXT", MAX_TEXT_LENGTH)
+    # The latest deposit of an article is always kept
+    keep = max(keep, 1)
+    cutoff = timezone.now() - timedelta(days=max_age_days)
+
+    summarised = 0
+    article_ids = models.DOAJDeposit.objects.filter(
+        article__isnull=False,
+    ).values("article").annotate(
+        deposits=Count("pk"),
+        oldest=Min("date_time"),
+    ).filter(
+        deposits__gt=keep,
+        oldest__lt=cutoff,
+    ).values_list("article", flat=True)
+    for article_id in article_ids.iterator():
+        summarised += _summarise_article(article_id, keep, cutoff, dry_run)
+
+    orphans = models.DOAJDeposit.objects.filter(
+        article__isnull=True, date_time__lt=cutoff)
+    if dry_run:
+        summarised += orphans.count()
+    else:
+        summarised += orphans.delete()[0]
+
+    truncated = _truncate_texts(cutoff, max_text_length, dry_run)
+    logger.info(
+        "[DOAJ] Compacted deposits older than %s: %d summarised, "
+        "%d truncated", cutoff, summarised, truncated,
+    )
+    return summarised, truncated
+
+
+def maybe_compact_deposits():
+    """ Compacts the deposits at most once per COMPACT_INTERVAL
+    Only when enabled with DOAJ_DEPOSIT_AUTO_COMPACT
+    """
+    if not getattr(settings, "DOAJ_DEPOSIT_AUTO_COMPACT", False):
+        return
+    key = "%s:deposits_compacted" % settings_cache.CACHE_PREFIX
+    if cache.add(key, True, COMPACT_INTERVAL.total_seconds()):
+        compact_deposits()
+
+
+def _summarise_article(article_id, keep, cutoff, dry_run=False):
+    with transaction.atomic():
+        deposits = models.DOAJDeposit.objects.filter(
+            article_id=article_id,
+        ).order_by("-date_time", "-pk")
+        removed = [
+            deposit for deposit in deposits.only(
+                "pk", "date_time", "success", "summary_of",
+            )[keep:]
+            if deposit.date_time < cutoff
+        ]
+        # Replacing a single deposit by its summary gains nothing
+        if len(removed) < 2:
+            return 0
+        if dry_run:
+            return len(removed)
+        count = sum(deposit.summary_of or 1 for deposit in removed)
+        latest, oldest = removed[0], removed[-1]
+        models.DOAJDeposit.objects.create(
+            article_id=article_id,
+            success=latest.success,
+            result_text="Summary of %d deposits logged from %s to %s" % (
+                count, oldest.date_time, latest.date_time),
+            date_time=latest.date_time,
+            summary_of=count,
+        )
+        models.DOAJDeposit.objects.filter(
+            pk__in=[deposit.pk for deposit in removed],
+        ).delete()
+    return len(removed)
+
+
+def _truncate_texts(cutoff, max_text_length, dry_run=False):
+    """ Truncates the response bodies logged before the cutoff
+    Done in batches of primary keys, as some databases can't update a table
+    filtered by a subquery on itself
+    """
+    pks = list(models.DOAJDeposit.objects.annotate(
+        text_length=Length("result_text"),
+    ).filter(
+        date_time__lt=cutoff,
+        summary_of__isnull=True,
+        text_length__gt=max_text_length + len(TRUNCATED_MARKER),
+    ).values_list("pk", flat=True))
+    if dry_run:
+        return len(pks)
+    for start in range(0, len(pks), BATCH_SIZE):
+        deposits = models.DOAJDeposit.objects.filter(
+            pk__in=pks[start:start + BATCH_SIZE]).only("pk", "result_text")
+        for deposit in deposits:
+            deposit.result_text = (
+                deposit.result_text[:max_text_length] + TRUNCATED_MARKER)
+        models.DOAJDeposit.objects.bulk_update(deposits, ["result_text"])
+    return len(pks)
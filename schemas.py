@@ -142,3 +142,11 @@ class SearchSchema(Schema):
 
 class ArticleSearchSchema(SearchSchema):
     results = fields.List(fields.Nested(ArticleSearchResultSchema))
+
+
+class LazyArticleSearchSchema(SearchSchema):
+    """ Schema for pages of article search results decoded on access
+
+    Results are kept as raw records, see data_structs.LazyArticleSearchResult
+    """
+    results = fields.List(fields.Raw())
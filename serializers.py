@@ -0,0 +1,346 @@
+"""
+Precompiled encoders and decoders for the marshmallow schemas in schemas.py
+
+The DOAJ records have a fixed shape, yet marshmallow walks the fields, hooks
+and error stores of each schema for every record (de)serialised. A Codec
+compiles a schema once into plain functions giving the same results: fields
+in declaration order, unset attributes omitted and dump defaults applied, so
+the encoded JSON is byte-identical.
+
+Decoding follows the same rules for well formed records. Anything the
+compiled decoder does not expect (unknown fields, nulls, invalid values...)
+is handed over to the marshmallow schema, which remains the validating
+fallback, so errors are reported exactly as before. Schemas using features
+the compiler does not support are always handled by marshmallow.
+"""
+import threading
+
+from marshmallow import EXCLUDE, INCLUDE, Schema, ValidationError, fields
+from marshmallow.utils import get_value, missing
+
+from plugins.doaj_transporter.schemas import StructSchema
+
+_encoders = {}
+_decoders = {}
+_codecs = {}
+_codecs_lock = threading.Lock()
+
+
+class Unsupported(Exception):
+    """ Raised when compiling a schema that uses unsupported features"""
+
+
+class _Fallback(Exception):
+    """ Raised by compiled decoders on input they leave to marshmallow"""
+
+
+class Codec(object):
+    """ Encodes and decodes records like an instance of the given schema
+
+    Exposes the dump(s) and load(s) methods used by the clients, so it can
+    be used in place of the schema.
+    """
+    def __init__(self, schema_cls):
+        self.schema = schema_cls()
+        self._encoder = _compiled(_encoders, compile_encoder, self.schema)
+        self._decoder = _compiled(_decoders, compile_decoder, self.schema)
+
+    def dump(self, obj):
+        if self._encoder is None:
+            return self.schema.dump(obj)
+        return self._encoder(obj)
+
+    def dumps(self, obj):
+        return self.schema.opts.render_module.dumps(self.dump(obj))
+
+    def load(self, data):
+        if self._decoder is not None:
+            try:
+                return self._decoder(data)
+            except _Fallback:
+                pass
+        return self.schema.load(data)
+
+    def loads(self, encoded):
+        return self.load(self.schema.opts.render_module.loads(encoded))
+
+
+def get_codec(schema_cls, api_version=None, fast=True):
+    """ Returns the codec shared by all the users of schema_cls
+    Neither codecs nor marshmallow schemas keep state between calls, so a
+    single instance per schema and API version can be used by every thread
+    :param schema_cls: A marshmallow.Schema subclass
+    :param api_version: The version of the DOAJ API the records are for
+    :param fast: Return a Codec, or the plain marshmallow schema if False
+    """
+    key = (schema_cls, api_version, fast)
+    try:
+        return _codecs[key]
+    except KeyError:
+        with _codecs_lock:
+            if key not in _codecs:
+                _codecs[key] = Codec(schema_cls) if fast else schema_cls()
+            return _codecs[key]
+
+
+def _compiled(cache, compiler, schema):
+    """ Returns the compiled function for the schema class, None if the
+    schema can't be compiled
+    """
+    schema_cls = type(schema)
+    if schema_cls not in cache:
+        try:
+            cache[schema_cls] = compiler(schema)
+        except Unsupported:
+            cache[schema_cls] = None
+    return cache[schema_cls]
+
+
+def compile_encoder(schema):
+    """ Compiles a function equivalent to schema.dump for a single object
+    :param schema: An instance of marshmallow.Schema
+    :raise Unsupported: If the schema can't be compiled
+    """
+    if schema.many or _get_hooks(schema, "pre_dump", "post_dump"):
+        raise Unsupported("%s has dump hooks" % schema)
+    if type(schema).get_attribute is not Schema.get_attribute:
+        raise Unsupported("%s overrides get_attribute" % schema)
+
+    steps = []
+    for name, field in schema.dump_fields.items():
+        attr = field.attribute or name
+        if "." in attr or type(field).serialize is not fields.Field.serialize:
+            raise Unsupported("Can't compile field %s" % name)
+        key = field.data_key if field.data_key is not None else name
+        steps.append(
+            (key, attr, field.dump_default, _compile_field_encoder(field)))
+    steps = tuple(steps)
+
+    def encode(obj):
+        ret = {}
+        by_key = hasattr(obj, "__getitem__")
+        for key, attr, default, encode_field in steps:
+            if by_key:
+                value = get_value(obj, attr, missing)
+            else:
+                value = getattr(obj, attr, missing)
+            if value is missing:
+                value = default() if callable(default) else default
+                if value is missing:
+                    continue
+            ret[key] = encode_field(value)
+        return ret
+
+    return encode
+
+
+def _compile_field_encoder(field):
+    field_type = type(field)
+    if field_type is fields.Raw:
+        return _identity
+    if field_type in (fields.String, fields.URL, fields.Email):
+        return _encode_string
+
+    if field_type is fields.Boolean:
+        truthy, falsy = field.truthy, field.falsy
+
+        def encode_boolean(value):
+            if value is None:
+                return None
+            try:
+                if value in truthy:
+                    return True
+                if value in falsy:
+                    return False
+            except TypeError:
+                pass
+            return bool(value)
+        return encode_boolean
+
+    if field_type is fields.Integer and not field.as_string:
+        def encode_integer(value):
+            return None if value is None else int(value)
+        return encode_integer
+
+    if field_type is fields.List:
+        encode_inner = _compile_field_encoder(field.inner)
+
+        def encode_list(value):
+            if value is None:
+                return None
+            return [encode_inner(each) for each in value]
+        return encode_list
+
+    if field_type is fields.Nested and not field.many:
+        encode_nested = compile_encoder(field.schema)
+
+        def encode_object(value):
+            return None if value is None else encode_nested(value)
+        return encode_object
+
+    raise Unsupported("Can't compile %s fields" % field_type.__name__)
+
+
+def _encode_string(value):
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return str(value)
+
+
+def compile_decoder(schema):
+    """ Compiles a function equivalent to schema.load for a single record
+    The function raises _Fallback for input that needs the schema to report
+    errors or that it doesn't handle the same way
+    :param schema: An instance of marshmallow.Schema
+    :raise Unsupported: If the schema can't be compiled
+    """
+    if schema.many or _get_hooks(
+        schema, "pre_load", "validates", "validates_schema",
+    ):
+        raise Unsupported("%s has load hooks" % schema)
+    post_load = _get_hooks(schema, "post_load")
+    if isinstance(schema, StructSchema) and post_load == ["load_struct"]:
+        struct_cls = schema._STRUCT_CLS
+    elif not post_load:
+        struct_cls = None
+    else:
+        raise Unsupported("%s has post_load hooks" % schema)
+
+    steps = []
+    for name, field in schema.load_fields.items():
+        attr = field.attribute or name
+        if "." in attr:
+            raise Unsupported("Can't compile field %s" % name)
+        key = field.data_key if field.data_key is not None else name
+        steps.append((key, attr, field, _compile_field_decoder(field)))
+    known_keys = frozenset(key for key, _, _, _ in steps)
+    steps = tuple(steps)
+    unknown = schema.unknown
+
+    def decode(data):
+        if type(data) is not dict:
+            raise _Fallback()
+        ret = {}
+        for key, attr, field, decode_field in steps:
+            value = data.get(key, missing)
+            if value is missing:
+                if field.required:
+                    raise _Fallback()
+                default = field.load_default
+                if default is not missing:
+                    ret[attr] = default() if callable(default) else default
+            else:
+                ret[attr] = decode_field(value)
+        if unknown != EXCLUDE and not known_keys.issuperset(data):
+            if unknown != INCLUDE:
+                raise _Fallback()
+            for key in data.keys() - known_keys:
+                ret[key] = data[key]
+        if struct_cls is not None:
+            return struct_cls(**ret)
+        return ret
+
+    return decode
+
+
+def _compile_field_decoder(field):
+    if type(field).deserialize is not fields.Field.deserialize:
+        raise Unsupported("Can't compile %s" % field)
+    decode_value = _compile_value_decoder(field)
+    allow_none = field.allow_none
+    validators = tuple(field.validators)
+
+    def decode_field(value):
+        if value is None:
+            if allow_none:
+                return None
+            raise _Fallback()
+        value = decode_value(value)
+        for validator in validators:
+            try:
+                if validator(value) is False:
+                    raise _Fallback()
+            except ValidationError:
+                raise _Fallback()
+        return value
+
+    return decode_field
+
+
+def _compile_value_decoder(field):
+    field_type = type(field)
+    if field_type is fields.Raw:
+        return _identity
+    if field_type in (fields.String, fields.URL, fields.Email):
+        return _decode_string
+
+    if field_type is fields.Boolean:
+        truthy, falsy = field.truthy, field.falsy
+
+        def decode_boolean(value):
+            if not truthy:
+                return bool(value)
+            try:
+                if value in truthy:
+                    return True
+                if value in falsy:
+                    return False
+            except TypeError:
+                pass
+            raise _Fallback()
+        return decode_boolean
+
+    if field_type is fields.Integer:
+        def decode_integer(value):
+            if type(value) is not int:
+                raise _Fallback()
+            return value
+        return decode_integer
+
+    if field_type is fields.DateTime:
+        def decode_datetime(value):
+            try:
+                return field._deserialize(value, None, None)
+            except ValidationError:
+                raise _Fallback()
+        return decode_datetime
+
+    if field_type is fields.List:
+        decode_inner = _compile_field_decoder(field.inner)
+
+        def decode_list(value):
+            if type(value) is not list:
+                raise _Fallback()
+            return [decode_inner(each) for each in value]
+        return decode_list
+
+    if field_type is fields.Nested and not field.many and field.unknown is None:
+        return compile_decoder(field.schema)
+
+    raise Unsupported("Can't compile %s fields" % field_type.__name__)
+
+
+def _identity(value):
+    return value
+
+
+def _decode_string(value):
+    if type(value) is not str:
+        raise _Fallback()
+    return value
+
+
+def _get_hooks(schema, *tags):
+    """ Returns the names of the schema methods registered for the tags"""
+    names = []
+    for key, hooks in schema._hooks.items():
+        # Keys are (tag, many) tuples in some marshmallow 3 releases
+        tag = key[0] if isinstance(key, tuple) else key
+        if tag in tags:
+            names.extend(
+                hook[0] if isinstance(hook, tuple) else hook
+                for hook in hooks
+            )
+    return names
@@ -0,0 +1,99 @@
+"""
+Cached lookups of the plugin settings read on hot paths
+
+The DOAJ token and the push on publication flag are read for every article
+pushed or synched. Their values are kept in the django cache, keyed by
+journal, until any of them is saved or deleted again (see
+invalidate_on_change).
+"""
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from core import models as core_models
+from utils.setting_handler import get_setting
+
+CACHE_PREFIX = "doaj_transporter"
+CACHE_TIMEOUT = 60 * 60
+VERSION_KEY = "%s:version" % CACHE_PREFIX
+CACHED_SETTINGS = {"doaj_api_token", "doaj_publish_push"}
+
+
+def _cache_key(name, journal):
+    version = cache.get_or_set(VERSION_KEY, 1, None)
+    return "%s:%s:%s:%s" % (
+        CACHE_PREFIX, version, name, journal.pk if journal else "press",
+    )
+
+
+def _get_cached(name, journal, loader):
+    key = _cache_key(name, journal)
+    value = cache.get(key)
+    if value is None:
+        value = loader()
+        cache.set(key, value, CACHE_TIMEOUT)
+    return value
+
+
+def get_api_token(journal=None):
+    """ Returns the DOAJ API token for the journal
+    Falls back to the token installed for the press
+    :param journal: journal.models.Journal or None for the press
+    :return: The token or an empty string
+    """
+    def load():
+        setting = get_setting("plugin", "doaj_api_token", journal=journal)
+        token = setting.value if setting else ""
+        if not token and journal:
+            token = get_api_token(None)
+        return token or ""
+    return _get_cached("doaj_api_token", journal, load)
+
+
+def is_push_enabled(journal):
+    """ Returns True if articles of the journal are pushed on publication"""
+    def load():
+        setting = get_setting("plugin", "doaj_publish_push", journal=journal)
+        return bool(setting and setting.processed_value)
+    return _get_cached("doaj_publish_push", journal, load)
+
+
+def get_push_enabled_journals(journals):
+    """ Returns the journals pushing articles on publication
+    Reads the setting of every journal with a single query, for pages
+    listing all the journals of the press
+    :param journals: An iterable of journal.models.Journal
+    :return: A list of journal.models.Journal
+    """
+    values = {
+        setting_value.journal_id: bool(setting_value.processed_value)
+        for setting_value in core_models.SettingValue.objects.filter(
+            setting__group__name="plugin",
+            setting__name="doaj_publish_push",
+        ).select_related("setting")
+    }
+    # Journals without their own value use the default of the press
+    default = values.get(None, False)
+    return [
+        journal for journal in journals
+        if values.get(journal.pk, default)
+    ]
+
+
+def clear_cache():
+    """ Invalidates the cached settings of the press and all its journals"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+@receiver(post_save, sender=core_models.SettingValue,
+          dispatch_uid="doaj_transporter_settings_saved")
+@receiver(post_delete, sender=core_models.SettingValue,
+          dispatch_uid="doaj_transporter_settings_deleted")
+def invalidate_on_change(sender, instance, **kwargs):
+    """ Clears the cache when a cached setting is changed from anywhere
+    (e.g: views.configure, the Janeway settings manager or the admin)
+    """
+    if instance.setting.name in CACHED_SETTINGS:
+        clear_cache()
@@ -0,0 +1,202 @@
+"""
+Runs press wide operations on a pool of worker processes
+
+Journals are independent from each other (they usually have their own DOAJ
+token), so operations over every journal of a press are split into shards
+that run in parallel. Journals with more than DOAJ_SHARD_SIZE published
+articles are further split into ranges of article ids. Each worker process
+has its own database connection, HTTP connections and rate limiters. When
+shards using the same DOAJ token run at the same time, the token rate is
+divided among them.
+
+Usage:
+    results = run_sharded("push", processes=8)
+    failed = [result for result in results if result.error]
+"""
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import os
+import traceback as tb
+
+from django import db
+from django.conf import settings
+from journal import models as journal_models
+from submission import models as sm_models
+from utils.logger import get_logger
+
+from plugins.doaj_transporter import (
+    clients,
+    logic,
+    settings_cache,
+    synch,
+    throttling,
+)
+
+logger = get_logger(__name__)
+
+SHARD_SIZE = 2000
+
+Shard = namedtuple(
+    "Shard", ("operation", "journal_id", "min_pk", "max_pk", "share"))
+ShardResult = namedtuple("ShardResult", ("shard", "result", "error"))
+
+
+def push_shard(articles, journal, **options):
+    """ Pushes the published articles of the shard
+    :return: A dict of error messages keyed by article pk
+    """
+    errors = logic.push_articles_to_doaj(
+        articles.filter(
+            stage=sm_models.STAGE_PUBLISHED,
+            date_published__isnull=False,
+        ),
+        raise_on_error=False,
+        workers=options.get("workers"),
+        force=options.get("force", False),
+    )
+    return {
+        article_id: "%s: %s" % (error.__class__.__name__, error)
+        for article_id, error in errors.items()
+    }
+
+
+def synch_from_janeway_shard(articles, journal, **options):
+    """ Synchs the DOAJ ids of the published articles of the shard
+    :return: The number of articles synched
+    """
+    return len(synch.synch_articles_from_janeway(
+        articles.filter(stage=sm_models.STAGE_PUBLISHED),
+        index=synch.ArticleIndex(journal),
+        push=options.get("push", False),
+        workers=options.get("workers"),
+    ))
+
+
+def synch_from_doaj_shard(articles, journal, **options):
+    """ Pulls the DOAJ records of the journal
+    :return: The number of DOAJ identifiers created
+    """
+    return synch.synch_all_from_doaj(
+        journal,
+        page_size=options.get("page_size"),
+        concurrency=options.get("workers"),
+        incremental=options.get("incremental", True),
+    )
+
+
+OPERATIONS = {
+    "push": push_shard,
+    "synch_from_janeway": synch_from_janeway_shard,
+    "synch_from_doaj": synch_from_doaj_shard,
+}
+# Operations that can't be split within a journal
+JOURNAL_OPERATIONS = {"synch_from_doaj"}
+
+
+def plan_shards(operation, journals=None, processes=None, shard_size=None):
+    """ Splits an operation over the journals into shards
+    :param operation: A key of OPERATIONS
+    :param journals: An iterable of journal.models.Journal, defaults to all
+    :param processes: Number of shards run at the same time
+    :param shard_size: Maximum number of published articles per shard
+    :return: A list of Shard
+    """
+    if operation not in OPERATIONS:
+        raise ValueError("Unknown sharded operation: %s" % operation)
+    if journals is None:
+        journals = journal_models.Journal.objects.all()
+    if shard_size is None:
+        shard_size = getattr(settings, "DOAJ_SHARD_SIZE", SHARD_SIZE)
+    processes = processes or os.cpu_count() or 1
+
+    ranges = []
+    tokens = {}
+    for journal in journals:
+        tokens[journal.pk] = settings_cache.get_api_token(journal)
+        if not tokens[journal.pk]:
+            logger.info("No API token for journal: %s" % journal)
+            continue
+        if operation in JOURNAL_OPERATIONS:
+            ranges.append((journal.pk, None, None))
+            continue
+        pks = list(sm_models.Article.objects.filter(
+            journal=journal,
+            stage=sm_models.STAGE_PUBLISHED,
+        ).order_by("pk").values_list("pk", flat=True))
+        for start in range(0, len(pks), shard_size):
+            chunk = pks[start:start + shard_size]
+            ranges.append((journal.pk, chunk[0], chunk[-1]))
+
+    shards_per_token = Counter(
+        tokens[journal_id] for journal_id, _, _ in ranges)
+    return [
+        Shard(
+            operation, journal_id, min_pk, max_pk,
+            min(shards_per_token[tokens[journal_id]], processes),
+        )
+        for journal_id, min_pk, max_pk in ranges
+    ]
+
+
+def run_sharded(
+    operation, journals=None, processes=None, shard_size=None, **options
+):
+    """ Runs an operation over the journals on a pool of worker processes
+    :param operation: A key of OPERATIONS
+    :param journals: An iterable of journal.models.Journal, defaults to all
+    :param processes: Number of worker processes, defaults to the CPU count
+    :param shard_size: Maximum number of published articles per shard
+    :param options: Passed to the operation (e.g: workers, force)
+    :return: A generator of ShardResult, in completion order
+    """
+    processes = processes or os.cpu_count() or 1
+    shards = plan_shards(operation, journals, processes, shard_size)
+    logger.info(
+        "[DOAJ] Running %s over %d shards on %d processes",
+        operation, len(shards), processes,
+    )
+    if processes < 2 or len(shards) < 2:
+        for shard in shards:
+            yield _run_shard(shard, options)
+        return
+
+    # Forked workers must not share the connections of this process
+    db.connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=min(processes, len(shards)),
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+    ) as executor:
+        futures = {
+            executor.submit(_run_shard, shard, options): shard
+            for shard in shards
+        }
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                # e.g: the worker process died
+                yield ShardResult(futures[future], None, repr(e))
+
+
+def _init_worker():
+    db.connections.close_all()
+    clients.reset_sessions()
+    throttling.reset_limiters()
+
+
+def _run_shard(shard, options):
+    try:
+        journal = journal_models.Journal.objects.get(pk=shard.journal_id)
+        throttling.set_limiter_share(
+            settings_cache.get_api_token(journal), shard.share)
+        articles = sm_models.Article.objects.filter(journal=journal)
+        if shard.min_pk is not None:
+            articles = articles.filter(
+                pk__gte=shard.min_pk, pk__lte=shard.max_pk)
+        result = OPERATIONS[shard.operation](articles, journal, **options)
+        return ShardResult(shard, result, None)
+    except Exception:
+        logger.error("[DOAJ] Error running shard %s", shard)
+        return ShardResult(shard, None, tb.format_exc())
@@ -7,46 +7,206 @@ __author__ = "Birkbeck Centre for Technology and Publishing"
 __license__ = "AGPL v3"
 __maintainer__ = "Birkbeck Centre for Technology and Publishing"
 
-import time
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
 
+from django.db.models import Q
+from django.utils import timezone
 from identifiers.models import Identifier
 from journal import models as journal_models
+from submission.models import Article
 from utils.logger import get_logger
-from utils.setting_handler import get_setting
 
 from plugins.doaj_transporter import (
     clients,
     exceptions,
     logic,
     models,
+    settings_cache,
+    throttling,
 )
 
 logger = get_logger(__name__)
 
+WATERMARK_OVERLAP = timedelta(hours=1)
+DOI_PREFIXES = (
+    "https://doi.org/", "http://doi.org/",
+    "https://dx.doi.org/", "http://dx.doi.org/",
+    "doi:",
+)
+
+
+def normalise_doi(doi):
+    """ Normalises a DOI for matching: lower case and without resolver prefix
+    DOIs are case insensitive, and both Janeway and DOAJ records may store
+    them as URLs
+    """
+    if not doi:
+        return None
+    doi = doi.strip().lower()
+    for prefix in DOI_PREFIXES:
+        if doi.startswith(prefix):
+            doi = doi[len(prefix):].strip()
+            break
+    return doi or None
+
+
+def doi_variants(doi):
+    """ Returns the spellings in which a DOI is most likely to be stored
+    So that identifiers can be looked up with an indexed identifier__in
+    query, before matching them with normalise_doi. That is the DOI as
+    given, in lower and upper case, each bare or with any resolver prefix
+    """
+    doi_key = normalise_doi(doi)
+    if not doi_key:
+        return set()
+    doi = doi.strip()
+    for prefix in DOI_PREFIXES:
+        if doi.lower().startswith(prefix):
+            doi = doi[len(prefix):].strip()
+            break
+    return {
+        prefix + spelling
+        for spelling in (doi, doi_key, doi_key.upper())
+        for prefix in ("", "DOI:") + DOI_PREFIXES
+    }
+
+
+class ArticleIndex(object):
+    """ An in-memory lookup of Janeway articles by DOI and of their DOAJ ids
+
+    Built with a single query per run, so that matching DOAJ records to
+    articles costs a dictionary lookup instead of a query per record
+    """
+    def __init__(self, journal=None, identifiers=None):
+        """
+        :param journal: Index the articles of this journal only
+        :param identifiers: A queryset of Identifier to index instead of all
+            the DOIs and DOAJ ids (of the journal)
+        """
+        self.by_doi = {}
+        self.doaj_ids = defaultdict(set)
+        if identifiers is None:
+            identifiers = Identifier.objects.filter(
+                id_type__in=("doi", "doaj"),
+                article__isnull=False,
+            )
+            if journal:
+                identifiers = identifiers.filter(article__journal=journal)
+        for id_type, identifier, article_id in identifiers.values_list(
+            "id_type", "identifier", "article_id",
+        ):
+            if id_type == "doi":
+                doi = normalise_doi(identifier)
+                if doi:
+                    self.by_doi[doi] = article_id
+            else:
+                self.doaj_ids[article_id].add(identifier)
+
+    @classmethod
+    def for_results(cls, search_results):
+        """ Indexes only the identifiers relevant to the given DOAJ records
+        DOIs are looked up in the spellings given by doi_variants
+        :param search_results: An iterable of ArticleSearchResult
+        """
+        dois, doaj_ids = set(), set()
+        for result in search_results:
+            variants = doi_variants(result.doi)
+            if not variants:
+                continue
+            dois.update(variants)
+            doaj_ids.add(result.id)
+        return cls(identifiers=Identifier.objects.filter(
+            Q(id_type="doi", identifier__in=dois)
+            | Q(id_type="doaj", identifier__in=doaj_ids)
+        ))
+
+    def article_id_for_doi(self, doi):
+        return self.by_doi.get(normalise_doi(doi))
 
-def synch_all_from_doaj(journal=None):
+    def doaj_id_for_article(self, article_id):
+        doaj_ids = self.doaj_ids.get(article_id)
+        return next(iter(doaj_ids)) if doaj_ids else None
+
+    def has_doaj_id(self, article_id, doaj_id):
+        return doaj_id in self.doaj_ids.get(article_id, ())
+
+    def add_doaj_id(self, article_id, doaj_id):
+        self.doaj_ids[article_id].add(doaj_id)
+
+
+def synch_all_from_doaj(
+    journal=None, page_size=None, concurrency=None, incremental=True,
+):
     """ Synchs DOAJ records into Janeway
+    :param journal: an instance of janeway.models.Journal, all journals are
+        synched when not provided
+    :param page_size: Number of records per page of search results
+    :param concurrency: Number of pages fetched at once
+    :param incremental: Only fetch the records updated in DOAJ since the
+        last synch of the journal (see models.DOAJSynchState)
+    :return: The number of DOAJ identifiers created
     """
+    if page_size is None:
+        page_size = clients.ArticleSearchClient.MAX_PAGE_SIZE
+    if concurrency is None:
+        concurrency = throttling.PushExecutor().workers
     if journal:
         journals = [journal]
     else:
         journals = journal_models.Journal.objects.all()
+    total = 0
     for j in journals:
-        api_token = get_setting("plugin", "doaj_api_token", journal=j)
+        api_token = settings_cache.get_api_token(j)
         if api_token:
             logger.info("Pulling DOAJ records for: %s" % j)
-            search_client = clients.ArticleSearchClient(api_token)
+            search_client = clients.ArticleSearchClient(
+                api_token,
+                # Only the id, DOI and last_updated of the records are read
+                lazy=True,
+                prefetch=True,
+                page_size=page_size,
+                concurrency=concurrency,
+            )
             if j.issn:
-                results = search_client.search_by_eissn(j.issn)
-                for result in results:
-                    created = synch_result_from_doaj(result)
-            logger.info("Sleeping thread for 200ms")
-            time.sleep(0.2)
+                state, _ = models.DOAJSynchState.objects.get_or_create(
+                    journal=j)
+                since = None
+                if incremental and state.last_updated:
+                    # Overlap runs in case DOAJ indexed records late
+                    since = state.last_updated - WATERMARK_OVERLAP
+                    logger.info("Pulling records updated since %s", since)
+                results = search_client.search_by_eissn(
+                    j.issn, updated_since=since)
+                created = synch_results_from_doaj(
+                    _track_last_updated(results, state),
+                    batch_size=page_size,
+                    index=ArticleIndex(j),
+                )
+                state.date_time = timezone.now()
+                state.save()
+                logger.info("Matched %d new DOAJ records for %s", created, j)
+                total += created
         else:
             logger.info("No API token for journal: %s" % j)
+    return total
+
 
+def _track_last_updated(search_results, state):
+    """ Raises the high-water mark of the state as the results are consumed
+    The state is only saved by the caller once all results are processed
+    """
+    for result in search_results:
+        last_updated = result.last_updated
+        if last_updated and (
+            state.last_updated is None or last_updated > state.last_updated
+        ):
+            state.last_updated = last_updated
+        yield result
 
-def synch_result_from_doaj(search_result):
+
+def synch_result_from_doaj(search_result, index=None):
     """ Synch a single DOAJ Article record into Janeway
     The DOAJ result must match an article in Janeway by DOI. The record
     created is an instance of models.DOAJRecord. Importing actual articles
@@ -54,14 +214,35 @@ def synch_result_from_doaj(search_result):
     journals (only possible by either title or ISSN)
 
     :param search_result: An instance of ArticleSearchResult
+    :param index: An optional ArticleIndex to match the DOI against
     :return: A Bool indicated if a record has been created
     """
     created = False
     if search_result.doi:
         logger.info("Processing article with doi %s" % search_result.doi)
-        try:
-            doi = Identifier.objects.get(
-                id_type="doi", identifier=search_result.doi)
+        if index is not None:
+            article_id = index.article_id_for_doi(search_result.doi)
+            if article_id is None:
+                logger.warning(
+                    "No article found for DOI %s", search_result.doi)
+            elif not index.has_doaj_id(article_id, search_result.id):
+                doaj_id, created = Identifier.objects.get_or_create(
+                    article_id=article_id,
+                    id_type="doaj",
+                    identifier=search_result.id,
+                )
+                index.add_doaj_id(article_id, search_result.id)
+                logger.info(
+                    "Matched %s to article %s", search_result.id, article_id)
+            return created
+        doi = Identifier.objects.filter(
+            id_type="doi",
+            identifier__in=doi_variants(search_result.doi),
+            article__isnull=False,
+        ).select_related("article").first()
+        if doi is None:
+            logger.warning("No article found for DOI %s", search_result.doi)
+        else:
             doaj_id, created = Identifier.objects.get_or_create(
                 article=doi.article,
                 id_type="doaj",
@@ -71,60 +252,178 @@ def synch_result_from_doaj(search_result):
                 logger.debug("Matched %s to %s", search_result, doi.article)
                 logger.info(
                     "Matched %s to article %s", search_result.id, doi.article.pk)
-        except Identifier.DoesNotExist:
-            logger.warning("No article found for DOI %s", search_result.doi)
     return created
 
 
-def synch_all_from_janeway(journal=None, push=False):
+def synch_results_from_doaj(search_results, batch_size=100, index=None):
+    """ Synch DOAJ Article records into Janeway in batches
+    Behaves like synch_result_from_doaj, but the DOIs and DOAJ ids of each
+    batch are looked up with a single query, and the missing DOAJ
+    identifiers are created in bulk. When an ArticleIndex
+    is given, matching is done in memory and only the inserts hit the DB.
+    :param search_results: An iterable of ArticleSearchResult
+    :param batch_size: Number of records reconciled at once
+    :param index: An optional ArticleIndex to match the DOIs against
+    :return: The number of DOAJ identifiers created
+    """
+    created = 0
+    search_results = iter(search_results)
+    while True:
+        batch = list(islice(search_results, batch_size))
+        if not batch:
+            break
+        created += _synch_batch_from_doaj(batch, index)
+    return created
+
+
+def _synch_batch_from_doaj(search_results, index=None):
+    by_doi = {
+        normalise_doi(result.doi): result
+        for result in search_results if result.doi
+    }
+    by_doi.pop(None, None)
+    if not by_doi:
+        return 0
+
+    if index is None:
+        index = ArticleIndex.for_results(by_doi.values())
+
+    new_ids = []
+    for doi, result in by_doi.items():
+        article_id = index.article_id_for_doi(doi)
+        if article_id is None:
+            logger.warning("No article found for DOI %s", result.doi)
+        elif not index.has_doaj_id(article_id, result.id):
+            logger.info("Matched %s to article %s", result.id, article_id)
+            index.add_doaj_id(article_id, result.id)
+            new_ids.append(Identifier(
+                article_id=article_id,
+                id_type="doaj",
+                identifier=result.id,
+            ))
+    Identifier.objects.bulk_create(new_ids)
+    return len(new_ids)
+
+
+def synch_all_from_janeway(journal=None, push=False, workers=None):
     """ Downloads DOAJ records for articles existing in the Janeway install
     Articles are looked up by DOI
     :param journal: an instance of janeway.models.Journal
     :param push (bool): Whether or not to push missing records to DOAJ
+    :param workers: Number of concurrent workers (see PushExecutor)
     :return: A list of article PKs of those articles that have been synched
     """
     if journal:
         journals = [journal]
     else:
         journals = journal_models.Journal.objects.all()
+
+    synched = []
     for j in journals:
-        for article in journal.article_set.filter(stage="Published"):
-            doi = article.get_doi()
-            if doi:
-                obj, c = synch_article_from_janeway(article)
-                if push:
-                    logic.push_article_to_doaj(article)
-                logger.info("Thread Sleeping for 200ms")
-                time.sleep(0.20)
+        synched.extend(synch_articles_from_janeway(
+            j.article_set.filter(stage="Published"),
+            index=ArticleIndex(j),
+            push=push,
+            workers=workers,
+        ))
+    return synched
 
 
-def synch_article_from_janeway(article):
+def synch_articles_from_janeway(
+    articles, index=None, push=False, workers=None,
+):
+    """ Downloads the DOAJ records of the given articles
+    The DOAJ searches run concurrently, while the DOAJ ids found are saved
+    from the calling thread as the searches complete
+    :param articles: An iterable of janeway.models.Article. Articles without
+        a DOI are skipped
+    :param index: An optional ArticleIndex holding the known DOAJ ids
+    :param push (bool): Whether or not to push missing records to DOAJ
+    :param workers: Number of concurrent workers (see PushExecutor)
+    :return: A list of article PKs of those articles that have been synched
+    """
+    synched = []
+    searches = []
+    for article in articles:
+        doi = article.get_doi()
+        if not doi:
+            continue
+        if _known_doaj_id(article, index) is None:
+            api_token = settings_cache.get_api_token(article.journal)
+            searches.append((article, doi, api_token))
+        else:
+            synched.append(article.pk)
+
+    executor = throttling.PushExecutor(workers)
+    for (article, _, _), doaj_id, error in executor.map(
+        lambda search: search_doaj_id(*search[1:]), searches,
+    ):
+        if not error:
+            _save_doaj_id(article, doaj_id, index)
+            synched.append(article.pk)
+
+    if push and synched:
+        logic.push_articles_to_doaj(
+            Article.objects.filter(pk__in=synched),
+            raise_on_error=False,
+            workers=workers,
+        )
+    return synched
+
+
+def synch_article_from_janeway(article, index=None):
     """ Downloads DOAJ record for an article in Janeway
     :param article: an instance of janeway.models.Article
+    :param index: An optional ArticleIndex holding the known DOAJ ids
     :return: A tuple with the local record and bool flagging its creation
     """
-    doi = article.get_doi()
-    api_token = get_setting(
-        "plugin", "doaj_api_token", journal=article.journal)
-    created = obj = None
-    try:
-        doaj_id = Identifier.objects.get(
-            id_type="doaj", article=article
-        ).identifier
-    except Identifier.DoesNotExist:
-        search_client = clients.ArticleSearchClient(api_token)
-        results = search_client.search_by_doi(doi)
-        try:
-            logger.debug("Searching DOAJ with DOI %s" % doi)
-            doaj_id = next(results).id
-            doaj_id, created = Identifier.objects.get_or_create(
-                article=article,
-                id_type="doaj",
-                identifier=doaj_id,
-            )
-            if created:
-                logger.info("New DOAJ record for article %s ", article.pk)
+    if _known_doaj_id(article, index) is not None:
+        return None, None
+    doaj_id = search_doaj_id(
+        article.get_doi(), settings_cache.get_api_token(article.journal))
+    return _save_doaj_id(article, doaj_id, index)
+
+
+def search_doaj_id(doi, api_token):
+    """ Searches DOAJ for the record of the given DOI
+    Doesn't touch the database, so that it can run on worker threads
+    :param doi: The DOI of the article
+    :param api_token: The DOAJ API token of the article's journal
+    :return: The DOAJ id of the record or None if not found
+    """
+    search_client = clients.ArticleSearchClient(api_token, lazy=True)
+    results = search_client.search_by_doi(doi)
+    logger.debug("Searching DOAJ with DOI %s" % doi)
+    # The DOI search is not exact, only accept the record with our DOI
+    result = next(
+        (
+            r for r in islice(results, search_client.page_size)
+            if normalise_doi(r.doi) == normalise_doi(doi)
+        ),
+        None,
+    )
+    return result.id if result else None
+
+
+def _known_doaj_id(article, index=None):
+    if index is not None:
+        return index.doaj_id_for_article(article.pk)
+    return Identifier.objects.filter(
+        id_type="doaj", article=article,
+    ).values_list("identifier", flat=True).first()
+
 
-        except StopIteration:
-            logger.info("Article %s is not on DOAJ", article.pk)
+def _save_doaj_id(article, doaj_id, index=None):
+    if doaj_id is None:
+        logger.info("Article %s is not on DOAJ", article.pk)
+        return None, None
+    obj, created = Identifier.objects.get_or_create(
+        article=article,
+        id_type="doaj",
+        identifier=doaj_id,
+    )
+    if index is not None:
+        index.add_doaj_id(article.pk, doaj_id)
+    if created:
+        logger.info("New DOAJ record for article %s ", article.pk)
     return obj, created
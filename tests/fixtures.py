@@ -0,0 +1,65 @@
+import json
+
+
+def make_record(i):
+    """ Returns an article record as found in DOAJ search results"""
+    return {
+        "id": "%032x" % i,
+        "created_date": "2020-01-01T10:00:00Z",
+        "last_updated": "2021-06-01T10:00:00Z",
+        "admin": {"in_doaj": True, "seal": False},
+        "bibjson": {
+            "title": "Article number %d" % i,
+            "abstract": "An abstract",
+            "year": "2020",
+            "month": "6",
+            "start_page": "1",
+            "end_page": "20",
+            "author": [{
+                "name": "An author",
+                "affiliation": "Birkbeck, University of London",
+                "orcid_id": "https://orcid.org/0000-0002-1825-0097",
+            }],
+            "identifier": [
+                {"type": "doi", "id": "10.1234/article.%d" % i},
+                {"type": "eissn", "id": "1234-5678"},
+            ],
+            "journal": {
+                "title": "A journal",
+                "publisher": "A publisher",
+                "country": "GB",
+                "language": ["EN"],
+                "issns": ["1234-5678"],
+                "volume": "1",
+                "number": "2",
+                "license": [{
+                    "open_access": True,
+                    "title": "CC BY",
+                    "type": "CC BY",
+                    "url": "https://creativecommons.org/licenses/by/4.0/",
+                    "version": "4.0",
+                }],
+            },
+            "keywords": ["open", "access"],
+            "link": [{
+                "type": "fulltext",
+                "content_type": "html",
+                "url": "https://example.org/article/%d" % i,
+            }],
+            "subject": [{"code": "H", "scheme": "LCC", "term": "Social"}],
+        },
+    }
+
+
+def make_page(results):
+    """ Returns the JSON body of a DOAJ article search page"""
+    return json.dumps({
+        "total": results * 10,
+        "page": 1,
+        "pageSize": results,
+        "timestamp": "2021-06-01T10:00:00Z",
+        "query": "issn:1234-5678",
+        "next": "https://doaj.org/api/v4/search/articles/x?page=2",
+        "last": "https://doaj.org/api/v4/search/articles/x?page=10",
+        "results": [make_record(i) for i in range(results)],
+    })
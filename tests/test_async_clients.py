@@ -0,0 +1,160 @@
+import asyncio
+import json
+from unittest import mock, skipIf
+
+from django.test import TestCase
+from django.utils import timezone
+import requests
+
+from identifiers import models as id_models
+from submission.models import Article
+from utils.testing import helpers
+
+from plugins.doaj_transporter import async_clients, exceptions, models
+from plugins.doaj_transporter.tests.fixtures import make_record
+from plugins.doaj_transporter.throttling import TokenBucket
+
+httpx = async_clients.httpx
+
+
+def mock_transport(handler):
+    """ Serves the requests made from the running loop with handler"""
+    transport = async_clients.AsyncTransport(
+        transport=httpx.MockTransport(handler))
+    async_clients._transports[asyncio.get_running_loop()] = transport
+    return transport
+
+
+def search_page(ids, next_url=None):
+    return {
+        "total": 3,
+        "page": 1,
+        "pageSize": 2,
+        "next": next_url,
+        "results": [make_record(i) for i in ids],
+    }
+
+
+@skipIf(httpx is None, "httpx is not installed")
+class TestAsyncClients(TestCase):
+    def setUp(self):
+        helpers.create_press()
+        self.journal, _ = helpers.create_journals()
+        self.article = Article.objects.create(
+            journal=self.journal,
+            title="An async test",
+            date_published=timezone.now(),
+        )
+        self.limiter = TokenBucket(rate=100)
+        patcher = mock.patch.object(
+            async_clients.throttling, "get_limiter",
+            return_value=self.limiter,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _doaj_article(self, doaj_id=None):
+        """ The encoding of articles is covered by the sync client tests"""
+        doaj_article = async_clients.AsyncDOAJArticle("token")
+        doaj_article.janeway_article = self.article
+        doaj_article.id = doaj_id
+        doaj_article.encode = lambda: '{"bibjson": {}}'
+        return doaj_article
+
+    async def test_rate_limited_requests_are_retried(self):
+        statuses = iter([429, 200])
+
+        def handler(request):
+            status_code = next(statuses)
+            if status_code == 429:
+                return httpx.Response(429, headers={"Retry-After": "0"})
+            return httpx.Response(200, json={"status": "ok"})
+
+        with mock.patch.object(
+            self.limiter, "pause", wraps=self.limiter.pause,
+        ) as pause:
+            async with mock_transport(handler) as transport:
+                response = await transport.request(
+                    "GET", "https://doaj.org/api/v4/articles/x", "token",
+                    timeout=(5, 10),
+                )
+        self.assertTrue(response.ok)
+        pause.assert_called_once_with(0)
+
+    async def test_insert_article(self):
+        requests_made = []
+
+        def handler(request):
+            requests_made.append(request)
+            return httpx.Response(
+                201, json={"status": "created", "id": "new_id"})
+
+        doaj_article = self._doaj_article()
+        async with mock_transport(handler):
+            await doaj_article.upsert()
+
+        self.assertEqual(requests_made[0].method, "POST")
+        self.assertEqual(
+            requests_made[0].url.path, "/api/v4/articles")
+        self.assertEqual(doaj_article.id, "new_id")
+        self.assertTrue(await async_clients.sync_to_async(
+            id_models.Identifier.objects.filter(
+                article=self.article, id_type="doaj", identifier="new_id",
+            ).exists
+        )())
+        self.assertTrue(await async_clients.sync_to_async(
+            models.DOAJDeposit.objects.filter(
+                article=self.article, success=True,
+            ).exists
+        )())
+
+    async def test_errors_are_mapped_to_exceptions(self):
+        expected = [
+            (401, exceptions.InvalidDOAJToken),
+            (400, exceptions.BadRequest),
+            (500, requests.HTTPError),
+        ]
+        for status_code, exception in expected:
+            def handler(request):
+                return httpx.Response(status_code, json={"error": "error"})
+
+            async with mock_transport(handler):
+                with self.assertRaises(exception):
+                    await self._doaj_article().upsert()
+
+        def unreachable(request):
+            raise httpx.ConnectError("Connection refused")
+
+        async with mock_transport(unreachable):
+            with self.assertRaises(exceptions.RequestFailed):
+                await self._doaj_article().upsert()
+
+    async def test_non_json_responses(self):
+        def handler(request):
+            if request.method == "PUT":
+                return httpx.Response(502, text="<html>Bad Gateway</html>")
+            return httpx.Response(200, text="OK")
+
+        async with mock_transport(handler):
+            response = await self._doaj_article()._post(article_id="")
+            self.assertTrue(response.ok)
+            with self.assertRaises(requests.HTTPError):
+                await self._doaj_article("doaj_id").upsert()
+
+    async def test_search_follows_next_pages(self):
+        next_url = "https://doaj.org/api/v4/search/articles/x?page=2"
+
+        def handler(request):
+            if request.url.params.get("page") == "2":
+                return httpx.Response(200, json=search_page([2]))
+            return httpx.Response(200, json=search_page([0, 1], next_url))
+
+        client = async_clients.AsyncArticleSearchClient("token")
+        async with mock_transport(handler):
+            await client.search("1234-5678", prefix="issn")
+            results = [result.id async for result in client]
+
+        self.assertEqual(
+            results, [make_record(i)["id"] for i in range(3)])
+        with self.assertRaises(TypeError):
+            iter(client)
@@ -1,11 +1,15 @@
 import datetime
+import json
+import re
+import threading
 from unittest import mock
 
 from core import models as core_models
 from django.conf import settings
 from django.core.management import call_command
-from django.test import TestCase, override_settings
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.utils import timezone
+import requests
 
 from identifiers import models as id_models
 from journal.models import Journal, Issue
@@ -15,7 +19,15 @@ from submission.models import FrozenAuthor
 from utils.testing import helpers
 from utils import install
 
-from plugins.doaj_transporter.clients import DOAJArticle, ArticleSearchClient
+from plugins.doaj_transporter import exceptions, logic, models
+from plugins.doaj_transporter.clients import (
+    ApplicationSearchClient,
+    ArticleBulkClient,
+    ArticleSearchClient,
+    DOAJArticle,
+    loggable_body,
+    parse_json,
+)
 
 SETTINGS_PATH = "plugins/doaj_transporter/install/settings.json"
 
@@ -209,6 +221,99 @@ class TestDOAJArticleClient(TestCase):
                 identifier="test",
             )
 
+    def test_upsert_recreates_records_with_immutable_changes(self):
+        id_models.Identifier.objects.create(
+            article=self.article,
+            id_type="doaj",
+            identifier="test",
+        )
+        doaj_article = DOAJArticle.from_article_model(self.article)
+        with mock.patch.object(
+            doaj_article, "_put",
+            side_effect=exceptions.ImmutableFieldChanged(self.article),
+        ), mock.patch.object(
+            doaj_article, "_delete", return_value=None,
+        ) as delete, mock.patch.object(
+            doaj_article, "_post", return_value=None,
+        ) as post:
+            with self.assertRaises(exceptions.ImmutableFieldChanged):
+                doaj_article.upsert(force_delete=False)
+            delete.assert_not_called()
+
+            doaj_article.upsert(force_delete=True)
+        delete.assert_called_once_with("api_key=", article_id="test")
+        post.assert_called_once_with("api_key=", article_id="")
+
+    @override_settings(DEBUG=False)
+    def test_bulk_rejections_are_pushed_one_by_one_on_force_delete(self):
+        rejected = exceptions.BadRequest("Rejected")
+        with mock.patch.object(
+            ArticleBulkClient, "update",
+            return_value=({}, {self.article.pk: rejected}),
+        ), mock.patch.object(
+            logic, "upsert_articles_one_by_one", return_value={},
+        ) as upsert:
+            errors = logic.push_articles_to_doaj(
+                [self.article], raise_on_error=False)
+            self.assertEqual(errors, {self.article.pk: rejected})
+            upsert.assert_not_called()
+
+            errors = logic.push_articles_to_doaj(
+                [self.article], raise_on_error=False, force_delete=True)
+        self.assertEqual(errors, {})
+        self.assertEqual(
+            list(upsert.call_args[0][0]), [self.article])
+        self.assertTrue(upsert.call_args[1]["force_delete"])
+
+    def test_deferred_writes_wait_for_the_caller(self):
+        id_models.Identifier.objects.create(
+            article=self.article,
+            id_type="doaj",
+            identifier="test",
+        )
+        doaj_article = DOAJArticle.from_article_model(self.article)
+        doaj_article.defer_writes()
+        with mock.patch.object(doaj_article, "_delete", return_value=None):
+            doaj_article.delete()
+        self.assertIsNone(doaj_article.id)
+        self.assertEqual(self.article.get_identifier("doaj"), "test")
+        self.assertFalse(models.DOAJDeposit.objects.exists())
+
+        doaj_article.apply_writes()
+        self.assertIsNone(self.article.get_identifier("doaj"))
+        self.assertEqual(
+            models.DOAJDeposit.objects.get().identifier, "test")
+
+    @override_settings(DEBUG=False)
+    def test_upsert_one_by_one_saves_on_the_calling_thread(self):
+        caller = threading.get_ident()
+        request_threads = []
+
+        def put(doaj_article, *args, **kwargs):
+            request_threads.append(threading.get_ident())
+            return MockResponse('{"status": "updated"}')
+
+        articles = [self.article, Article.objects.create(
+            journal=self.journal,
+            title="Another article",
+            date_published=timezone.now(),
+        )]
+        for i, article in enumerate(articles):
+            id_models.Identifier.objects.create(
+                article=article, id_type="doaj", identifier="test_%d" % i)
+        with mock.patch.object(
+            DOAJArticle, "_put", autospec=True, side_effect=put,
+        ):
+            errors = logic.upsert_articles_one_by_one(
+                articles, force=True, workers=2)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(len(request_threads), 2)
+        self.assertNotIn(caller, request_threads)
+        # Written from the caller, within the transaction of the test
+        self.assertEqual(
+            models.DOAJDeposit.objects.filter(success=True).count(), 2)
+
     @override_settings(DOAJ_API_TOKEN="dummy_key")
     def test_decode_article(self):
         expected = DOAJArticle.from_article_model(self.article)
@@ -219,6 +324,189 @@ class TestDOAJArticleClient(TestCase):
         self.assertEqual(expected, result)
 
 
+    def test_bulk_update_articles(self):
+        doaj_article = DOAJArticle.from_article_model(self.article)
+        bulk_client = ArticleBulkClient("", [doaj_article])
+        response = mock.Mock(ok=True, text="")
+        response.json.return_value = [
+            {"status": "created", "id": "bulk_id", "location": "/bulk_id"},
+        ]
+        with mock.patch.object(
+            bulk_client, "_post", return_value=response) as caller:
+            created, errors = bulk_client.update()
+
+        caller.assert_called_once_with(
+            "api_key=", body="[%s]" % doaj_article.encode(), decode=False)
+        self.assertEqual(created, {self.article.pk: "bulk_id"})
+        self.assertEqual(errors, {})
+        self.assertEqual(self.article.get_identifier("doaj"), "bulk_id")
+        self.assertTrue(
+            models.DOAJDeposit.objects.get(article=self.article).success)
+
+    def test_bulk_update_isolates_bad_articles(self):
+        other_article = self._create_article(title="A second article")
+        bulk_client = ArticleBulkClient("", [
+            DOAJArticle.from_article_model(self.article),
+            DOAJArticle.from_article_model(other_article),
+        ])
+        response = mock.Mock(ok=True, text="")
+        response.json.return_value = [
+            {"status": "created", "id": "bulk_id"},
+        ]
+
+        def post(querystring, body, decode):
+            if "A second article" in body:
+                raise exceptions.BadRequest(body)
+            return response
+
+        with mock.patch.object(
+            bulk_client, "_post", side_effect=post) as caller:
+            created, errors = bulk_client.update()
+
+        self.assertEqual(caller.call_count, 3)
+        self.assertEqual(created, {self.article.pk: "bulk_id"})
+        self.assertEqual(list(errors), [other_article.pk])
+
+    def test_bulk_results_missing_from_reply(self):
+        bulk_client = ArticleBulkClient(
+            "", [DOAJArticle.from_article_model(self.article)])
+        response = mock.Mock(ok=True, text="")
+        response.json.return_value = []
+        with mock.patch.object(bulk_client, "_post", return_value=response):
+            created, errors = bulk_client.update()
+
+        self.assertEqual(created, {})
+        self.assertIsInstance(
+            errors[self.article.pk], exceptions.MissingResult)
+
+    def test_non_json_error_pages_fail_the_request(self):
+        response = mock.Mock(status_code=502, ok=False, text="<html></html>")
+        response.json.side_effect = ValueError("Not JSON")
+        response.raise_for_status.side_effect = requests.HTTPError(
+            response=response)
+        client = DOAJArticle("")
+        with self.assertRaises(exceptions.RequestFailed):
+            client._fetch(
+                "https://doaj.org/api/articles",
+                mock.Mock(return_value=response),
+            )
+
+    def test_bulk_results_are_saved_on_the_calling_thread(self):
+        bulk_client = ArticleBulkClient("", [
+            DOAJArticle.from_article_model(self.article) for _ in range(2)])
+        bulk_client.MAX_BATCH_SIZE = 1
+        threads = []
+        with mock.patch.object(
+            bulk_client, "_post", return_value=mock.Mock(ok=True),
+        ), mock.patch.object(
+            bulk_client, "_log_results",
+            side_effect=lambda *args: threads.append(
+                threading.current_thread()),
+        ):
+            bulk_client.update(workers=2)
+        self.assertEqual(threads, [threading.current_thread()] * 2)
+
+    def test_bulk_chunks_are_size_limited(self):
+        doaj_articles = [
+            DOAJArticle.from_article_model(self.article) for _ in range(5)]
+        bulk_client = ArticleBulkClient("", doaj_articles)
+        bulk_client.MAX_BATCH_SIZE = 2
+        chunks = list(bulk_client._chunks())
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+
+
+    def test_bulk_delete_articles(self):
+        id_models.Identifier.objects.create(
+            article=self.article,
+            id_type="doaj",
+            identifier="test",
+        )
+        bulk_client = ArticleBulkClient("")
+        with mock.patch.object(
+            bulk_client, "_delete", return_value=None) as caller:
+            deleted, errors = bulk_client.delete(["test"])
+
+        caller.assert_called_once_with("api_key=", body='["test"]')
+        self.assertEqual(deleted, ["test"])
+        self.assertEqual(errors, {})
+        self.assertFalse(id_models.Identifier.objects.filter(
+            article=self.article, id_type="doaj").exists())
+        self.assertEqual(
+            models.DOAJDeposit.objects.get(article=self.article).identifier,
+            "test",
+        )
+
+    def test_push_skips_unchanged_articles(self):
+        id_models.Identifier.objects.create(
+            article=self.article,
+            id_type="doaj",
+            identifier="test",
+        )
+        models.DOAJDeposit.objects.create(
+            article=self.article,
+            identifier="test",
+            success=True,
+            payload_hash=DOAJArticle.from_article_model(
+                self.article).payload_hash(),
+        )
+        with mock.patch.object(DOAJArticle, "upsert") as upsert:
+            logic.push_article_to_doaj(self.article)
+            upsert.assert_not_called()
+            logic.push_article_to_doaj(self.article, force=True)
+            upsert.assert_called_once()
+
+    @override_settings(DEBUG=False)
+    def test_bulk_push_encodes_articles_once(self):
+        id_models.Identifier.objects.create(
+            article=self.article,
+            id_type="doaj",
+            identifier="test",
+        )
+        response = mock.Mock(ok=True)
+        response.json.return_value = [{"status": "updated", "id": "test"}]
+        encode = DOAJArticle.encode
+        with mock.patch.object(
+            DOAJArticle, "encode", autospec=True, side_effect=encode,
+        ) as encoder, mock.patch.object(
+            ArticleBulkClient, "_post", return_value=response,
+        ):
+            errors = logic.push_articles_to_doaj([self.article])
+
+        self.assertEqual(errors, {})
+        self.assertEqual(encoder.call_count, 1)
+        self.assertEqual(
+            logic.get_pushed_hashes([self.article.pk]),
+            {self.article.pk: DOAJArticle.from_article_model(
+                self.article).payload_hash()},
+        )
+
+    def test_pushed_hashes_break_ties_by_pk(self):
+        id_models.Identifier.objects.create(
+            article=self.article,
+            id_type="doaj",
+            identifier="test",
+        )
+        date_time = timezone.now()
+        for payload_hash in ("older", "newer"):
+            models.DOAJDeposit.objects.create(
+                article=self.article,
+                success=True,
+                payload_hash=payload_hash,
+                date_time=date_time,
+            )
+        self.assertEqual(
+            logic.get_pushed_hashes([self.article.pk]),
+            {self.article.pk: "newer"},
+        )
+
+    def test_client_from_article_queryset(self):
+        expected = DOAJArticle.from_article_model(self.article)
+        doaj_articles = list(DOAJArticle.from_article_queryset(
+            Article.objects.filter(pk=self.article.pk)))
+
+        self.assertEqual(len(doaj_articles), 1)
+        self.assertJSONEqual(doaj_articles[0].encode(), expected.encode())
+
 
 class TestArticleSearch(TestCase):
     def test_search(self):
@@ -250,3 +538,69 @@ class TestArticleSearch(TestCase):
             client.search("10.001/mock.01")
             self.assertTrue(client.one().in_doaj)
 
+
+    def test_search_query_is_quoted(self):
+        client = ArticleSearchClient("")
+        _, search_query = client._build_search(
+            "1234-5678 AND last_updated:[2021-01-01T00:00:00Z TO *]",
+            prefix="issn",
+        )
+        self.assertEqual(
+            search_query,
+            "issn:1234-5678%20AND%20last_updated:"
+            "%5B2021-01-01T00:00:00Z%20TO%20%2A%5D",
+        )
+
+    def test_search_follows_next_pages(self):
+        pages = [
+            {"results": [{"id": "one"}], "next": "https://doaj.org/page/2"},
+            {"results": [{"id": "two"}], "next": "https://doaj.org/page/3"},
+            {"results": [{"id": "three"}]},
+        ]
+        for prefetch in (False, True):
+            client = ApplicationSearchClient("", prefetch=prefetch)
+            remaining = iter(pages)
+
+            def fetch(url, method, decode=True, **kwargs):
+                page = json.dumps(dict(
+                    next(remaining), total=3, page=1, pageSize=1))
+                if decode:
+                    client._decode(page)
+                response = mock.Mock(text=page)
+                response.json.return_value = json.loads(page)
+                return response
+
+            with mock.patch.object(client, "_fetch", side_effect=fetch):
+                results = [r.id for r in client.search("0000-0000")]
+            self.assertEqual(results, ["one", "two", "three"])
+
+    def test_search_fetches_pages_in_parallel(self):
+        client = ApplicationSearchClient("", page_size=1, concurrency=3)
+        client._decode(json.dumps({
+            "results": [{"id": "1"}], "next": "https://doaj.org/page/2",
+            "total": 5, "page": 1, "pageSize": 1,
+        }))
+        client._search_query = "issn:0000-0000"
+
+        def load_page(url):
+            page = int(re.search(r"page=(\d+)", url).group(1))
+            return {"results": [mock.Mock(id=str(page))], "page": page}
+
+        with mock.patch.object(client, "_load_page", side_effect=load_page):
+            results = [r.id for r in client]
+        self.assertEqual(results, ["1", "2", "3", "4", "5"])
+
+
+class TestResponseParsing(SimpleTestCase):
+    def test_body_is_parsed_once(self):
+        response = mock.Mock(ok=True)
+        response.json.return_value = {"results": []}
+        self.assertIs(parse_json(response), parse_json(response))
+        response.json.assert_called_once_with()
+
+    def test_logged_bodies_are_truncated(self):
+        response = mock.Mock(text="x" * 50)
+        self.assertEqual(
+            loggable_body(response, max_length=10),
+            "xxxxxxxxxx... (50 characters)",
+        )
@@ -0,0 +1,46 @@
+from django.test import SimpleTestCase
+
+from plugins.doaj_transporter import schemas, serializers
+from plugins.doaj_transporter.data_structs import (
+    AuthorStruct,
+    BibjsonStruct,
+    IdentifierStruct,
+)
+
+
+class TestStructs(SimpleTestCase):
+    def test_missing_arguments_leave_slots_unset(self):
+        author = AuthorStruct("A", orcid_id=None)
+        self.assertFalse(hasattr(author, "affiliation"))
+        self.assertEqual(author.to_tuple(), ("A", None, None))
+        self.assertEqual(
+            serializers.Codec(schemas.AuthorSchema).dumps(author),
+            '{"name": "A", "orcid_id": null}',
+        )
+
+    def test_structs_compare_by_value(self):
+        identifiers = [
+            IdentifierStruct("doi", "10.1234/a"),
+            IdentifierStruct(type="doi", id="10.1234/a"),
+            IdentifierStruct.from_tuple(("eissn", "1234-5678")),
+        ]
+        self.assertEqual(identifiers[0], identifiers[1])
+        self.assertNotEqual(identifiers[0], identifiers[2])
+        self.assertEqual(len(set(identifiers)), 2)
+        self.assertEqual(AuthorStruct(name="A"), AuthorStruct("A", None))
+        self.assertEqual(
+            hash(AuthorStruct(name="A")), hash(AuthorStruct("A", None)))
+
+    def test_structs_holding_lists_are_hashable(self):
+        def bibjson():
+            return BibjsonStruct(
+                title="A",
+                keywords=["open", "access"],
+                author=[AuthorStruct(name="A")],
+            )
+        self.assertEqual(hash(bibjson()), hash(bibjson()))
+        self.assertEqual(len({bibjson(), bibjson()}), 1)
+
+        changed = bibjson()
+        changed.keywords.append("journals")
+        self.assertNotIn(changed, {bibjson()})
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from submission.models import Article as JanewayArticle
+from utils.testing import helpers
+
+from plugins.doaj_transporter import models
+
+
+class TestArticleLatestDeposit(TestCase):
+    def setUp(self):
+        helpers.create_press()
+        self.journal, _ = helpers.create_journals()
+        now = timezone.now()
+        for i in range(3):
+            article = JanewayArticle.objects.create(
+                journal=self.journal, title="Listed article %d" % i)
+            models.DOAJDeposit.objects.create(
+                article=article, success=False,
+                date_time=now - timedelta(days=1),
+            )
+            models.DOAJDeposit.objects.create(
+                article=article, success=True, result_text="latest",
+                date_time=now,
+            )
+
+    def test_listing_in_constant_queries(self):
+        # The articles and their prefetched identifiers and deposits
+        with self.assertNumQueries(3):
+            articles = list(models.Article.objects.with_latest_deposit(
+            ).filter(journal=self.journal))
+            deposits = [article.latest_deposit() for article in articles]
+            [article.get_doaj_id() for article in articles]
+        self.assertEqual(len(deposits), 3)
+        # Older deposits are not loaded
+        self.assertEqual(
+            [len(article.latest_deposits) for article in articles], [1] * 3)
+        self.assertTrue(all(deposit.success for deposit in deposits))
+        self.assertEqual(deposits[0].result_text, "latest")
@@ -0,0 +1,225 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+import requests
+
+from submission.models import Article, STAGE_PUBLISHED
+from utils.testing import helpers
+
+from plugins.doaj_transporter import exceptions, models, push_queue
+
+
+@override_settings(DOAJ_PUSH_QUEUE_THREAD=False)
+class TestPushJobs(TestCase):
+    def setUp(self):
+        helpers.create_press()
+        self.journal, _ = helpers.create_journals()
+        self.articles = [
+            Article.objects.create(
+                journal=self.journal,
+                title="Queued article %d" % i,
+                stage=STAGE_PUBLISHED,
+                date_published=timezone.now(),
+            )
+            for i in range(3)
+        ]
+        self.issue = helpers.create_issue(
+            self.journal, articles=self.articles)
+
+    def test_issue_push_progress(self):
+        push_queue.queue_push(self.articles[0])
+        job = push_queue.queue_issue_push(self.issue)
+
+        self.assertEqual(job.progress(), {
+            "total": 3, "done": 0, "failed": 0, "remaining": 3})
+        with mock.patch.object(
+            push_queue.logic, "push_articles_to_doaj",
+            return_value={
+                self.articles[1].pk: exceptions.BadRequest("Invalid"),
+                self.articles[2].pk: exceptions.RequestFailed("Timeout"),
+            },
+        ), override_settings(DEBUG=False):
+            push_queue.process_queue()
+        self.assertEqual(
+            job.progress(),
+            {"total": 3, "done": 1, "failed": 1, "remaining": 1},
+        )
+
+    @override_settings(DEBUG=False)
+    def test_later_jobs_do_not_complete_earlier_ones(self):
+        job = push_queue.queue_issue_push(self.issue)
+        claim, claimed_at, queued = push_queue._claim_batch(10)
+        later_job = push_queue.queue_issue_push(self.issue)
+
+        with mock.patch.object(
+            push_queue.logic, "push_articles_to_doaj",
+            return_value={self.articles[0].pk: exceptions.RequestFailed()},
+        ):
+            push_queue._push_batch(claim, claimed_at, queued)
+        self.assertEqual(job.progress(), {
+            "total": 3, "done": 2, "failed": 0, "remaining": 1})
+        # Queued again by the later job, which still waits for its push
+        self.assertEqual(later_job.progress(), {
+            "total": 3, "done": 0, "failed": 0, "remaining": 3})
+
+    @override_settings(DEBUG=False)
+    def test_later_jobs_do_not_fail_with_earlier_pushes(self):
+        job = push_queue.queue_issue_push(self.issue)
+        claim, claimed_at, queued = push_queue._claim_batch(10)
+        later_job = push_queue.queue_issue_push(self.issue)
+
+        with mock.patch.object(
+            push_queue.logic, "push_articles_to_doaj",
+            return_value={self.articles[0].pk: exceptions.BadRequest()},
+        ):
+            push_queue._push_batch(claim, claimed_at, queued)
+        self.assertEqual(job.progress(), {
+            "total": 3, "done": 2, "failed": 1, "remaining": 0})
+        self.assertEqual(later_job.progress(), {
+            "total": 3, "done": 0, "failed": 0, "remaining": 3})
+
+
+@override_settings(DOAJ_PUSH_QUEUE_THREAD=False, DEBUG=False)
+class TestPushQueue(TestCase):
+    def setUp(self):
+        helpers.create_press()
+        self.journal, _ = helpers.create_journals()
+        self.articles = [
+            Article.objects.create(
+                journal=self.journal,
+                title="Queued article %d" % i,
+                stage=STAGE_PUBLISHED,
+                date_published=timezone.now(),
+            )
+            for i in range(3)
+        ]
+
+    def test_duplicate_pushes_are_coalesced(self):
+        push_queue.queue_push(self.articles[0])
+        models.QueuedPush.objects.update(attempts=3, failed=True)
+        push_queue.queue_push(self.articles[0])
+        push_queue.queue_pushes([self.articles[0].pk, self.articles[0].pk])
+
+        queued_push = models.QueuedPush.objects.get()
+        self.assertEqual(queued_push.attempts, 0)
+        self.assertFalse(queued_push.failed)
+
+    def test_claimed_pushes_are_not_claimed_again_until_expired(self):
+        push_queue.queue_pushes(article.pk for article in self.articles)
+        claim, _, queued = push_queue._claim_batch(2)
+        self.assertEqual(len(queued), 2)
+        _, _, others = push_queue._claim_batch(10)
+        self.assertEqual(len(others), 1)
+        self.assertEqual(push_queue._claim_batch(10)[2], [])
+
+        models.QueuedPush.objects.filter(claim=claim).update(
+            claimed_until=timezone.now() - timedelta(seconds=1))
+        _, _, expired = push_queue._claim_batch(10)
+        self.assertEqual(
+            {queued_push.pk for queued_push in expired},
+            {queued_push.pk for queued_push in queued},
+        )
+
+    def test_pushes_queued_during_a_batch_are_kept(self):
+        push_queue.queue_pushes(article.pk for article in self.articles)
+        claim, claimed_at, queued = push_queue._claim_batch(10)
+
+        def push(articles, **kwargs):
+            push_queue.queue_push(self.articles[0])
+            return {}
+
+        with mock.patch.object(
+            push_queue.logic, "push_articles_to_doaj", side_effect=push,
+        ):
+            self.assertEqual(
+                push_queue._push_batch(claim, claimed_at, queued), (3, 0))
+        queued_push = models.QueuedPush.objects.get()
+        self.assertEqual(queued_push.article, self.articles[0])
+        self.assertIsNone(queued_push.claim)
+
+    @override_settings(DEBUG=True)
+    def test_queue_is_kept_when_pushes_are_disabled(self):
+        push_queue.queue_pushes(article.pk for article in self.articles)
+        with mock.patch.object(
+            push_queue.logic, "push_articles_to_doaj", return_value={},
+        ) as push:
+            self.assertEqual(push_queue.process_queue(), (0, 0))
+        push.assert_not_called()
+        self.assertEqual(models.QueuedPush.objects.count(), 3)
+
+
+class TestRetryPolicy(SimpleTestCase):
+    def test_transient_errors(self):
+        for status_code in (429, 500, 502, 503):
+            self.assertTrue(push_queue.is_transient(requests.HTTPError(
+                response=mock.Mock(status_code=status_code))))
+        self.assertTrue(push_queue.is_transient(requests.HTTPError()))
+        self.assertTrue(push_queue.is_transient(exceptions.RequestFailed()))
+        self.assertTrue(push_queue.is_transient(exceptions.MissingResult()))
+
+    def test_permanent_errors(self):
+        self.assertFalse(push_queue.is_transient(requests.HTTPError(
+            response=mock.Mock(status_code=404))))
+        self.assertFalse(push_queue.is_transient(exceptions.BadRequest()))
+        self.assertFalse(
+            push_queue.is_transient(exceptions.InvalidDOAJToken()))
+        self.assertFalse(
+            push_queue.is_transient(exceptions.ImmutableFieldChanged()))
+
+    def test_retry_delay_doubles_up_to_the_max(self):
+        base = push_queue.RETRY_BASE_DELAY
+        with mock.patch.object(push_queue.random, "random", return_value=1):
+            self.assertEqual(push_queue.retry_delay(1), base)
+            self.assertEqual(push_queue.retry_delay(3), base * 4)
+            self.assertEqual(
+                push_queue.retry_delay(100), push_queue.RETRY_MAX_DELAY)
+        with mock.patch.object(push_queue.random, "random", return_value=0):
+            self.assertEqual(push_queue.retry_delay(3), base * 2)
+
+
+class TestRecordFailure(TestCase):
+    def setUp(self):
+        helpers.create_press()
+        self.journal, _ = helpers.create_journals()
+        article = Article.objects.create(
+            journal=self.journal,
+            title="Failed article",
+            stage=STAGE_PUBLISHED,
+            date_published=timezone.now(),
+        )
+        self.queued_push = models.QueuedPush.objects.create(
+            article=article, claim="claim", claimed_until=timezone.now())
+
+    def test_transient_errors_are_retried_later(self):
+        push_queue._record_failure(
+            self.queued_push, exceptions.RequestFailed("DOAJ unreachable"))
+        self.queued_push.refresh_from_db()
+        self.assertEqual(self.queued_push.attempts, 1)
+        self.assertFalse(self.queued_push.failed)
+        self.assertGreater(self.queued_push.next_attempt, timezone.now())
+        self.assertIsNone(self.queued_push.claim)
+        self.assertEqual(
+            self.queued_push.last_error, "RequestFailed: DOAJ unreachable")
+
+    def test_permanent_errors_are_not_retried(self):
+        push_queue._record_failure(
+            self.queued_push, exceptions.BadRequest("Invalid record"))
+        self.queued_push.refresh_from_db()
+        self.assertEqual(self.queued_push.attempts, 1)
+        self.assertTrue(self.queued_push.failed)
+
+    def test_pushes_fail_after_max_attempts(self):
+        self.queued_push.attempts = push_queue.MAX_ATTEMPTS - 2
+        self.queued_push.save()
+        push_queue._record_failure(
+            self.queued_push, exceptions.RequestFailed())
+        self.queued_push.refresh_from_db()
+        self.assertFalse(self.queued_push.failed)
+
+        push_queue._record_failure(
+            self.queued_push, exceptions.RequestFailed())
+        self.queued_push.refresh_from_db()
+        self.assertEqual(self.queued_push.attempts, push_queue.MAX_ATTEMPTS)
+        self.assertTrue(self.queued_push.failed)
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from submission.models import Article
+from utils.testing import helpers
+
+from plugins.doaj_transporter import models, retention
+
+
+class TestCompactDeposits(TestCase):
+    def setUp(self):
+        helpers.create_press()
+        self.journal, _ = helpers.create_journals()
+        self.article = Article.objects.create(
+            journal=self.journal, title="A busy article")
+        now = timezone.now()
+        for days in (0, 1, 100, 101, 102):
+            models.DOAJDeposit.objects.create(
+                article=self.article,
+                success=True,
+                result_text="x" * 50,
+                date_time=now - timedelta(days=days),
+            )
+
+    def test_old_deposits_summarised(self):
+        summarised, truncated = retention.compact_deposits(
+            keep=2, max_age_days=90, max_text_length=10)
+
+        self.assertEqual(summarised, 3)
+        deposits = models.DOAJDeposit.objects.filter(
+            article=self.article).order_by("-date_time")
+        self.assertEqual(deposits.count(), 3)
+        self.assertEqual(deposits[2].summary_of, 3)
+        # The summary replaced the long bodies, kept deposits are recent
+        self.assertEqual(truncated, 0)
+
+    def test_latest_deposit_always_kept(self):
+        models.DOAJDeposit.objects.filter(article=self.article).update(
+            date_time=timezone.now() - timedelta(days=200))
+        retention.compact_deposits(keep=0, max_age_days=90)
+        self.assertEqual(
+            models.DOAJDeposit.objects.filter(article=self.article).count(),
+            2,
+        )
@@ -0,0 +1,63 @@
+import json
+
+from django.test import SimpleTestCase
+from marshmallow import ValidationError
+
+from plugins.doaj_transporter import schemas, serializers
+from plugins.doaj_transporter.data_structs import (
+    AuthorStruct,
+    BibjsonStruct,
+    JournalStruct,
+    LazyArticleSearchResult,
+    LicenseStruct,
+    LinkStruct,
+)
+from plugins.doaj_transporter.tests.fixtures import make_page
+
+
+class TestCodec(SimpleTestCase):
+    def test_encoding_identical_to_schema(self):
+        bibjson = BibjsonStruct(
+            title="Té",
+            year=2020,
+            author=[AuthorStruct(name="A"), AuthorStruct(affiliation=None)],
+            journal=JournalStruct(
+                title="J", license=[LicenseStruct(title="CC BY")]),
+            link=[LinkStruct(url="https://example.org")],
+        )
+        record = {"bibjson": bibjson}
+        self.assertEqual(
+            serializers.Codec(schemas.ArticleSchema).dumps(record),
+            schemas.ArticleSchema().dumps(record),
+        )
+
+    def test_decoding_identical_to_schema(self):
+        page = make_page(5)
+        codec = serializers.Codec(schemas.ArticleSearchSchema)
+        decoded = codec.loads(page)
+        expected = schemas.ArticleSearchSchema().loads(page)
+        self.assertEqual(decoded, expected)
+        self.assertEqual(
+            decoded["results"][0].bibjson.doi, "10.1234/article.0")
+
+    def test_invalid_records_fall_back_to_schema(self):
+        codec = serializers.Codec(schemas.ArticleSchema)
+        with self.assertRaises(ValidationError):
+            codec.loads(json.dumps({"bibjson": {"title": 5}}))
+        with self.assertRaises(ValidationError):
+            codec.loads(json.dumps({"unknown": "field"}))
+
+    def test_lazy_results_match_decoded_ones(self):
+        page = make_page(2)
+        raw_results = serializers.get_codec(
+            schemas.LazyArticleSearchSchema).loads(page)["results"]
+        results = serializers.get_codec(
+            schemas.ArticleSearchSchema).loads(page)["results"]
+        result_codec = serializers.get_codec(
+            schemas.ArticleSearchResultSchema)
+        for raw, result in zip(raw_results, results):
+            lazy = LazyArticleSearchResult(raw, result_codec)
+            self.assertEqual(lazy.id, result.id)
+            self.assertEqual(lazy.doi, result.doi)
+            self.assertEqual(lazy.last_updated, result.last_updated)
+            self.assertEqual(lazy.bibjson, result.bibjson)
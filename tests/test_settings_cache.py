@@ -0,0 +1,93 @@
+from core import models as core_models
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from utils import install, setting_handler
+from utils.testing import helpers
+
+from plugins.doaj_transporter import settings_cache
+
+SETTINGS_PATH = "plugins/doaj_transporter/install/settings.json"
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestSettingsCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        helpers.create_press()
+        self.journal, self.other_journal = helpers.create_journals()
+        call_command("load_default_settings")
+        install.update_settings(self.journal, file_path=SETTINGS_PATH)
+
+    def _save(self, name, value, journal=None):
+        setting_handler.save_setting(
+            "plugin", name, journal=journal, value=value)
+
+    def test_token_falls_back_to_the_press(self):
+        self._save("doaj_api_token", "press_token")
+        self.assertEqual(
+            settings_cache.get_api_token(self.journal), "press_token")
+        self._save("doaj_api_token", "journal_token", self.journal)
+        self.assertEqual(
+            settings_cache.get_api_token(self.journal), "journal_token")
+
+    def test_saving_a_setting_invalidates_the_cache(self):
+        self.assertFalse(settings_cache.is_push_enabled(self.journal))
+        self._save("doaj_publish_push", True, self.journal)
+        self.assertTrue(settings_cache.is_push_enabled(self.journal))
+
+        setting_handler.get_setting(
+            "plugin", "doaj_publish_push", journal=self.journal,
+        ).delete()
+        self.assertFalse(settings_cache.is_push_enabled(self.journal))
+
+    def test_push_flag_uses_the_processed_value(self):
+        self._save("doaj_publish_push", "False", self.journal)
+        self.assertFalse(settings_cache.is_push_enabled(self.journal))
+        self.assertEqual(
+            settings_cache.get_push_enabled_journals(
+                [self.journal, self.other_journal]),
+            [],
+        )
+
+        self._save("doaj_publish_push", True, self.journal)
+        self.assertEqual(
+            settings_cache.get_push_enabled_journals(
+                [self.journal, self.other_journal]),
+            [self.journal],
+        )
+
+    def test_clear_cache_moves_to_a_new_version(self):
+        self._save("doaj_api_token", "old_token", self.journal)
+        self.assertEqual(settings_cache.get_api_token(self.journal), "old_token")
+        old_key = settings_cache._cache_key("doaj_api_token", self.journal)
+
+        # Bypasses the signals, the cached value is kept until cleared
+        core_models.SettingValue.objects.filter(
+            setting__name="doaj_api_token", journal=self.journal,
+        ).update(value="new_token")
+        self.assertEqual(settings_cache.get_api_token(self.journal), "old_token")
+
+        settings_cache.clear_cache()
+        self.assertNotEqual(
+            settings_cache._cache_key("doaj_api_token", self.journal), old_key)
+        self.assertEqual(settings_cache.get_api_token(self.journal), "new_token")
+
+    def test_clear_cache_without_a_version(self):
+        cache.delete(settings_cache.VERSION_KEY)
+        settings_cache.clear_cache()
+        self.assertEqual(cache.get(settings_cache.VERSION_KEY), 2)
+        settings_cache.clear_cache()
+        self.assertEqual(cache.get(settings_cache.VERSION_KEY), 3)
+
+    def test_push_enabled_journals_in_a_single_query(self):
+        self._save("doaj_publish_push", True)
+        self._save("doaj_publish_push", "", self.other_journal)
+        with self.assertNumQueries(1):
+            enabled = settings_cache.get_push_enabled_journals(
+                [self.journal, self.other_journal])
+        self.assertEqual(enabled, [self.journal])
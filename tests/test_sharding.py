@@ -0,0 +1,57 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from submission.models import Article, STAGE_PUBLISHED
+from utils.testing import helpers
+
+from plugins.doaj_transporter import sharding, throttling
+
+
+class TestPlanShards(TestCase):
+    def setUp(self):
+        helpers.create_press()
+        self.journal, _ = helpers.create_journals()
+        self.articles = [
+            Article.objects.create(
+                journal=self.journal,
+                title="Sharded article %d" % i,
+                stage=STAGE_PUBLISHED,
+            )
+            for i in range(5)
+        ]
+
+    @mock.patch(
+        "plugins.doaj_transporter.settings_cache.get_api_token",
+        return_value="token",
+    )
+    def test_large_journals_split_by_article_ids(self, _):
+        shards = sharding.plan_shards(
+            "push", [self.journal], processes=2, shard_size=2)
+        pks = [article.pk for article in self.articles]
+        self.assertEqual(
+            [(shard.min_pk, shard.max_pk) for shard in shards],
+            [(pks[0], pks[1]), (pks[2], pks[3]), (pks[4], pks[4])],
+        )
+        # The token rate is split between the processes running at once
+        self.assertEqual({shard.share for shard in shards}, {2})
+
+    @mock.patch(
+        "plugins.doaj_transporter.settings_cache.get_api_token",
+        return_value="",
+    )
+    def test_journals_without_token_skipped(self, _):
+        self.assertEqual(
+            sharding.plan_shards("push", [self.journal], processes=2), [])
+
+
+class TestLimiterShare(SimpleTestCase):
+    def test_share_divides_rate(self):
+        with self.settings(
+            DOAJ_REQUESTS_PER_SECOND=4, DOAJ_REQUESTS_BURST=4,
+        ):
+            throttling.set_limiter_share("shared-token", 2)
+            limiter = throttling.get_limiter("shared-token")
+        self.assertEqual(limiter.rate, 2)
+        self.assertEqual(limiter.capacity, 2)
+        throttling.reset_limiters()
@@ -0,0 +1,177 @@
+from datetime import timedelta
+import threading
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from identifiers import models as id_models
+from submission.models import Article
+from utils.testing import helpers
+
+from plugins.doaj_transporter import clients, models, synch
+
+
+class TestDOIMatching(TestCase):
+    def setUp(self):
+        helpers.create_press()
+        self.journal, _ = helpers.create_journals()
+        self.article = Article.objects.create(
+            journal=self.journal, title="A DOI matching test")
+        id_models.Identifier.objects.create(
+            article=self.article,
+            id_type="doi",
+            identifier="https://doi.org/10.1234/ABC.01",
+        )
+
+    def test_normalise_doi(self):
+        self.assertEqual(
+            synch.normalise_doi(" https://dx.doi.org/10.1234/ABC "),
+            "10.1234/abc",
+        )
+        self.assertEqual(synch.normalise_doi("doi:10.1/X"), "10.1/x")
+        self.assertIsNone(synch.normalise_doi(""))
+
+    def test_index_matches_normalised_dois(self):
+        index = synch.ArticleIndex(self.journal)
+        self.assertEqual(
+            index.article_id_for_doi("10.1234/abc.01"), self.article.pk)
+
+    def test_synch_results_in_batches(self):
+        results = [
+            mock.Mock(doi="10.1234/abc.01", id="doaj_id"),
+            mock.Mock(doi="10.1234/missing", id="other_id"),
+        ]
+        self.assertEqual(synch.synch_results_from_doaj(results), 1)
+        self.assertEqual(synch.synch_results_from_doaj(results), 0)
+        self.assertEqual(self.article.get_identifier("doaj"), "doaj_id")
+
+    def test_doi_variants(self):
+        variants = synch.doi_variants(" https://dx.doi.org/10.1234/Ab ")
+        for spelling in (
+            "10.1234/Ab", "10.1234/ab", "10.1234/AB",
+            "https://doi.org/10.1234/Ab", "doi:10.1234/ab", "DOI:10.1234/AB",
+        ):
+            self.assertIn(spelling, variants)
+        self.assertEqual(synch.doi_variants(""), set())
+
+    def test_results_match_dois_in_any_spelling(self):
+        id_models.Identifier.objects.create(
+            article=self.article,
+            id_type="doi",
+            identifier="DOI:10.1234/Mixed.Case",
+        )
+        results = [mock.Mock(
+            doi="https://dx.doi.org/10.1234/Mixed.Case", id="doaj_id")]
+        index = synch.ArticleIndex.for_results(results)
+        self.assertEqual(
+            index.article_id_for_doi(results[0].doi), self.article.pk)
+
+    def test_normalisation_only_strips_leading_prefixes(self):
+        self.assertEqual(
+            synch.normalise_doi("10.1234/doi:5"), "10.1234/doi:5")
+        self.assertIn("10.1234/doi:5", synch.doi_variants("10.1234/doi:5"))
+
+    def test_synch_result_matches_normalised_doi(self):
+        result = mock.Mock(doi="10.1234/abc.01", id="doaj_id")
+        self.assertTrue(synch.synch_result_from_doaj(result))
+        self.assertEqual(self.article.get_identifier("doaj"), "doaj_id")
+
+
+class TestIncrementalSynch(TestCase):
+    def setUp(self):
+        helpers.create_press()
+        self.journal, _ = helpers.create_journals()
+        self.journal.issn = "1234-5678"
+        self.journal.save()
+        self.since = timezone.now() - timedelta(days=7)
+
+    def test_track_last_updated_raises_the_watermark(self):
+        state = models.DOAJSynchState(journal=self.journal)
+        results = [
+            mock.Mock(last_updated=self.since),
+            mock.Mock(last_updated=self.since + timedelta(days=2)),
+            mock.Mock(last_updated=None),
+            mock.Mock(last_updated=self.since + timedelta(days=1)),
+        ]
+        self.assertEqual(
+            list(synch._track_last_updated(results, state)), results)
+        self.assertEqual(state.last_updated, self.since + timedelta(days=2))
+
+    @mock.patch.object(synch.settings_cache, "get_api_token")
+    @mock.patch.object(clients.ArticleSearchClient, "search_by_eissn")
+    def test_synch_from_doaj_since_watermark(self, search, get_api_token):
+        get_api_token.return_value = "token"
+        models.DOAJSynchState.objects.create(
+            journal=self.journal, last_updated=self.since)
+        updated = self.since + timedelta(days=1)
+        search.return_value = [
+            mock.Mock(doi="10.1234/unknown", id="doaj_id",
+                      last_updated=updated),
+        ]
+
+        synch.synch_all_from_doaj(self.journal)
+
+        search.assert_called_once_with(
+            self.journal.issn,
+            updated_since=self.since - synch.WATERMARK_OVERLAP,
+        )
+        state = models.DOAJSynchState.objects.get(journal=self.journal)
+        self.assertEqual(state.last_updated, updated)
+
+        synch.synch_all_from_doaj(self.journal, incremental=False)
+        self.assertEqual(search.call_args[1]["updated_since"], None)
+
+    @mock.patch.object(synch, "search_doaj_id", return_value="new_id")
+    @mock.patch.object(synch, "synch_all_from_doaj")
+    def test_command_searches_unmatched_articles(self, synch_all, search):
+        models.DOAJSynchState.objects.create(
+            journal=self.journal, last_updated=self.since)
+        matched, unmatched = [
+            Article.objects.create(journal=self.journal, title=title)
+            for title in ("Matched", "Unmatched")
+        ]
+        for i, article in enumerate((matched, unmatched)):
+            id_models.Identifier.objects.create(
+                article=article, id_type="doi", identifier="10.1234/%d" % i)
+        id_models.Identifier.objects.create(
+            article=matched, id_type="doaj", identifier="doaj_id")
+
+        call_command("doaj_synch_ids", self.journal.code, workers=1)
+
+        self.assertTrue(synch_all.call_args[1]["incremental"])
+        self.assertEqual(
+            [call[0][0] for call in search.call_args_list], ["10.1234/1"])
+        self.assertEqual(unmatched.get_identifier("doaj"), "new_id")
+
+    @mock.patch.object(synch.settings_cache, "get_api_token")
+    @mock.patch.object(synch, "search_doaj_id")
+    def test_ids_are_saved_on_the_calling_thread(self, search, get_api_token):
+        get_api_token.return_value = "token"
+        articles = [
+            Article.objects.create(journal=self.journal, title="Article %d" % i)
+            for i in range(3)
+        ]
+        for i, article in enumerate(articles):
+            id_models.Identifier.objects.create(
+                article=article, id_type="doi", identifier="10.1234/%d" % i)
+        caller = threading.get_ident()
+        search.side_effect = lambda doi, token: (
+            None if doi == "10.1234/0" else "doaj_%s" % doi[-1])
+
+        saved_from = []
+        save_doaj_id = synch._save_doaj_id
+
+        def record(*args, **kwargs):
+            saved_from.append(threading.get_ident())
+            return save_doaj_id(*args, **kwargs)
+
+        with mock.patch.object(synch, "_save_doaj_id", side_effect=record):
+            synched = synch.synch_articles_from_janeway(
+                articles, index=synch.ArticleIndex(self.journal), workers=3)
+
+        self.assertEqual(
+            sorted(synched), sorted(article.pk for article in articles))
+        self.assertEqual(saved_from, [caller] * 3)
+        self.assertEqual(articles[2].get_identifier("doaj"), "doaj_2")
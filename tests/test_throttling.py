@@ -0,0 +1,55 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from plugins.doaj_transporter.throttling import (
+    PushExecutor,
+    TokenBucket,
+    parse_retry_after,
+)
+
+
+class TestTokenBucket(SimpleTestCase):
+    def test_burst_then_paced(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        with mock.patch("time.monotonic", return_value=100):
+            bucket._updated = 100
+            self.assertEqual(bucket.reserve(), 0)
+            self.assertEqual(bucket.reserve(), 0)
+            self.assertEqual(bucket.reserve(), 0.5)
+            self.assertEqual(bucket.reserve(), 1)
+
+    def test_pause_holds_back_callers(self):
+        bucket = TokenBucket(rate=10, capacity=10)
+        with mock.patch("time.monotonic", return_value=100):
+            bucket._updated = 100
+            bucket.pause(3)
+            self.assertEqual(bucket.reserve(), 3)
+            # Callers queued during the pause resume spread out
+            self.assertAlmostEqual(bucket.reserve(), 3.1)
+            self.assertAlmostEqual(bucket.reserve(), 3.2)
+        with mock.patch("time.monotonic", return_value=102):
+            self.assertAlmostEqual(bucket.reserve(), 1.3)
+
+    def test_parse_retry_after(self):
+        response = mock.Mock(headers={"Retry-After": "7"})
+        self.assertEqual(parse_retry_after(response), 7)
+        response = mock.Mock(headers={})
+        self.assertEqual(parse_retry_after(response), 1)
+
+
+class TestPushExecutor(SimpleTestCase):
+    def test_map_collects_results_and_errors(self):
+        def func(item):
+            if item == 3:
+                raise ValueError(item)
+            return item * 2
+
+        with mock.patch("django.db.connections.close_all"):
+            results = {
+                item: (result, error)
+                for item, result, error in PushExecutor(3).map(func, range(5))
+            }
+        self.assertEqual(results[2], (4, None))
+        self.assertIsInstance(results[3][1], ValueError)
+        self.assertEqual(len(results), 5)
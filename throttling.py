@@ -0,0 +1,197 @@
+"""
+Rate limiting and concurrent execution of requests to the DOAJ API
+
+All requests made with the same API token share a token bucket, so the
+throughput of every worker thread combined follows the DOAJ rate limit.
+The defaults can be overridden from the django settings:
+    - DOAJ_REQUESTS_PER_SECOND: Sustained request rate per API token
+    - DOAJ_REQUESTS_BURST: Requests that can be made in a burst
+    - DOAJ_PUSH_WORKERS: Number of worker threads used for concurrent pushes
+"""
+import queue
+import threading
+import time
+import traceback as tb
+
+from django import db
+from django.conf import settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+REQUESTS_PER_SECOND = 2
+REQUESTS_BURST = 5
+PUSH_WORKERS = 4
+DEFAULT_RETRY_AFTER_SECS = 1
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class TokenBucket(object):
+    """ A thread-safe token bucket
+
+    Each request consumes a token. Tokens are refilled at `rate` per second
+    up to `capacity`. Callers that find the bucket empty are told how long
+    to wait for their token, so the bucket can pace both threads (acquire)
+    and coroutines (reserve).
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        # Tokens are refilled from this time on, later than now when paused
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self._updated:
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated) * self.rate,
+            )
+            self._updated = now
+
+    def reserve(self):
+        """ Consumes a token
+        :return: The seconds to wait before the token can be used
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            # Wait for the end of any pause, then for the tokens owed
+            delay = self._updated - now
+            if self._tokens < 0:
+                delay += -self._tokens / self.rate
+            return delay
+
+    def acquire(self):
+        """ Blocks the calling thread until a token is available"""
+        delay = self.reserve()
+        if delay > 0:
+            logger.debug("Rate limited, thread sleeping for %.2fs", delay)
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """ Holds back all callers for the given seconds (e.g: Retry-After)
+        No tokens are refilled during the pause. Once over, a single caller
+        goes at once and the others follow at the rate of the bucket
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, 1)
+            self._updated = max(self._updated, now + seconds)
+
+
+def get_limiter(api_token):
+    """ Returns the token bucket shared by all requests using api_token"""
+    try:
+        return _limiters[api_token]
+    except KeyError:
+        with _limiters_lock:
+            if api_token not in _limiters:
+                _limiters[api_token] = _build_limiter()
+            return _limiters[api_token]
+
+
+def set_limiter_share(api_token, share):
+    """ Limits this process to a share of the rate allowed for api_token
+    For when the requests made with a token are spread over processes, which
+    can't share a token bucket
+    :param share: Number of processes using the token at the same time
+    """
+    with _limiters_lock:
+        _limiters[api_token] = _build_limiter(share)
+
+
+def reset_limiters():
+    """ Drops the limiters inherited from a parent process"""
+    global _limiters_lock
+    _limiters_lock = threading.Lock()
+    _limiters.clear()
+
+
+def _build_limiter(share=1):
+    rate = getattr(settings, "DOAJ_REQUESTS_PER_SECOND", REQUESTS_PER_SECOND)
+    burst = getattr(settings, "DOAJ_REQUESTS_BURST", REQUESTS_BURST)
+    return TokenBucket(float(rate) / share, max(float(burst) / share, 1))
+
+
+def parse_retry_after(response):
+    """ Reads the seconds to wait from the Retry-After header of a response
+    Only the delta-seconds form is supported, HTTP dates fall back to the
+    default delay
+    """
+    try:
+        return max(float(response.headers["Retry-After"]), 0)
+    except (KeyError, TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER_SECS
+
+
+class PushExecutor(object):
+    """ Runs a function over many items on a pool of worker threads
+
+    Workers get their own requests session (see clients.session) and their
+    own database connection, which is closed when the worker exits. Requests
+    are paced by the per-token rate limiter, so workers never need to sleep.
+    """
+    _STOP = object()
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = getattr(settings, "DOAJ_PUSH_WORKERS", PUSH_WORKERS)
+        self.workers = max(int(workers), 1)
+
+    def map(self, func, items):
+        """ Calls func for every item
+        :param func: A callable taking a single item
+        :param items: An iterable of items
+        :return: A generator of (item, result, error) tuples in completion
+            order. error is None when the call succeeded
+        """
+        items = list(items)
+        workers = min(self.workers, len(items))
+        if workers < 2:
+            for item in items:
+                yield self._call(func, item)
+            return
+
+        pending = queue.Queue()
+        done = queue.Queue()
+        for item in items:
+            pending.put(item)
+        for _ in range(workers):
+            pending.put(self._STOP)
+
+        threads = [
+            threading.Thread(
+                target=self._work, args=(func, pending, done), daemon=True)
+            for _ in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for _ in items:
+            yield done.get()
+        for thread in threads:
+            thread.join()
+
+    def _work(self, func, pending, done):
+        try:
+            while True:
+                item = pending.get()
+                if item is self._STOP:
+                    break
+                done.put(self._call(func, item))
+        finally:
+            db.connections.close_all()
+
+    @staticmethod
+    def _call(func, item):
+        try:
+            return item, func(item), None
+        except Exception as e:
+            logger.error("[DOAJ] Error processing %s", item)
+            tb.print_exc()
+            return item, None, e
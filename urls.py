@@ -9,4 +9,5 @@ urlpatterns = [
     re_path(r'article/(?P<article_id>\d+)/json$', views.article_json, name="doaj_article_json"),
     re_path(r'^push/issue$', views.push_issue, name='doaj_push_issue'),
     re_path(r'^push/article$', views.push_article, name='doaj_push_article'),
+    re_path(r'^push/job/(?P<job_id>\d+)$', views.push_job, name='doaj_push_job'),
 ]
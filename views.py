@@ -1,7 +1,7 @@
-from django.db.models import Count
+from django.db.models import Count, Q
 from django.contrib import messages
 from django.urls import reverse
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_POST
 from django.shortcuts import get_object_or_404, render, redirect
 
@@ -12,57 +12,70 @@ from security.decorators import editor_user_required
 from utils import setting_handler
 from utils.logger import get_logger
 
-from plugins.doaj_transporter import logic, plugin_settings, models
+from plugins.doaj_transporter import (
+    logic,
+    models,
+    plugin_settings,
+    push_queue,
+    settings_cache,
+)
 
 logger = get_logger(__name__)
 
 
 @editor_user_required
 def index(request):
-    token = setting_handler.get_setting(
-        "plugin", "doaj_api_token", journal=request.journal).value
+    token = settings_cache.get_api_token(request.journal)
 
     articles = sm_models.Article.objects.filter(
         stage=sm_models.STAGE_PUBLISHED)
     if request.journal:
         articles = articles.filter(journal=request.journal)
-        push_enabled = 'On' if setting_handler.get_setting(
-            "plugin", "doaj_publish_push",
-            journal=request.journal,
-        ).value else "Off"
+        push_enabled = 'On' if settings_cache.is_push_enabled(
+            request.journal) else "Off"
     else:
-        total = 0
-        enabled = 0
-        for journal in request.press.journals():
-            journal_enabled = setting_handler.get_setting(
-                "plugin", "doaj_publish_push", journal=journal).value
-            if journal_enabled:
-                enabled += 1
-            total += 1
-        push_enabled = "%d/%d" % (enabled, total)
-    in_doaj = "%d/%d" % (
-        articles.filter(identifier__id_type="doaj").count(), articles.count())
+        journals = list(request.press.journals())
+        push_enabled = "%d/%d" % (
+            len(settings_cache.get_push_enabled_journals(journals)),
+            len(journals),
+        )
+    counts = articles.aggregate(
+        total=Count("pk", distinct=True),
+        in_doaj=Count(
+            "pk",
+            filter=Q(identifier__id_type="doaj"),
+            distinct=True,
+        ),
+    )
+    in_doaj = "%d/%d" % (counts["in_doaj"], counts["total"])
 
     issues = []
     if request.journal:
-        issues = journal_models.Issue.objects.filter(
-            issue_type__code="issue",
-            journal=request.journal,
+        published = Q(
+            articles__stage=sm_models.STAGE_PUBLISHED,
+            articles__date_published__isnull=False,
         )
-        issues_with_doaj_ids = journal_models.Issue.objects.filter(
+        issues = list(journal_models.Issue.objects.filter(
             issue_type__code="issue",
             journal=request.journal,
-            articles__stage=sm_models.STAGE_PUBLISHED,
-            articles__date_published__isnull=False,
-            articles__identifier__id_type="doaj",
         ).annotate(
-            count_doaj=Count("articles__identifier"),
-        )
-
-        # MSL: This trickery is done to  force a LEFT OUTER JOIN on articles
-        issues = issues_with_doaj_ids | issues.exclude(
-            pk__in=issues_with_doaj_ids)
-
+            count_articles=Count("articles", filter=published, distinct=True),
+            count_doaj=Count(
+                "articles",
+                filter=published & Q(articles__identifier__id_type="doaj"),
+                distinct=True,
+            ),
+        ))
+
+        # The latest push of each issue still in progress
+        push_jobs = {
+            job.issue_id: job for job in models.PushJob.objects.filter(
+                issue__journal=request.journal,
+                pushjobarticle__status=models.PushJobArticle.PENDING,
+            ).distinct().order_by("date_created")
+        }
+        for issue in issues:
+            issue.push_job = push_jobs.get(issue.pk)
 
     template = 'doaj_transporter/index.html'
     context = {
@@ -82,20 +95,12 @@ def configure(request):
     journals = {}
     push_enabled = False
     if request.journal:
-        push_enabled = setting_handler.get_setting(
-            "plugin", "doaj_publish_push", journal=request.journal,
-                default=False,
-        )
+        push_enabled = settings_cache.is_push_enabled(request.journal)
     else:
-        for journal in request.press.journals():
-            enabled = setting_handler.get_setting(
-                "plugin", "doaj_publish_push", journal=journal,
-                default=False,
-            )
-            if enabled:
-                journals[journal] = True
-            else:
-                journals[journal] = False
+        all_journals = list(request.press.journals())
+        enabled = set(settings_cache.get_push_enabled_journals(all_journals))
+        for journal in all_journals:
+            journals[journal] = journal in enabled
 
 
     if token.journal == request.journal:
@@ -167,20 +172,27 @@ def push_issue(request):
         id=issue_id,
         journal=request.journal,
     )
-    errors = logic.push_issue_to_doaj(issue, raise_on_error=False)
-    if errors:
-        messages.add_message(
-            request, messages.ERROR,
-            "Failed to push %d articles" % len(errors),
-        )
-    else:
-        messages.add_message(
-            request, messages.SUCCESS,
-            "%s articles pushed to DOAJ" % issue.articles.count(),
-        )
+    # Articles are pushed in the background, progress is shown on the index
+    job = push_queue.queue_issue_push(issue, requested_by=request.user)
+    messages.add_message(
+        request, messages.SUCCESS,
+        "Pushing %s articles to DOAJ" % job.total,
+    )
     return redirect(request.META.get("HTTP_REFERER"))
 
 
+@editor_user_required
+def push_job(request, job_id):
+    job = get_object_or_404(models.PushJob,
+        id=job_id,
+        issue__journal=request.journal,
+    )
+    progress = job.progress()
+    # The queue is not processed while pushes are disabled (see push_queue)
+    progress["enabled"] = logic.check_debug_settings()
+    return JsonResponse(progress)
+
+
 @require_POST
 @editor_user_required
 def push_article(request):
@@ -190,7 +202,8 @@ def push_article(request):
         journal=request.journal,
     )
     try:
-        logic.push_article_to_doaj(article)
+        # Explicit pushes from the manager go through even if unchanged
+        logic.push_article_to_doaj(article, force=True)
     except Exception as e:
         messages.add_message(
             request, messages.ERROR,
@@ -209,7 +222,7 @@ def push_article(request):
 
 @editor_user_required
 def list_issue(request, issue_id=None):
-    articles = models.Article.objects.filter(
+    articles = models.Article.objects.with_latest_deposit().filter(
         issues__id=issue_id,
         journal=request.journal
     ).order_by(